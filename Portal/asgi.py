@@ -3,6 +3,10 @@ ASGI config for Portal project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The device API endpoints are async, so serve them with uvicorn:
+
+    uvicorn Portal.asgi:application --host 0.0.0.0 --port 8000
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -163,6 +163,103 @@ PASSWORD_RESET_TIMEOUT = 4017
 # Custom encryption key
 ENCRYPT_KEY = os.environ.get('RITO_ENCRYPT_KEY', 'a-default-insecure-key-for-dev-only')
 
+# ========== DEVICE TELEMETRY ==========
+
+# Seconds between write-behind flushes of Device.last_seen (0 writes through on every ping)
+RITO_LAST_SEEN_FLUSH_INTERVAL = float(os.environ.get('RITO_LAST_SEEN_FLUSH_INTERVAL', 5))
+
+# In-process ieda -> device/account/owner cache (entries, seconds)
+RITO_IDENTITY_CACHE_SIZE = int(os.environ.get('RITO_IDENTITY_CACHE_SIZE', 10000))
+RITO_IDENTITY_CACHE_TTL = float(os.environ.get('RITO_IDENTITY_CACHE_TTL', 300))
+
+# Offline IP geolocation: CSV of start_ip,end_ip,country,city,latitude,longitude.
+# When the file is missing, lookups fall back to ipapi.co.
+RITO_GEOIP_DATABASE = os.environ.get('RITO_GEOIP_DATABASE', str(BASE_DIR / 'geoip' / 'ip_ranges.csv'))
+RITO_GEOIP_CHECK_INTERVAL = float(os.environ.get('RITO_GEOIP_CHECK_INTERVAL', 60))
+
+# Geolocation result cache (seconds a result stays valid, in-memory entries per process)
+RITO_GEO_CACHE_TTL = float(os.environ.get('RITO_GEO_CACHE_TTL', 86400))
+RITO_GEO_CACHE_MEMORY_SIZE = int(os.environ.get('RITO_GEO_CACHE_MEMORY_SIZE', 50000))
+
+# Background geolocation: max queued devices, resolver threads, seconds between
+# batched write-backs (0 resolves inline)
+RITO_GEO_QUEUE_SIZE = int(os.environ.get('RITO_GEO_QUEUE_SIZE', 10000))
+RITO_GEO_QUEUE_WORKERS = int(os.environ.get('RITO_GEO_QUEUE_WORKERS', 4))
+RITO_GEO_QUEUE_FLUSH_INTERVAL = float(os.environ.get('RITO_GEO_QUEUE_FLUSH_INTERVAL', 2))
+
+# Seconds between batched inserts of device location history (0 writes through)
+RITO_LOCATION_HISTORY_FLUSH_INTERVAL = float(os.environ.get('RITO_LOCATION_HISTORY_FLUSH_INTERVAL', 5))
+
+# Device pairing codes: seconds a code stays valid, codes a device may request
+# per reissue window (seconds), seconds a process trusts its in-memory copy
+RITO_REGISTRATION_CODE_TTL = float(os.environ.get('RITO_REGISTRATION_CODE_TTL', 900))
+RITO_REGISTRATION_CODE_REISSUE_LIMIT = int(os.environ.get('RITO_REGISTRATION_CODE_REISSUE_LIMIT', 10))
+RITO_REGISTRATION_CODE_REISSUE_WINDOW = float(os.environ.get('RITO_REGISTRATION_CODE_REISSUE_WINDOW', 3600))
+RITO_REGISTRATION_CODE_CACHE_TTL = float(os.environ.get('RITO_REGISTRATION_CODE_CACHE_TTL', 30))
+
+# Seconds without a heartbeat after which a device counts as stale
+RITO_DEVICE_STALE_AFTER = float(os.environ.get('RITO_DEVICE_STALE_AFTER', 300))
+
+# Presence tracking: seconds of silence before a stale device counts as offline,
+# seconds between presence sweeps (0 sweeps on read), seconds between fleet total recounts
+RITO_DEVICE_OFFLINE_AFTER = float(os.environ.get('RITO_DEVICE_OFFLINE_AFTER', 3600))
+RITO_PRESENCE_SWEEP_INTERVAL = float(os.environ.get('RITO_PRESENCE_SWEEP_INTERVAL', 5))
+RITO_PRESENCE_TOTAL_REFRESH = float(os.environ.get('RITO_PRESENCE_TOTAL_REFRESH', 300))
+
+# Seconds between merges of Device.last_seen into a process's presence sets (picks up heartbeats
+# handled by other workers; keep it well below RITO_DEVICE_STALE_AFTER)
+RITO_PRESENCE_RESYNC_INTERVAL = float(os.environ.get('RITO_PRESENCE_RESYNC_INTERVAL', 60))
+
+# Seconds between batched write-backs of question view counts (0 writes through)
+RITO_VIEW_COUNT_FLUSH_INTERVAL = float(os.environ.get('RITO_VIEW_COUNT_FLUSH_INTERVAL', 5))
+
+# Seconds between full reloads of the community autocomplete index (topics, question titles,
+# members). Signals keep it current in between; reloads catch up on popularity and on changes
+# made by other worker processes.
+RITO_AUTOCOMPLETE_REBUILD_INTERVAL = float(os.environ.get('RITO_AUTOCOMPLETE_REBUILD_INTERVAL', 3600))
+
+# Seconds after which a question's or answer's weight in the trending topics has halved.
+# Run "manage.py rebalance_trending_topics" periodically (e.g. hourly) and after changing it.
+RITO_TRENDING_HALF_LIFE = float(os.environ.get('RITO_TRENDING_HALF_LIFE', 3 * 86400))
+
+# Seconds a coalesced device status lookup is reused for identical requests (0 only coalesces
+# requests that arrive while the lookup is running)
+RITO_COALESCE_FRESH_FOR = float(os.environ.get('RITO_COALESCE_FRESH_FOR', 1))
+
+# Seconds a device status version stamp (ETag/Last-Modified of GET /api/device/{ieda}/status)
+# lives in the Django cache. Without a cache shared by all workers this bounds how long
+# another process may still answer 304 after a change.
+RITO_STATUS_VERSION_TTL = int(os.environ.get('RITO_STATUS_VERSION_TTL', 300))
+
+# Device API tokens (DRF Token from /api/auth/login, sent as "Authorization: Bearer <key>").
+# Device routes require a token; RITO_DEVICE_AUTH_REQUIRED=False is a legacy opt-in for firmware
+# that cannot send one, under which requests without a token pass and the body username is trusted.
+# Token lookups are cached per process (entries, seconds a revoked token may still pass elsewhere,
+# seconds a rejected token is answered from the cache).
+RITO_DEVICE_AUTH_REQUIRED = os.environ.get('RITO_DEVICE_AUTH_REQUIRED', 'True').lower() in ('1', 'true', 'yes')
+RITO_TOKEN_CACHE_SIZE = int(os.environ.get('RITO_TOKEN_CACHE_SIZE', 10000))
+RITO_TOKEN_CACHE_TTL = float(os.environ.get('RITO_TOKEN_CACHE_TTL', 300))
+RITO_TOKEN_NEGATIVE_CACHE_TTL = float(os.environ.get('RITO_TOKEN_NEGATIVE_CACHE_TTL', 30))
+
+# Device API rate limits (token buckets, "count/period" with period s, min, hour or day).
+# Each route scope may limit per device IEDA and per client IP; throttled requests get 429
+# with Retry-After. Backend "memory" limits each process separately; "sqlite" shares the
+# buckets between all worker processes on the host through RITO_RATE_LIMIT_DATABASE.
+RITO_RATE_LIMIT_BACKEND = os.environ.get('RITO_RATE_LIMIT_BACKEND', 'memory')
+RITO_RATE_LIMIT_DATABASE = os.environ.get('RITO_RATE_LIMIT_DATABASE', str(BASE_DIR / 'ratelimit.sqlite3'))
+RITO_RATE_LIMITS = {
+    'device_register': {'ieda': '6/min', 'ip': '60/min'},
+    'device_refresh_code': {'ieda': '6/min', 'ip': '60/min'},
+    'device_status': {'ieda': '120/min', 'ip': '1200/min'},
+    'device_status_batch': {'ip': '120/min'},
+    'device_location': {'ieda': '60/min', 'ip': '600/min'},
+}
+
+# Rito ID allocator worker id (0-1023). When set it must be unique among all processes that
+# allocate IDs (server workers, management commands, every host); leave unset to lease a free
+# one from the database (USER_ritoworkerlease) per process.
+RITO_WORKER_ID = int(os.environ['RITO_WORKER_ID']) if os.environ.get('RITO_WORKER_ID') else None
+
 # ========== UNFOLD ADMIN THEME CONFIGURATION ==========
 
 UNFOLD = {
@@ -443,7 +540,7 @@ UNFOLD = {
                     "title": "Registered Devices",
                     "icon": "phone_iphone",
                     "link": reverse_lazy("admin:main_device_changelist"),
-                    "badge": lambda: Device.objects.filter(is_active=True).count(),
+                    "badge": "USER.presence.presence_badge",
                     "badge_color": "green",
                 },
                 {
@@ -3,7 +3,9 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.admin import GroupAdmin as BaseGroupAdmin
 from django.contrib.auth.models import User, Group
 from unfold.admin import ModelAdmin
-from unfold.decorators import display
+from unfold.decorators import action, display
+from django.contrib import messages
+from django.shortcuts import redirect, render
 from django.utils.html import format_html
 from django.urls import reverse
 
@@ -13,6 +15,8 @@ from .models import (
     Subscriber, CommunityMember, Topic, Question, Answer, 
     Comment, Space, SpaceQuestion, Notification, Bookmark
 )
+from .forms import DeviceProvisioningForm
+from .provisioning import ProvisioningError, provision_upload
 
 # Unregister default models
 admin.site.unregister(User)
@@ -39,10 +43,33 @@ class DeviceAdmin(ModelAdmin):
     list_filter = ["is_active", "registered_at"]
     search_fields = ["ieda", "mac_address"]
     readonly_fields = ["registered_at"]
+    actions_list = ["provision_devices"]
     
     @display(description="IEDA")
     def ieda_short(self, obj):
         return f"{obj.ieda[:12]}..." if len(obj.ieda) > 12 else obj.ieda
+    
+    @action(description="Provision devices", url_path="provision", permissions=["add"])
+    def provision_devices(self, request):
+        """Bulk import devices and accounts from an uploaded CSV/JSONL file"""
+        form = DeviceProvisioningForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            try:
+                report = provision_upload(form.cleaned_data["file"], form.cleaned_data["chunk_size"])
+            except (ProvisioningError, UnicodeDecodeError) as e:
+                messages.error(request, f"Provisioning failed: {e}")
+            else:
+                messages.success(request, report.summary())
+                for error in report.errors[:10]:
+                    messages.warning(request, error)
+            return redirect(reverse("admin:USER_device_changelist"))
+        
+        return render(request, "admin/USER/device/provision_devices.html", {
+            **self.admin_site.each_context(request),
+            "form": form,
+            "opts": self.model._meta,
+            "title": "Provision devices",
+        })
 
 @admin.register(RitoAccount)
 class RitoAccountAdmin(ModelAdmin):
@@ -122,10 +149,10 @@ class TopicAdmin(ModelAdmin):
 
 @admin.register(Question)
 class QuestionAdmin(ModelAdmin):
-    list_display = ["title_short", "author_link", "views", "is_active", "created_at"]
+    list_display = ["title_short", "author_link", "views", "score", "is_active", "created_at"]
     list_filter = ["is_active", "is_anonymous", "created_at", "topics"]
     search_fields = ["title", "content", "author__name"]
-    readonly_fields = ["slug", "created_at", "updated_at"]
+    readonly_fields = ["slug", "created_at", "updated_at", "upvote_count", "downvote_count", "score"]
     list_editable = ["is_active"]
     filter_horizontal = ["topics"]
     
@@ -140,10 +167,10 @@ class QuestionAdmin(ModelAdmin):
 
 @admin.register(Answer)
 class AnswerAdmin(ModelAdmin):
-    list_display = ["question_short", "author_link", "is_accepted", "is_active", "created_at"]
+    list_display = ["question_short", "author_link", "score", "is_accepted", "is_active", "created_at"]
     list_filter = ["is_active", "is_accepted", "is_anonymous", "created_at"]
     search_fields = ["content", "question__title", "author__name"]
-    readonly_fields = ["created_at", "updated_at"]
+    readonly_fields = ["created_at", "updated_at", "upvote_count", "downvote_count", "score"]
     list_editable = ["is_active", "is_accepted"]
     
     @display(description="Question")
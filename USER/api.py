@@ -1,10 +1,17 @@
 # main/api.py
 from ninja import NinjaAPI, Schema
+from ninja.errors import Throttled
+from ninja.security import django_auth, django_auth_is_staff
 from django.shortcuts import get_object_or_404
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from typing import Optional, Dict, Any, List
-from django.http import HttpRequest
+from django.http import HttpRequest, HttpResponse, Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.core.handlers.asgi import ASGIRequest
+from datetime import datetime, timedelta
 import uuid
+from functools import partial
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
@@ -12,7 +19,24 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
 from .models import Device, RitoAccount, SocialMediaAccount, generate_rito_id
-from .utils import generate_registration_code, update_device_location, generate_username
+from .utils import generate_username, LOCATION_FIELDS
+from .buffers import last_seen_buffer
+from .identity import device_identity_cache
+from .geocache import geo_cache
+from .geoip import geoip_database
+from .geoqueue import geo_queue
+from .history import device_track, location_history
+from .spatial import devices_in_bbox, devices_near
+from .registration import registration_codes, RegistrationCodeError
+from .fleet import list_devices
+from .exports import EXPORT_FORMATS, aiter_blocks, export_devices
+from .presence import device_presence, ONLINE, STALE, OFFLINE
+from .auth import DeviceTokenAuth, AsyncDeviceTokenAuth, device_auth, bearer_username, may_read_device
+from .ratelimit import rate_limiter
+from .coalesce import device_requests
+from .versions import device_status_versions
+from .autocomplete import community_autocomplete, MAX_SUGGESTIONS
+from django.conf import settings
 from django.utils import timezone
 
 # Create API instance with CSRF disabled
@@ -23,6 +47,14 @@ api = NinjaAPI(
     csrf=False  # Disable CSRF protection for API
 )
 
+@api.exception_handler(Throttled)
+def rate_limited(request, exc):
+    """429 in the API's error format, with Retry-After"""
+    response = api.create_response(request, {"status": "error", "message": "Too many requests"}, status=429)
+    if exc.wait:
+        response["Retry-After"] = str(exc.wait)
+    return response
+
 # --- Schemas ---
 class LoginSchema(Schema):
     username: str
@@ -89,6 +121,122 @@ class UserDevicesSchema(Schema):
     device_count: int
     message: str
 
+class DeviceStatusBatchSchema(Schema):
+    devices: List[DeviceStatusSchema]
+
+class DeviceStatusItemSchema(Schema):
+    ieda: str
+    status: str
+    rito_id: Optional[str] = None
+    username: Optional[str] = None
+    registration_code: Optional[str] = None
+    registered: Optional[bool] = None
+    registered_to_user: Optional[bool] = None
+    is_active: Optional[bool] = None
+    last_seen: Optional[str] = None
+    message: Optional[str] = None
+
+class DeviceStatusBatchResultSchema(Schema):
+    status: str
+    devices: List[DeviceStatusItemSchema]
+    device_count: int
+    message: str
+
+class GeoCacheStatsSchema(Schema):
+    status: str
+    cache: Dict[str, Any]
+    database: Dict[str, Any]
+    queue: Dict[str, Any]
+
+class RateLimitStatsSchema(Schema):
+    status: str
+    backend: str
+    buckets: int
+    routes: Dict[str, Dict[str, int]]
+
+class AutocompleteItemSchema(Schema):
+    id: str
+    label: str
+    url: str
+
+class AutocompleteSchema(Schema):
+    status: str
+    query: str
+    results: Dict[str, List[AutocompleteItemSchema]]
+
+class LocationPointSchema(Schema):
+    latitude: float
+    longitude: float
+    recorded_at: str
+    samples: int
+
+class DeviceTrackSchema(Schema):
+    status: str
+    ieda: str
+    start: str
+    end: str
+    points: List[LocationPointSchema]
+    point_count: int
+    raw_count: int
+    message: str
+
+class AreaDeviceSchema(Schema):
+    ieda: str
+    latitude: float
+    longitude: float
+    city: str
+    country: str
+    is_active: bool
+    distance_km: Optional[float] = None
+
+class DeviceAreaSchema(Schema):
+    status: str
+    devices: List[AreaDeviceSchema]
+    device_count: int
+    message: str
+
+class DeviceListSchema(Schema):
+    status: str
+    devices: List[Dict[str, Any]]
+    count: int
+    next_cursor: Optional[str] = None
+    message: str
+
+class PresenceCountsSchema(Schema):
+    status: str
+    online: int
+    stale: int
+    offline: int
+    total: int
+    stale_after: float
+    offline_after: float
+
+class PresenceDeviceSchema(Schema):
+    ieda: str
+    last_heartbeat: datetime
+
+class PresenceListSchema(Schema):
+    status: str
+    state: str
+    devices: List[PresenceDeviceSchema]
+    count: int
+
+# Upper bound for one gateway heartbeat batch (keeps the IN clause well below SQLite's variable limit)
+MAX_STATUS_BATCH_SIZE = 500
+
+# Upper bound for points returned by one track query
+MAX_TRACK_POINTS = 5000
+
+# Upper bound for one page of the fleet listing
+MAX_DEVICE_PAGE = 1000
+
+# Upper bound for one presence list
+MAX_PRESENCE_LIST = 1000
+
+# Upper bounds for spatial queries
+MAX_AREA_DEVICES = 1000
+MAX_RADIUS_KM = 500
+
 # --- Authentication Endpoints ---
 
 @api.post("/auth/login", response={200: TokenSchema, 401: ErrorSchema, 400: ErrorSchema})
@@ -123,13 +271,21 @@ def api_logout(request: HttpRequest):
     """
     API logout endpoint
     """
-    # If using token authentication, client should discard the token
+    # A bearer token is revoked (which also drops it from the token cache);
+    # other clients just discard theirs
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, key = authorization.partition(" ")
+    if scheme.lower() == "bearer" and key.strip():
+        Token.objects.filter(key=key.strip()).delete()
     return 200, {"status": "success", "message": "Logged out successfully"}
 
 # --- Enhanced Device Endpoints ---
 
-@api.post("/device/register", response={200: SuccessSchema, 400: ErrorSchema})
-def device_register_api(request: HttpRequest, data: RegisterDeviceSchema):
+# The hot device endpoints below are async so uvicorn (Portal.asgi) can hold
+# thousands of slow ESP8266 connections without a worker thread per request.
+
+@api.post("/device/register", auth=AsyncDeviceTokenAuth("device_register"), response={200: SuccessSchema, 400: ErrorSchema, 429: ErrorSchema})
+async def device_register_api(request: HttpRequest, data: RegisterDeviceSchema):
     """
     API endpoint for ESP8266 device registration with user support
     """
@@ -137,24 +293,24 @@ def device_register_api(request: HttpRequest, data: RegisterDeviceSchema):
         if not data.ieda:
             return 400, {"status": "error", "message": "IEDA is required"}
         
-        # Generate a new 6-digit registration code
-        registration_code = generate_registration_code()
-        
         # Check if device already exists
-        device, created = Device.objects.get_or_create(
+        device, created = await Device.objects.aget_or_create(
             ieda=data.ieda,
             defaults={
                 'mac_address': f"MAC_{data.ieda[:8]}",
-                'registration_code': registration_code,
                 'is_active': False
             }
         )
         
-        if not created:
-            # Update existing device with new code
-            device.registration_code = registration_code
+        if not created and device.is_active:
             device.is_active = False
-            device.save()
+            await device.asave(update_fields=['is_active'])
+        
+        # Generate a new 6-digit registration code (kept in the code store, not on the device row)
+        try:
+            registration_code = await registration_codes.aissue(device.pk)
+        except RegistrationCodeError as e:
+            return 429, {"status": "error", "message": str(e)}
         
         response_data = {
             "status": "success",
@@ -163,18 +319,63 @@ def device_register_api(request: HttpRequest, data: RegisterDeviceSchema):
             "message": "Registration code generated successfully"
         }
         
-        # Add user information to response if provided
-        if data.username:
-            response_data["requested_user"] = data.username
-            response_data["message"] = f"Registration code generated for user {data.username}"
+        # Add user information to response if provided (a bearer token wins over the body)
+        username = bearer_username(request, data.username)
+        if username:
+            response_data["requested_user"] = username
+            response_data["message"] = f"Registration code generated for user {username}"
         
         return 200, response_data
         
     except Exception as e:
         return 400, {"status": "error", "message": f"Registration failed: {str(e)}"}
 
-@api.post("/device/status", response={200: SuccessSchema, 400: ErrorSchema, 404: ErrorSchema})
-def device_status_api(request: HttpRequest, data: DeviceStatusSchema):
+def build_device_status(identity, last_seen, username=None, registration_code=None):
+    """
+    Build the status payload for a device from its cached identity
+    """
+    # Check if device is registered to the specific user
+    registered_to_user = False
+    user_rito_id = None
+    
+    if identity.registered and username:
+        registered_to_user = (identity.username == username)
+        user_rito_id = identity.rito_id
+    
+    response_data = {
+        "status": "success",
+        "registered": identity.registered,
+        "registered_to_user": registered_to_user,
+        "rito_id": user_rito_id,
+        "registration_code": registration_code,
+        "is_active": identity.is_active,
+        "last_seen": last_seen.isoformat() if last_seen else None
+    }
+    
+    # Add username info if available
+    if identity.username:
+        response_data["username"] = identity.username
+    
+    # Custom message based on registration status
+    if registered_to_user:
+        response_data["message"] = f"Device registered to user {username}"
+    elif identity.registered and identity.username:
+        response_data["message"] = f"Device registered to different user: {identity.username}"
+    else:
+        response_data["message"] = "Device not registered to any user"
+    
+    return response_data
+
+async def device_status_lookup(ieda):
+    """
+    Identity and live pairing code of a device (no queries when both are cached)
+    """
+    identity = await device_identity_cache.aresolve(ieda)
+    registration_code = await registration_codes.acurrent_code(identity.device_id)
+    return identity, registration_code
+
+@api.post("/device/status", auth=AsyncDeviceTokenAuth("device_status"), response={200: SuccessSchema, 400: ErrorSchema, 404: ErrorSchema})
+async def device_status_api(request: HttpRequest, data: DeviceStatusSchema):
     """
     API endpoint for device status check with user verification
     """
@@ -183,45 +384,16 @@ def device_status_api(request: HttpRequest, data: DeviceStatusSchema):
             return 400, {"status": "error", "message": "IEDA is required"}
         
         try:
-            device = Device.objects.get(ieda=data.ieda)
-            rito_account = RitoAccount.objects.filter(device=device).first()
-            
-            # Check if device is registered to the specific user
-            registered_to_user = False
-            user_rito_id = None
+            # Concurrent checks for the same device share one lookup (and reuse it briefly)
+            identity, registration_code = await device_requests.ado(
+                ("status", data.ieda), partial(device_status_lookup, data.ieda)
+            )
             
-            if rito_account and data.username:
-                registered_to_user = (rito_account.user.username == data.username)
-                user_rito_id = rito_account.rito_id
+            # Update last seen timestamp (persisted by the write-behind buffer)
+            last_seen = await last_seen_buffer.arecord(identity.device_id)
             
-            # Update last seen timestamp
-            device.last_seen = timezone.now()
-            device.save()
-            
-            response_data = {
-                "status": "success",
-                "registered": rito_account is not None,
-                "registered_to_user": registered_to_user,
-                "rito_id": user_rito_id,
-                "registration_code": device.registration_code,
-                "is_active": device.is_active,
-                "last_seen": device.last_seen.isoformat()
-            }
-            
-            # Add username info if available
-            if rito_account and rito_account.user:
-                response_data["username"] = rito_account.user.username
-            
-            # Custom message based on registration status
-            if registered_to_user:
-                response_data["message"] = f"Device registered to user {data.username}"
-            elif rito_account and not registered_to_user:
-                actual_user = rito_account.user.username
-                response_data["message"] = f"Device registered to different user: {actual_user}"
-            else:
-                response_data["message"] = "Device not registered to any user"
-            
-            return 200, response_data
+            username = bearer_username(request, data.username)
+            return 200, build_device_status(identity, last_seen, username, registration_code)
             
         except Device.DoesNotExist:
             return 404, {"status": "error", "message": "Device not found"}
@@ -229,8 +401,57 @@ def device_status_api(request: HttpRequest, data: DeviceStatusSchema):
     except Exception as e:
         return 400, {"status": "error", "message": f"Status check failed: {str(e)}"}
 
-@api.post("/device/location", response={200: SuccessSchema, 400: ErrorSchema, 404: ErrorSchema})
-def device_location_api(request: HttpRequest, data: DeviceLocationSchema):
+@api.post("/device/status/batch", auth=DeviceTokenAuth("device_status_batch"), response={200: DeviceStatusBatchResultSchema, 400: ErrorSchema})
+def device_status_batch_api(request: HttpRequest, data: DeviceStatusBatchSchema):
+    """
+    Batched heartbeat endpoint for gateways reporting many devices in one round trip
+    """
+    try:
+        if not data.devices:
+            return 400, {"status": "error", "message": "At least one device is required"}
+        
+        if len(data.devices) > MAX_STATUS_BATCH_SIZE:
+            return 400, {
+                "status": "error",
+                "message": f"Batch too large: at most {MAX_STATUS_BATCH_SIZE} devices per request"
+            }
+        
+        if any(not ping.ieda for ping in data.devices):
+            return 400, {"status": "error", "message": "IEDA is required for every device"}
+        
+        # Cached identities, with every miss resolved by a single ieda__in query
+        identities = device_identity_cache.resolve_many(ping.ieda for ping in data.devices)
+        
+        # Bump last_seen for the whole batch; the buffer writes it with one bulk_update
+        last_seen = last_seen_buffer.record_many(
+            identity.device_id for identity in identities.values()
+        )
+        codes = registration_codes.current_codes(identity.device_id for identity in identities.values())
+        
+        results = []
+        for ping in data.devices:
+            identity = identities.get(ping.ieda)
+            if identity is None:
+                results.append({"ieda": ping.ieda, "status": "error", "message": "Device not found"})
+                continue
+            
+            username = bearer_username(request, ping.username)
+            status = build_device_status(identity, last_seen, username, codes[identity.device_id])
+            results.append({"ieda": ping.ieda, **status})
+        
+        unknown = sum(1 for result in results if result["status"] == "error")
+        return 200, {
+            "status": "success",
+            "devices": results,
+            "device_count": len(identities),
+            "message": f"Processed {len(results)} heartbeats ({unknown} unknown devices)"
+        }
+        
+    except Exception as e:
+        return 400, {"status": "error", "message": f"Batch status check failed: {str(e)}"}
+
+@api.post("/device/location", auth=AsyncDeviceTokenAuth("device_location"), response={200: SuccessSchema, 400: ErrorSchema, 404: ErrorSchema})
+async def device_location_api(request: HttpRequest, data: DeviceLocationSchema):
     """
     API endpoint to update device location with user info
     """
@@ -239,20 +460,21 @@ def device_location_api(request: HttpRequest, data: DeviceLocationSchema):
             return 400, {"status": "error", "message": "IEDA is required"}
         
         try:
-            device = Device.objects.get(ieda=data.ieda)
+            device = await Device.objects.aget(ieda=data.ieda)
             
             # Update location data
             if data.latitude and data.longitude:
                 device.latitude = float(data.latitude)
                 device.longitude = float(data.longitude)
+                await location_history.arecord(device.pk, device.latitude, device.longitude)
             
-            location_updated = False
             if data.ip_address:
+                # Resolved in the background and written back in batches
                 device.ip_address = data.ip_address
-                location_updated = update_device_location(device, data.ip_address)
+                await geo_queue.aenqueue(device.pk, data.ip_address)
             
-            device.last_seen = timezone.now()
-            device.save()
+            await device.asave(update_fields=LOCATION_FIELDS)
+            await last_seen_buffer.arecord(device.pk)
             
             response_data = {
                 "status": "success",
@@ -260,8 +482,9 @@ def device_location_api(request: HttpRequest, data: DeviceLocationSchema):
             }
             
             # Add user info to response
-            if data.username:
-                response_data["user"] = data.username
+            username = bearer_username(request, data.username)
+            if username:
+                response_data["user"] = username
             
             # Include location details if available
             if device.latitude and device.longitude:
@@ -288,19 +511,9 @@ def register_device_web(request: HttpRequest, data: RegisterDeviceSchema):
     Web registration endpoint with user association
     """
     try:
-        # Check if device already exists
-        if Device.objects.filter(ieda=data.ieda).exists():
-            device = Device.objects.get(ieda=data.ieda)
-            # Check if already registered to this user
-            if RitoAccount.objects.filter(device=device).exists():
-                return 400, {"status": "error", "message": "Device already registered"}
-        
-        # Create device
-        device = Device.objects.create(
-            ieda=data.ieda,
-            mac_address="simulated_mac",
-            registration_code=data.code
-        )
+        # Check if already registered
+        if RitoAccount.objects.filter(device__ieda=data.ieda).exists():
+            return 400, {"status": "error", "message": "Device already registered"}
         
         # Find user if username provided
         user = None
@@ -310,18 +523,25 @@ def register_device_web(request: HttpRequest, data: RegisterDeviceSchema):
             except User.DoesNotExist:
                 return 400, {"status": "error", "message": f"User {data.username} not found"}
         
-        # Generate Rito ID and create account
-        rito_id = generate_rito_id()
-        account_data = {
-            'device': device,
-            'rito_id': rito_id,
-            'name': f"{data.username}'s Account" if data.username else "Default Account"
-        }
-        
-        if user:
-            account_data['user'] = user
-        
-        RitoAccount.objects.create(**account_data)
+        with transaction.atomic():
+            # The code must be live and issued to this device (one indexed lookup); it is used up here
+            device_id = registration_codes.consume(data.code, data.ieda)
+            if device_id is None:
+                return 400, {"status": "error", "message": "Invalid or expired registration code"}
+            Device.objects.filter(pk=device_id).update(is_active=True)
+            
+            # Generate Rito ID and create account
+            rito_id = generate_rito_id()
+            account_data = {
+                'device_id': device_id,
+                'rito_id': rito_id,
+                'name': f"{data.username}'s Account" if data.username else "Default Account"
+            }
+            
+            if user:
+                account_data['user'] = user
+            
+            RitoAccount.objects.create(**account_data)
         
         response_data = {
             "status": "success", 
@@ -384,35 +604,247 @@ def create_social_account(request: HttpRequest, data: CreateAccountSchema):
         return 400, {"status": "error", "message": f"Account creation failed: {str(e)}"}
 
 @api.get("/ping", response=SuccessSchema)
-def ping(request: HttpRequest):
+async def ping(request: HttpRequest):
     """
     Health check endpoint
     """
     return {"status": "success", "message": "pong"}
 
-@api.get("/device/{ieda}/status", response={200: SuccessSchema, 404: ErrorSchema})
-def device_status_web(request: HttpRequest, ieda: str):
+def web_device_status(ieda):
+    device = get_object_or_404(Device, ieda=ieda)
+    account = get_object_or_404(RitoAccount, device=device)
+    
+    social_accounts = SocialMediaAccount.objects.filter(rito_account=account)
+    platforms = [acc.platform for acc in social_accounts]
+    
+    return {
+        "status": "success",
+        "rito_id": account.rito_id,
+        "message": f"Registered platforms: {', '.join(platforms) if platforms else 'None'}"
+    }
+
+@api.get("/device/{ieda}/status", auth=device_auth, response={200: SuccessSchema, 404: ErrorSchema})
+def device_status_web(request: HttpRequest, response: HttpResponse, ieda: str):
     """
-    Web endpoint to check device status
+    Web endpoint to check device status (answers If-None-Match / If-Modified-Since with 304)
     """
     try:
-        device = get_object_or_404(Device, ieda=ieda)
-        account = get_object_or_404(RitoAccount, device=device)
+        identity = device_identity_cache.resolve(ieda)
+        if identity.registered:
+            # Validators come from the identity and version caches, so an unchanged poll runs no queries
+            etag, last_modified = device_status_versions.validators(identity)
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+            response["Cache-Control"] = "no-cache"
+            # Returns ``response`` itself when the request has to be answered in full
+            conditional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+            if conditional is not response:
+                return conditional
+        
+        # Concurrent requests for the same device share one set of queries
+        return 200, device_requests.do(("web_status", ieda), partial(web_device_status, ieda))
+    except Device.DoesNotExist:
+        return 404, {"status": "error", "message": "Device not found"}
+
+@api.get("/device/{ieda}/track", auth=device_auth, response={200: DeviceTrackSchema, 400: ErrorSchema, 403: ErrorSchema, 404: ErrorSchema})
+def device_track_api(request: HttpRequest, ieda: str, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None, points: int = 500):
+    """
+    Location history of a device over a time range (default: last 24 hours),
+    downsampled to at most ``points`` points. Only the device's owner (by API
+    token) and staff may read it.
+    """
+    try:
+        end = end or timezone.now()
+        start = start or end - timedelta(hours=24)
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        if start >= end:
+            return 400, {"status": "error", "message": "start must be before end"}
+        if not 1 <= points <= MAX_TRACK_POINTS:
+            return 400, {"status": "error", "message": f"points must be between 1 and {MAX_TRACK_POINTS}"}
         
-        social_accounts = SocialMediaAccount.objects.filter(rito_account=account)
-        platforms = [acc.platform for acc in social_accounts]
+        device = get_object_or_404(Device, ieda=ieda)
+        owner_id = RitoAccount.objects.filter(device=device).values_list('user_id', flat=True).first()
+        if not may_read_device(request, owner_id):
+            return 403, {"status": "error", "message": "Not allowed to read this device's track"}
+        track, raw_count = device_track(device.pk, start, end, points)
         
         return 200, {
             "status": "success",
-            "rito_id": account.rito_id,
-            "message": f"Registered platforms: {', '.join(platforms) if platforms else 'None'}"
+            "ieda": ieda,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "points": track,
+            "point_count": len(track),
+            "raw_count": raw_count,
+            "message": f"{len(track)} points ({raw_count} recorded)"
         }
-    except Device.DoesNotExist:
+    except Http404:
         return 404, {"status": "error", "message": "Device not found"}
 
+@api.get("/devices", auth=django_auth_is_staff, response={200: DeviceListSchema, 400: ErrorSchema})
+def device_list_api(request: HttpRequest, cursor: Optional[str] = None, limit: int = 100,
+                    fields: Optional[str] = None, active: Optional[bool] = None, stale: Optional[bool] = None,
+                    country: Optional[str] = None, registered: Optional[bool] = None):
+    """
+    Fleet listing (staff only), most recently seen first. Pass ``next_cursor`` back as
+    ``cursor`` for the next page; ``fields`` is a comma-separated projection.
+    last_seen is the persisted value (pending heartbeats are flushed within seconds).
+    """
+    if not 1 <= limit <= MAX_DEVICE_PAGE:
+        return 400, {"status": "error", "message": f"limit must be between 1 and {MAX_DEVICE_PAGE}"}
+    
+    try:
+        devices, next_cursor = list_devices(
+            fields=fields, cursor=cursor, limit=limit,
+            active=active, stale=stale, stale_after=settings.RITO_DEVICE_STALE_AFTER,
+            country=country, registered=registered,
+        )
+    except ValueError as e:
+        return 400, {"status": "error", "message": str(e)}
+    
+    return 200, {
+        "status": "success",
+        "devices": devices,
+        "count": len(devices),
+        "next_cursor": next_cursor,
+        "message": f"{len(devices)} devices" + ("" if next_cursor else " (last page)")
+    }
+
+@api.get("/devices/export", auth=django_auth_is_staff, response={400: ErrorSchema})
+def device_export_api(request: HttpRequest, format: str = "ndjson", gzip: bool = False):
+    """
+    Stream the whole fleet (devices with their Rito account) as NDJSON or CSV (staff only)
+    """
+    if format not in EXPORT_FORMATS:
+        return 400, {"status": "error", "message": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}
+    
+    content = export_devices(format, compress=gzip)
+    if isinstance(request, ASGIRequest):
+        content = aiter_blocks(content)
+    
+    filename = f"devices-{timezone.now():%Y%m%d-%H%M%S}.{format}" + (".gz" if gzip else "")
+    response = StreamingHttpResponse(content, content_type="application/gzip" if gzip else EXPORT_FORMATS[format])
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+@api.get("/presence", auth=django_auth_is_staff, response=PresenceCountsSchema)
+def presence_counts_api(request: HttpRequest):
+    """
+    Online/stale/offline device counts from the in-memory presence tracker (staff only)
+    """
+    return {
+        "status": "success",
+        **device_presence.counts(),
+        "stale_after": device_presence.stale_after,
+        "offline_after": device_presence.offline_after,
+    }
+
+@api.get("/presence/{state}", auth=django_auth_is_staff, response={200: PresenceListSchema, 400: ErrorSchema})
+def presence_list_api(request: HttpRequest, state: str, limit: int = 100):
+    """
+    Devices in a presence state, most recent heartbeat first (staff only)
+    """
+    if state not in (ONLINE, STALE, OFFLINE):
+        return 400, {"status": "error", "message": f"state must be one of: {ONLINE}, {STALE}, {OFFLINE}"}
+    if not 1 <= limit <= MAX_PRESENCE_LIST:
+        return 400, {"status": "error", "message": f"limit must be between 1 and {MAX_PRESENCE_LIST}"}
+    
+    if state == OFFLINE:
+        # Offline devices are not kept in memory: walk the last_seen index instead
+        cutoff = timezone.now() - timedelta(seconds=device_presence.offline_after)
+        devices = [
+            {"ieda": ieda, "last_heartbeat": last_seen}
+            for ieda, last_seen in Device.objects.filter(last_seen__lt=cutoff)
+            .order_by('-last_seen', '-id').values_list('ieda', 'last_seen')[:limit]
+        ]
+    else:
+        members = device_presence.members(state, limit)
+        iedas = dict(Device.objects.filter(pk__in=[pk for pk, _ in members]).values_list('pk', 'ieda'))
+        devices = [
+            {"ieda": iedas[pk], "last_heartbeat": seen}
+            for pk, seen in members if pk in iedas
+        ]
+    
+    return 200, {"status": "success", "state": state, "devices": devices, "count": len(devices)}
+
+def validate_coordinates(*points):
+    """Return an error message for the first out-of-range (latitude, longitude) pair"""
+    for latitude, longitude in points:
+        if not -90 <= latitude <= 90:
+            return "latitude must be between -90 and 90"
+        if not -180 <= longitude <= 180:
+            return "longitude must be between -180 and 180"
+    return None
+
+@api.get("/devices/bbox", auth=django_auth_is_staff, response={200: DeviceAreaSchema, 400: ErrorSchema})
+def devices_bbox_api(request: HttpRequest, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                     limit: int = 500):
+    """
+    Devices inside a bounding box (staff only; min_lon > max_lon means the box crosses the antimeridian)
+    """
+    error = validate_coordinates((min_lat, min_lon), (max_lat, max_lon))
+    if error:
+        return 400, {"status": "error", "message": error}
+    if min_lat > max_lat:
+        return 400, {"status": "error", "message": "min_lat must not exceed max_lat"}
+    if not 1 <= limit <= MAX_AREA_DEVICES:
+        return 400, {"status": "error", "message": f"limit must be between 1 and {MAX_AREA_DEVICES}"}
+    
+    devices = devices_in_bbox(min_lat, min_lon, max_lat, max_lon, limit)
+    return 200, {
+        "status": "success",
+        "devices": devices,
+        "device_count": len(devices),
+        "message": f"{len(devices)} devices in area"
+    }
+
+@api.get("/devices/near", auth=django_auth_is_staff, response={200: DeviceAreaSchema, 400: ErrorSchema})
+def devices_near_api(request: HttpRequest, lat: float, lon: float, radius_km: float = 10, limit: int = 100):
+    """
+    Devices within ``radius_km`` of a point, nearest first (staff only)
+    """
+    error = validate_coordinates((lat, lon))
+    if error:
+        return 400, {"status": "error", "message": error}
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        return 400, {"status": "error", "message": f"radius_km must be between 0 and {MAX_RADIUS_KM}"}
+    if not 1 <= limit <= MAX_AREA_DEVICES:
+        return 400, {"status": "error", "message": f"limit must be between 1 and {MAX_AREA_DEVICES}"}
+    
+    devices = devices_near(lat, lon, radius_km, limit)
+    return 200, {
+        "status": "success",
+        "devices": devices,
+        "device_count": len(devices),
+        "message": f"{len(devices)} devices within {radius_km:g} km"
+    }
+
 # --- Additional utility endpoints ---
 
-@api.post("/device/refresh-code", response={200: SuccessSchema, 400: ErrorSchema, 404: ErrorSchema})
+@api.get("/geo/cache/stats", auth=django_auth_is_staff, response=GeoCacheStatsSchema)
+def geo_cache_stats(request: HttpRequest):
+    """
+    Hit/miss counters of the geolocation cache and resolution queue (this process) and offline database info (staff only)
+    """
+    return {
+        "status": "success",
+        "cache": geo_cache.stats(),
+        "database": geoip_database.stats(),
+        "queue": geo_queue.stats(),
+    }
+
+@api.get("/ratelimit/stats", auth=django_auth_is_staff, response=RateLimitStatsSchema)
+def rate_limit_stats(request: HttpRequest):
+    """
+    Allowed/throttled request counters per rate-limited route (this process, staff only)
+    """
+    return {"status": "success", **rate_limiter.stats()}
+
+@api.post("/device/refresh-code", auth=DeviceTokenAuth("device_refresh_code"), response={200: SuccessSchema, 400: ErrorSchema, 404: ErrorSchema, 429: ErrorSchema})
 def refresh_registration_code_api(request: HttpRequest, data: dict):
     """
     API endpoint to refresh registration code
@@ -424,10 +856,8 @@ def refresh_registration_code_api(request: HttpRequest, data: dict):
             return 400, {"status": "error", "message": "IEDA is required"}
         
         try:
-            device = Device.objects.get(ieda=ieda)
-            new_code = generate_registration_code()
-            device.registration_code = new_code
-            device.save()
+            device = Device.objects.only('pk').get(ieda=ieda)
+            new_code = registration_codes.issue(device.pk)
             
             return 200, {
                 "status": "success",
@@ -437,6 +867,8 @@ def refresh_registration_code_api(request: HttpRequest, data: dict):
             
         except Device.DoesNotExist:
             return 404, {"status": "error", "message": "Device not found"}
+        except RegistrationCodeError as e:
+            return 429, {"status": "error", "message": str(e)}
             
     except Exception as e:
         return 400, {"status": "error", "message": f"Code refresh failed: {str(e)}"}
@@ -449,14 +881,16 @@ def get_user_devices(request: HttpRequest, username: str):
     try:
         user = get_object_or_404(User, username=username)
         rito_accounts = RitoAccount.objects.filter(user=user).select_related('device')
+        codes = registration_codes.current_codes(account.device_id for account in rito_accounts if account.device_id)
         
         devices = []
         for account in rito_accounts:
             if account.device:
+                last_seen_buffer.apply(account.device)
                 devices.append({
                     'ieda': account.device.ieda,
                     'rito_id': account.rito_id,
-                    'registration_code': account.device.registration_code,
+                    'registration_code': codes[account.device_id] or '',
                     'is_active': account.device.is_active,
                     'last_seen': account.device.last_seen.isoformat() if account.device.last_seen else None
                 })
@@ -472,6 +906,26 @@ def get_user_devices(request: HttpRequest, username: str):
     except User.DoesNotExist:
         return 404, {"status": "error", "message": f"User {username} not found"}
 
+# --- Community Endpoints ---
+
+@api.get("/community/autocomplete", auth=django_auth, response={200: AutocompleteSchema, 400: ErrorSchema})
+def community_autocomplete_api(request: HttpRequest, q: str = "", kind: Optional[str] = None, limit: int = 5):
+    """
+    Typeahead matches for topics, question titles and members, most popular first.
+    Every word of a name or title can start a match; ``kind`` limits the results to one kind.
+    """
+    if kind is not None and kind not in community_autocomplete.loaders:
+        return 400, {"status": "error", "message": f"kind must be one of: {', '.join(community_autocomplete.loaders)}"}
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        return 400, {"status": "error", "message": f"limit must be between 1 and {MAX_SUGGESTIONS}"}
+    
+    matches = community_autocomplete.suggest(q, [kind] if kind else None, limit)
+    results = {
+        name: [{"id": str(item.pk), "label": item.label, "url": item.url} for item in items]
+        for name, items in matches.items()
+    }
+    return 200, {"status": "success", "query": q, "results": results}
+
 # --- API Documentation ---
 @api.get("/docs", include_in_schema=False)
 def api_docs(request: HttpRequest):
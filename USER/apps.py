@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'USER'
+
+    def ready(self):
+        # Hooks heartbeats (last_seen_buffer) into the presence tracker
+        from . import presence  # noqa: F401
+        # Keeps the community full-text index in step with questions and answers
+        from . import search  # noqa: F401
+        # Keeps the community autocomplete index in step with topics, questions and members
+        from . import autocomplete  # noqa: F401
+        # Adds new questions and answers to the trending topic scores
+        from . import trending  # noqa: F401
@@ -0,0 +1,220 @@
+# USER/auth.py
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from ninja.errors import Throttled
+from ninja.security import HttpBearer
+from rest_framework.authtoken.models import Token
+
+from .ratelimit import rate_limiter
+
+_MISS = object()
+
+
+class TokenUser(namedtuple('TokenUser', ['user_id', 'username', 'is_staff', 'is_superuser'])):
+    """The user behind an API token, as cached per process"""
+    __slots__ = ()
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.pk, user.username, user.is_staff, user.is_superuser)
+
+
+# Marker for requests allowed through without a token (RITO_DEVICE_AUTH_REQUIRED off)
+ANONYMOUS = TokenUser(None, None, False, False)
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of ``token key -> TokenUser`` with a TTL.
+
+    Entries are dropped when their Token is saved or deleted or their User
+    is saved or deleted (receivers below). Signals only reach the process
+    that made the change, so ``ttl`` bounds how long another process may
+    still accept a revoked token. Rejected keys (unknown, or of an inactive
+    user) are cached as None for ``negative_ttl`` seconds, so a device
+    retrying a bad token does not query the database on every request.
+    """
+
+    def __init__(self, max_size, ttl, negative_ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._by_user = {}
+
+    def get(self, key, default=None):
+        """The cached TokenUser (None for a rejected key), else ``default``"""
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, token_user, user_id=None, ttl=None):
+        with self.lock:
+            self._discard(key)
+            if token_user is not None:
+                user_id = token_user.user_id
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), token_user, user_id)
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, key=None, user_id=None):
+        with self.lock:
+            keys = set(self._by_user.get(user_id, ()))
+            if key is not None:
+                keys.add(key)
+            for stale_key in keys:
+                self._discard(stale_key)
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def resolve(self, key):
+        """Return the TokenUser for an API token, or None if it is unknown or the user is inactive"""
+        token_user = self.get(key, _MISS)
+        if token_user is _MISS:
+            token = Token.objects.select_related('user').filter(key=key).first()
+            token_user = self._load(key, token)
+        return token_user
+
+    async def aresolve(self, key):
+        """Async variant of ``resolve``"""
+        token_user = self.get(key, _MISS)
+        if token_user is _MISS:
+            token = await Token.objects.select_related('user').filter(key=key).afirst()
+            token_user = self._load(key, token)
+        return token_user
+
+    def _load(self, key, token):
+        if token is None or not token.user.is_active:
+            self.put(key, None, user_id=token.user_id if token else None, ttl=self.negative_ttl)
+            return None
+        token_user = TokenUser.from_user(token.user)
+        self.put(key, token_user)
+        return token_user
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_user.get(entry[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[entry[2]]
+
+
+token_cache = TokenCache(
+    max_size=settings.RITO_TOKEN_CACHE_SIZE,
+    ttl=settings.RITO_TOKEN_CACHE_TTL,
+    negative_ttl=settings.RITO_TOKEN_NEGATIVE_CACHE_TTL,
+)
+
+
+class DeviceTokenAuth(HttpBearer):
+    """
+    ``Authorization: Bearer <token>`` auth for device routes; ``request.auth``
+    is a TokenUser. A token is required unless RITO_DEVICE_AUTH_REQUIRED is
+    turned off (legacy firmware); then requests without one pass as ANONYMOUS
+    (a wrong token is still rejected).
+
+    With a rate limit ``scope`` (see RITO_RATE_LIMITS), the limit is checked
+    before anything else, so a throttled request gets its 429 without a
+    token lookup. ninja authenticates before it runs ``throttle=`` objects,
+    which is why the limit lives here.
+    """
+
+    def __init__(self, scope=None):
+        super().__init__()
+        self.scope = scope
+
+    def __call__(self, request):
+        if self.scope is not None:
+            _raise_if_throttled(rate_limiter.check(self.scope, request))
+        if not request.headers.get(self.header) and not settings.RITO_DEVICE_AUTH_REQUIRED:
+            return ANONYMOUS
+        return super().__call__(request)
+
+    def authenticate(self, request, token):
+        return token_cache.resolve(token)
+
+
+class AsyncDeviceTokenAuth(DeviceTokenAuth):
+    """DeviceTokenAuth for async routes (cache misses use the async ORM)"""
+    is_async = True
+
+    async def __call__(self, request):
+        if self.scope is not None:
+            _raise_if_throttled(await rate_limiter.acheck(self.scope, request))
+        if not request.headers.get(self.header) and not settings.RITO_DEVICE_AUTH_REQUIRED:
+            return ANONYMOUS
+        coroutine = HttpBearer.__call__(self, request)
+        return await coroutine if coroutine is not None else None
+
+    async def authenticate(self, request, token):
+        return await token_cache.aresolve(token)
+
+
+def _raise_if_throttled(wait):
+    # Handled by the API's Throttled handler (429 with Retry-After)
+    if wait:
+        raise Throttled(wait=math.ceil(wait))
+
+
+device_auth = DeviceTokenAuth()
+async_device_auth = AsyncDeviceTokenAuth()
+
+
+def bearer_username(request, fallback=None):
+    """
+    Username of the authenticated token, else ``fallback`` (the legacy body
+    field, only trusted while RITO_DEVICE_AUTH_REQUIRED is off)
+    """
+    token_user = getattr(request, 'auth', None)
+    if token_user is not None and token_user.user_id is not None:
+        return token_user.username
+    return None if settings.RITO_DEVICE_AUTH_REQUIRED else fallback
+
+def may_read_device(request, owner_id):
+    """
+    Whether a request may read a device's data: the token's user owns it
+    (``owner_id``, its RitoAccount user) or is staff, or a staff session
+    """
+    token_user = getattr(request, 'auth', None)
+    if token_user is not None and token_user.user_id is not None:
+        return token_user.is_staff or token_user.user_id == owner_id
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_authenticated and user.is_staff
+
+# ========== CACHE INVALIDATION ==========
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate(key=instance.key)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    token_cache.invalidate(user_id=instance.pk)
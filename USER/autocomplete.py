@@ -0,0 +1,337 @@
+# USER/autocomplete.py
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.urls import reverse
+
+from .models import CommunityMember, Question, Topic
+
+# Keys are cut to this many characters (longer queries match on their first MAX_KEY_LENGTH)
+MAX_KEY_LENGTH = 48
+
+# Top matches remembered per prefix (the largest limit a caller may ask for)
+MAX_SUGGESTIONS = 20
+RESULT_CACHE_SIZE = 2000
+
+# A vote counts as much as this many views in a question's popularity
+QUESTION_VOTE_WEIGHT = 10
+
+
+def normalize(text):
+    """Casefolded words without diacritics, joined by single spaces"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', text.casefold()))
+
+
+def prefix_keys(text):
+    """One key per word start, so a prefix may match any word of ``text`` onwards"""
+    text = normalize(text)
+    starts = [0] + [match.end() for match in re.finditer(' ', text)]
+    return {text[start:start + MAX_KEY_LENGTH] for start in starts if start < len(text)}
+
+
+def question_popularity(question):
+    return question.views + QUESTION_VOTE_WEIGHT * question.score
+
+
+class Suggestion:
+    __slots__ = ('pk', 'label', 'url_name', 'url_kwargs', 'weight', 'keys', '_url')
+
+    def __init__(self, pk, label, url_name, url_kwargs, weight):
+        self.pk = pk
+        self.label = label
+        self.url_name = url_name
+        self.url_kwargs = url_kwargs
+        self.weight = weight
+        self.keys = prefix_keys(label)
+        self._url = None
+
+    def rank(self):
+        return (-self.weight, self.label, self.pk)
+
+    @property
+    def url(self):
+        # Reversed on first use: only suggestions actually served pay for it
+        if self._url is None:
+            self._url = reverse(self.url_name, kwargs=self.url_kwargs)
+        return self._url
+
+
+class PrefixIndex:
+    """
+    Sorted ``(key, pk)`` array searched with bisect: a prefix's matches are
+    one contiguous slice. Short prefixes match a large share of the entries,
+    so when that slice is wider than a walk down the popularity ranking is
+    expected to be, the ranking is walked instead. The top matches of recent
+    prefixes are cached until the index changes. Callers hold the lock.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.ranked = []  # (-weight, label, pk), most popular first
+        self.items = {}
+        self._results = OrderedDict()
+
+    def load(self, suggestions):
+        self.items = {suggestion.pk: suggestion for suggestion in suggestions}
+        self.entries = sorted((key, pk) for pk, suggestion in self.items.items() for key in suggestion.keys)
+        self.ranked = sorted(suggestion.rank() for suggestion in self.items.values())
+        self._results.clear()
+
+    def put(self, suggestion):
+        self.remove(suggestion.pk)
+        self.items[suggestion.pk] = suggestion
+        for key in suggestion.keys:
+            insort(self.entries, (key, suggestion.pk))
+        insort(self.ranked, suggestion.rank())
+        self._results.clear()
+
+    def remove(self, pk):
+        suggestion = self.items.pop(pk, None)
+        if suggestion is None:
+            return
+        for key in suggestion.keys:
+            _discard(self.entries, (key, pk))
+        _discard(self.ranked, suggestion.rank())
+        self._results.clear()
+
+    def set_weight(self, pk, weight):
+        suggestion = self.items.get(pk)
+        if suggestion is not None and suggestion.weight != weight:
+            _discard(self.ranked, suggestion.rank())
+            suggestion.weight = weight
+            insort(self.ranked, suggestion.rank())
+            self._results.clear()
+
+    def search(self, prefix, limit):
+        prefix = prefix[:MAX_KEY_LENGTH]
+        pks = self._results.get(prefix)
+        if pks is None:
+            pks = self._top(prefix)
+            self._results[prefix] = pks
+            while len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        else:
+            self._results.move_to_end(prefix)
+        return [self.items[pk] for pk in pks[:limit]]
+
+    def _top(self, prefix):
+        start = bisect_left(self.entries, (prefix,))
+        end = bisect_left(self.entries, (prefix + '\U0010ffff',), start)
+        width = end - start
+        # A walk down the ranking checks about MAX_SUGGESTIONS * len(entries) / width keys
+        if width * width > MAX_SUGGESTIONS * len(self.entries):
+            pks = []
+            for _, _, pk in self.ranked:
+                if any(key.startswith(prefix) for key in self.items[pk].keys):
+                    pks.append(pk)
+                    if len(pks) == MAX_SUGGESTIONS:
+                        break
+            return pks
+        matches = {pk for _, pk in self.entries[start:end]}
+        return [pk for _, _, pk in heapq.nsmallest(MAX_SUGGESTIONS, (self.items[pk].rank() for pk in matches))]
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _discard(entries, entry):
+    position = bisect_left(entries, entry)
+    if position < len(entries) and entries[position] == entry:
+        del entries[position]
+
+
+def active_topics():
+    return Topic.objects.filter(is_active=True).annotate(popularity=Count('questions', filter=Q(questions__is_active=True)))
+
+
+def load_topics():
+    topics = active_topics().values_list('pk', 'name', 'slug', 'popularity')
+    return [topic_suggestion(pk, name, slug, popularity) for pk, name, slug, popularity in topics]
+
+
+def load_questions():
+    questions = (Question.objects
+                 .filter(is_active=True)
+                 .annotate(popularity=F('views') + QUESTION_VOTE_WEIGHT * F('score'))
+                 .values_list('pk', 'title', 'slug', 'popularity'))
+    return [question_suggestion(pk, title, slug, popularity) for pk, title, slug, popularity in questions]
+
+
+def load_members():
+    members = (CommunityMember.objects
+               .filter(is_active=True)
+               .values_list('pk', 'name', 'user_id', 'reputation_score'))
+    return [member_suggestion(pk, name, user_id, score) for pk, name, user_id, score in members]
+
+
+def topic_suggestion(pk, name, slug, popularity):
+    return Suggestion(pk, name, 'user:topic_detail', {'slug': slug}, popularity)
+
+
+def question_suggestion(pk, title, slug, popularity):
+    return Suggestion(pk, title, 'user:question_detail', {'slug': slug}, popularity)
+
+
+def member_suggestion(pk, name, user_id, popularity):
+    return Suggestion(pk, name, 'user:member_profile', {'user_id': user_id}, popularity)
+
+
+class Autocomplete:
+    """
+    In-memory prefix index over topic names, question titles and member names.
+
+    Each kind is loaded from the database on first use and then kept current
+    by the receivers below. Popularity (a topic's active questions, a
+    question's views and votes, a member's reputation) drifts from the
+    database because views and votes are written with queryset updates, and
+    signals only reach the process that made a change, so every kind is
+    reloaded after ``rebuild_every`` seconds.
+    """
+
+    def __init__(self, loaders, rebuild_every):
+        self.loaders = loaders
+        self.rebuild_every = rebuild_every
+        self.lock = threading.Lock()
+        self._indexes = {kind: PrefixIndex() for kind in loaders}
+        self._built_at = {}
+        self._building = {}  # kind -> changes made while it loads, replayed afterwards
+
+    def suggest(self, query, kinds=None, limit=5):
+        """``{kind: [Suggestion, ...]}``, the most popular matches of ``query`` first"""
+        prefix = normalize(query)
+        kinds = kinds or list(self.loaders)
+        for kind in kinds:
+            self.ensure_built(kind)
+        with self.lock:
+            return {kind: self._indexes[kind].search(prefix, limit) if prefix else [] for kind in kinds}
+
+    def ensure_built(self, kind):
+        """Load a kind on first use; reload a stale one in the background"""
+        built_at = self._built_at.get(kind)
+        if built_at is not None and time.monotonic() - built_at < self.rebuild_every:
+            return
+        with self.lock:
+            if kind in self._building:
+                # Another thread is loading it; keep serving the current index
+                return
+            self._building[kind] = []
+        if built_at is None:
+            self._load(kind)
+        else:
+            threading.Thread(target=self._load, args=(kind, True), name=f"Autocomplete-{kind}", daemon=True).start()
+
+    def _load(self, kind, background=False):
+        try:
+            suggestions = self.loaders[kind]()
+        except BaseException:
+            with self.lock:
+                del self._building[kind]
+            raise
+        finally:
+            if background:
+                connections.close_all()
+        with self.lock:
+            index = self._indexes[kind]
+            index.load(suggestions)
+            for change in self._building.pop(kind):
+                change(index)
+            self._built_at[kind] = time.monotonic()
+
+    def loaded(self, kind):
+        """Whether changes to ``kind`` are applied (it is loaded or loading)"""
+        return kind in self._built_at or kind in self._building
+
+    def update(self, kind, change):
+        """
+        Apply ``change(index)`` to a loaded index (a not yet loaded one reads
+        the database later). Changes made while a kind reloads are replayed
+        onto the new snapshot, which may already contain them, so a change
+        must set values rather than adjust them.
+        """
+        with self.lock:
+            if kind in self._building:
+                self._building[kind].append(change)
+            if kind in self._built_at:
+                change(self._indexes[kind])
+
+    def put(self, kind, suggestion):
+        self.update(kind, lambda index: index.put(suggestion))
+
+    def remove(self, kind, pk):
+        self.update(kind, lambda index: index.remove(pk))
+
+    def set_weight(self, kind, pk, weight):
+        self.update(kind, lambda index: index.set_weight(pk, weight))
+
+    def clear(self):
+        with self.lock:
+            self._built_at.clear()
+            for index in self._indexes.values():
+                index.load([])
+
+    def stats(self):
+        with self.lock:
+            return {kind: len(index) for kind, index in self._indexes.items()}
+
+
+community_autocomplete = Autocomplete(
+    loaders={'topics': load_topics, 'questions': load_questions, 'members': load_members},
+    rebuild_every=settings.RITO_AUTOCOMPLETE_REBUILD_INTERVAL,
+)
+
+# ========== INDEX UPDATES ==========
+
+@receiver(post_save, sender=Topic)
+def index_topic(sender, instance, **kwargs):
+    if not instance.is_active:
+        community_autocomplete.remove('topics', instance.pk)
+        return
+    # Keep the known question count; saving a topic does not change it
+    def change(index):
+        previous = index.items.get(instance.pk)
+        index.put(topic_suggestion(instance.pk, instance.name, instance.slug, previous.weight if previous else 0))
+    community_autocomplete.update('topics', change)
+
+@receiver(post_save, sender=Question)
+def index_question(sender, instance, **kwargs):
+    if instance.is_active:
+        community_autocomplete.put('questions', question_suggestion(
+            instance.pk, instance.title, instance.slug, question_popularity(instance)))
+    else:
+        community_autocomplete.remove('questions', instance.pk)
+
+@receiver(post_save, sender=CommunityMember)
+def index_member(sender, instance, **kwargs):
+    if instance.is_active:
+        community_autocomplete.put('members', member_suggestion(
+            instance.pk, instance.name, instance.user_id, instance.reputation_score))
+    else:
+        community_autocomplete.remove('members', instance.pk)
+
+@receiver(post_delete, sender=Topic)
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=CommunityMember)
+def unindex_deleted(sender, instance, **kwargs):
+    kind = {Topic: 'topics', Question: 'questions', CommunityMember: 'members'}[sender]
+    community_autocomplete.remove(kind, instance.pk)
+
+@receiver(m2m_changed, sender=Question.topics.through)
+def count_topic_questions(sender, instance, action, reverse, pk_set, **kwargs):
+    # Cleared relations are left to the periodic reload
+    if action not in ('post_add', 'post_remove') or not pk_set or not community_autocomplete.loaded('topics'):
+        return
+    topic_ids = [instance.pk] if reverse else pk_set
+    for pk, popularity in active_topics().filter(pk__in=topic_ids).values_list('pk', 'popularity'):
+        community_autocomplete.set_weight('topics', pk, popularity)
@@ -0,0 +1,241 @@
+# USER/buffers.py
+import atexit
+import logging
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicFlusher:
+    """
+    Base class for in-process write-behind buffers.
+
+    Subclasses collect writes in memory and implement ``flush()``; a daemon
+    thread calls it every ``interval`` seconds and once more at shutdown.
+    An interval of 0 (or less) disables buffering: callers should flush
+    straight away, see ``write_through``.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.RLock()
+        self._thread = None
+        self._pid = None
+        self._stopped = threading.Event()
+
+    @property
+    def write_through(self):
+        return self.interval <= 0
+
+    def start(self):
+        """Start the flush thread (once per process, restarted after a fork)"""
+        if self.write_through or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self.lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=self.__class__.__name__, daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def schedule(self):
+        """Call after buffering a write: flush now in write-through mode, else make sure the thread runs"""
+        if self.write_through:
+            self.flush()
+        else:
+            self.start()
+
+    async def aschedule(self):
+        """Async variant of ``schedule`` (write-through flushes run in a worker thread)"""
+        if self.write_through:
+            await sync_to_async(self.flush)()
+        else:
+            self.start()
+
+    def stop(self):
+        """Stop the flush thread and write out everything still buffered"""
+        self._stopped.set()
+        self.flush_safely()
+
+    def flush_safely(self):
+        try:
+            return self.flush()
+        except Exception:
+            logger.exception("%s flush failed", self.__class__.__name__)
+            return 0
+        finally:
+            if threading.current_thread() is self._thread:
+                close_old_connections()
+
+    def flush(self):
+        raise NotImplementedError
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush_safely()
+
+
+class LastSeenBuffer(PeriodicFlusher):
+    """
+    Write-behind buffer for Device.last_seen.
+
+    Heartbeats only record the newest timestamp per device in memory; the
+    flush thread persists them with a single ``bulk_update``. Buffered values
+    stay visible to readers (``get``/``apply``) until they hit the database.
+    ``listeners`` are called with ``(device_ids, timestamp)`` on every heartbeat.
+    """
+
+    def __init__(self, interval):
+        super().__init__(interval)
+        self.listeners = []
+        self._pending = {}
+        self._flushing = {}
+
+    def record(self, device_id, timestamp=None):
+        """Record a heartbeat for a device and return the buffered timestamp"""
+        timestamp = self._remember([device_id], timestamp)
+        self.schedule()
+        return timestamp
+
+    async def arecord(self, device_id, timestamp=None):
+        """Async variant of ``record`` for ASGI handlers"""
+        timestamp = self._remember([device_id], timestamp)
+        await self.aschedule()
+        return timestamp
+
+    def record_many(self, device_ids, timestamp=None):
+        """Record the same heartbeat timestamp for several devices"""
+        timestamp = self._remember(device_ids, timestamp)
+        self.schedule()
+        return timestamp
+
+    def get(self, device_id, default=None):
+        """Return the buffered (not yet persisted) last_seen for a device"""
+        with self.lock:
+            return self._pending.get(device_id) or self._flushing.get(device_id) or default
+
+    def apply(self, device):
+        """Overlay a buffered last_seen onto a device loaded from the database"""
+        if device is not None:
+            buffered = self.get(device.pk)
+            if buffered and (device.last_seen is None or buffered > device.last_seen):
+                device.last_seen = buffered
+        return device
+
+    def _remember(self, device_ids, timestamp=None):
+        timestamp = timestamp or timezone.now()
+        device_ids = list(device_ids)
+        with self.lock:
+            for device_id in device_ids:
+                current = self._pending.get(device_id)
+                if current is None or timestamp > current:
+                    self._pending[device_id] = timestamp
+        for listener in self.listeners:
+            listener(device_ids, timestamp)
+        return timestamp
+
+    def flush(self):
+        """Persist all buffered timestamps with one bulk_update"""
+        from .models import Device
+
+        with self.lock:
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            batch = self._flushing
+        
+        try:
+            Device.objects.bulk_update(
+                [Device(pk=pk, last_seen=last_seen) for pk, last_seen in batch.items()],
+                ['last_seen'],
+                batch_size=500,
+            )
+        except Exception:
+            # Put the batch back so the next flush retries it
+            with self.lock:
+                for pk, last_seen in batch.items():
+                    current = self._pending.get(pk)
+                    if current is None or last_seen > current:
+                        self._pending[pk] = last_seen
+            raise
+        finally:
+            with self.lock:
+                self._flushing = {}
+        return len(batch)
+
+
+last_seen_buffer = LastSeenBuffer(settings.RITO_LAST_SEEN_FLUSH_INTERVAL)
+
+
+class ViewCountBuffer(PeriodicFlusher):
+    """
+    Write-behind counter for Question.views.
+
+    Page views only bump a per-question counter in memory; the flush thread
+    adds them up with one ``UPDATE ... SET views = views + n`` per distinct
+    increment. The relative update cannot lose concurrent views and, unlike
+    ``save()``, leaves ``updated_at`` alone.
+    """
+
+    def __init__(self, interval):
+        super().__init__(interval)
+        self._pending = {}
+        self._flushing = {}
+
+    def record(self, question_id, count=1):
+        with self.lock:
+            self._pending[question_id] = self._pending.get(question_id, 0) + count
+        self.schedule()
+
+    def get(self, question_id):
+        """Views of a question not yet written to the database"""
+        with self.lock:
+            return self._pending.get(question_id, 0) + self._flushing.get(question_id, 0)
+
+    def apply(self, question):
+        """Add the buffered views to a question loaded from the database"""
+        question.views += self.get(question.pk)
+        return question
+
+    def flush(self):
+        from .models import Question
+
+        with self.lock:
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            batch = self._flushing
+        
+        by_increment = {}
+        for question_id, count in batch.items():
+            by_increment.setdefault(count, []).append(question_id)
+        try:
+            for count, question_ids in by_increment.items():
+                for start in range(0, len(question_ids), 500):
+                    Question.objects.filter(pk__in=question_ids[start:start + 500]).update(views=F('views') + count)
+                    for question_id in question_ids[start:start + 500]:
+                        del batch[question_id]
+        except Exception:
+            # Put what was not written back so the next flush retries it
+            with self.lock:
+                for question_id, count in batch.items():
+                    self._pending[question_id] = self._pending.get(question_id, 0) + count
+            raise
+        finally:
+            with self.lock:
+                self._flushing = {}
+        return sum(len(question_ids) for question_ids in by_increment.values())
+
+
+question_views = ViewCountBuffer(settings.RITO_VIEW_COUNT_FLUSH_INTERVAL)
@@ -0,0 +1,216 @@
+# USER/coalesce.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Device, RitoAccount, RegistrationCode, SocialMediaAccount
+
+_MISS = object()
+
+
+class _Call:
+    """One in-flight synchronous computation and its outcome"""
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent computations.
+
+    Callers passing the same key while a computation for it is running wait
+    for that one and share its result (or exception) instead of running their
+    own; ``do`` serves threads and ``ado`` coroutines. A successful result is
+    then reused for ``fresh_for`` seconds, which absorbs immediate retries.
+    ``expire(*keys)`` drops the reused results of those keys (all keys when
+    none are given) and detaches computations already running for them: their
+    callers still get the result, but it is not stored and later callers
+    start a new computation.
+    """
+
+    def __init__(self, fresh_for, max_size=10000):
+        self.fresh_for = fresh_for
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.computed = 0
+        self.coalesced = 0
+        self.fresh_hits = 0
+        self._calls = {}  # key -> _Call
+        self._tasks = {}  # key -> asyncio.Task
+        self._fresh = OrderedDict()  # key -> (fresh_until, result)
+
+    def do(self, key, fn):
+        """Return ``fn()``, sharing it with concurrent callers of the same key"""
+        result = self._fresh_result(key)
+        if result is not _MISS:
+            return result
+
+        with self.lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.computed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                # Not stored when expire() detached it while it ran
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                    if call.error is None:
+                        self._store(key, call.result)
+            call.event.set()
+        return call.result
+
+    async def ado(self, key, fn):
+        """Async variant of ``do``; ``fn`` is a coroutine function"""
+        result = self._fresh_result(key)
+        if result is not _MISS:
+            return result
+
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            task = self._tasks.get(key)
+            if task is None or task.get_loop() is not loop:
+                task = loop.create_task(fn())
+                self._tasks[key] = task
+                task.add_done_callback(partial(self._finished, key))
+                self.computed += 1
+            else:
+                self.coalesced += 1
+        # Shielded: a caller that goes away does not cancel the others' computation
+        return await asyncio.shield(task)
+
+    def expire(self, *keys):
+        with self.lock:
+            if not keys:
+                self._fresh.clear()
+                self._calls.clear()
+                self._tasks.clear()
+            for key in keys:
+                self._fresh.pop(key, None)
+                self._calls.pop(key, None)
+                self._tasks.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'computed': self.computed,
+                'coalesced': self.coalesced,
+                'fresh_hits': self.fresh_hits,
+                'in_flight': len(self._calls) + len(self._tasks),
+                'fresh_entries': len(self._fresh),
+            }
+
+    def _finished(self, key, task):
+        with self.lock:
+            # exception() also marks a failure as retrieved when every caller left
+            failed = task.cancelled() or task.exception() is not None
+            # Not stored when expire() detached it while it ran
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+                if not failed:
+                    self._store(key, task.result())
+
+    def _fresh_result(self, key):
+        if self.fresh_for <= 0:
+            return _MISS
+        with self.lock:
+            entry = self._fresh.get(key)
+            if entry is None:
+                return _MISS
+            if entry[0] < time.monotonic():
+                del self._fresh[key]
+                return _MISS
+            self.fresh_hits += 1
+            return entry[1]
+
+    def _store(self, key, result):
+        # Caller holds the lock
+        if self.fresh_for <= 0:
+            return
+        self._fresh.pop(key, None)
+        self._fresh[key] = (time.monotonic() + self.fresh_for, result)
+        while len(self._fresh) > self.max_size:
+            self._fresh.popitem(last=False)
+
+
+# Shared by the read-mostly device endpoints; keys are (endpoint, ieda)
+device_requests = SingleFlight(fresh_for=settings.RITO_COALESCE_FRESH_FOR)
+
+# ========== INVALIDATION ==========
+# Each write expires only the requests of the device it belongs to, and only when it can
+# change a status payload (saves limited to other fields, e.g. a login's last_login, are
+# skipped). An account moved to another device leaves its old device's result in place
+# for up to fresh_for seconds.
+
+def expire_devices(iedas):
+    for ieda in iedas:
+        device_requests.expire(("status", ieda), ("web_status", ieda))
+
+def changes_payload(update_fields, fields):
+    return update_fields is None or not fields.isdisjoint(update_fields)
+
+def device_iedas(instance):
+    # The related device is usually loaded already; otherwise one query for its ieda
+    if instance.device_id is None:
+        return []
+    if type(instance).device.is_cached(instance):
+        return [instance.device.ieda]
+    return Device.objects.filter(pk=instance.device_id).values_list('ieda', flat=True)
+
+@receiver(post_save, sender=Device)
+def expire_saved_device(sender, instance, update_fields=None, **kwargs):
+    if changes_payload(update_fields, {'ieda', 'is_active'}):
+        expire_devices([instance.ieda])
+
+@receiver(post_delete, sender=Device)
+def expire_deleted_device(sender, instance, **kwargs):
+    expire_devices([instance.ieda])
+
+@receiver(post_save, sender=RitoAccount)
+def expire_saved_account_device(sender, instance, update_fields=None, **kwargs):
+    if changes_payload(update_fields, {'rito_id', 'user', 'device'}):
+        expire_devices(device_iedas(instance))
+
+@receiver(post_delete, sender=RitoAccount)
+@receiver(post_save, sender=RegistrationCode)
+@receiver(post_delete, sender=RegistrationCode)
+def expire_linked_device(sender, instance, **kwargs):
+    expire_devices(device_iedas(instance))
+
+@receiver(post_save, sender=SocialMediaAccount)
+@receiver(post_delete, sender=SocialMediaAccount)
+def expire_social_account_device(sender, instance, **kwargs):
+    expire_devices(Device.objects.filter(ritoaccount__pk=instance.rito_account_id).values_list('ieda', flat=True))
+
+@receiver(post_save, sender=User)
+def expire_user_device(sender, instance, created, update_fields=None, **kwargs):
+    # Only the username is shown; a new user has no device yet, and a deleted user's
+    # account is deleted first (cascade), which expires its device
+    if not created and changes_payload(update_fields, {'username'}):
+        expire_devices(Device.objects.filter(ritoaccount__user=instance).values_list('ieda', flat=True))
@@ -0,0 +1,116 @@
+# USER/exports.py
+import csv
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Device
+
+# Column name -> ORM path (RitoAccount columns come from a LEFT JOIN)
+EXPORT_COLUMNS = [
+    ('ieda', 'ieda'),
+    ('mac_address', 'mac_address'),
+    ('is_active', 'is_active'),
+    ('registered_at', 'registered_at'),
+    ('last_seen', 'last_seen'),
+    ('ip_address', 'ip_address'),
+    ('latitude', 'latitude'),
+    ('longitude', 'longitude'),
+    ('city', 'city'),
+    ('country', 'country'),
+    ('rito_id', 'ritoaccount__rito_id'),
+    ('username', 'ritoaccount__user__username'),
+]
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Lines are grouped into blocks of about this many characters before being written or compressed
+BLOCK_SIZE = 64 * 1024
+
+
+def iter_device_rows(chunk_size=2000):
+    """Yield one tuple per device in EXPORT_COLUMNS order, fetching ``chunk_size`` rows at a time"""
+    return (
+        Device.objects
+        .order_by('pk')
+        .values_list(*[path for _, path in EXPORT_COLUMNS])
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def ndjson_lines(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(names, row))) + '\n'
+
+
+class _LineBuffer:
+    """File-like target for csv.writer that hands back each formatted line"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def blocks(lines, size=BLOCK_SIZE):
+    """Join lines into encoded blocks of roughly ``size`` characters"""
+    pending = []
+    length = 0
+    for line in lines:
+        pending.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(pending).encode('utf-8')
+            pending = []
+            length = 0
+    if pending:
+        yield ''.join(pending).encode('utf-8')
+
+
+def gzip_blocks(chunks):
+    """Compress a stream of byte blocks into a gzip stream"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header/trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_devices(export_format='ndjson', compress=False, chunk_size=2000):
+    """
+    Stream the whole fleet as NDJSON or CSV byte blocks (optionally gzipped).
+    Rows are pulled from the database ``chunk_size`` at a time, so memory use
+    does not grow with the number of devices.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format!r} (use {' or '.join(EXPORT_FORMATS)})")
+    rows = iter_device_rows(chunk_size)
+    lines = ndjson_lines(rows) if export_format == 'ndjson' else csv_lines(rows)
+    output = blocks(lines)
+    return gzip_blocks(output) if compress else output
+
+
+async def aiter_blocks(chunks):
+    """
+    Async view of a block stream. Under ASGI, Django buffers synchronous
+    streaming content completely before sending it; pulling one block at a
+    time here keeps the export streaming (on the thread that owns the DB cursor).
+    """
+    iterator = iter(chunks)
+    done = object()
+    while True:
+        chunk = await sync_to_async(next, thread_sensitive=True)(iterator, done)
+        if chunk is done:
+            return
+        yield chunk
@@ -0,0 +1,96 @@
+# USER/fleet.py
+import base64
+from datetime import datetime, timedelta
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Device
+
+# Public field name -> ORM path for the fleet listing projection
+DEVICE_FIELDS = {
+    'ieda': 'ieda',
+    'mac_address': 'mac_address',
+    'is_active': 'is_active',
+    'registered_at': 'registered_at',
+    'last_seen': 'last_seen',
+    'ip_address': 'ip_address',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'city': 'city',
+    'country': 'country',
+    'geohash': 'geohash',
+    'rito_id': 'ritoaccount__rito_id',
+    'username': 'ritoaccount__user__username',
+}
+DEFAULT_FIELDS = ('ieda', 'is_active', 'last_seen', 'city', 'country')
+
+
+def encode_cursor(last_seen, device_id):
+    raw = f"{last_seen.isoformat()}|{device_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(last_seen, id)`` from a cursor (raises ValueError)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        last_seen, device_id = raw.split('|')
+        return datetime.fromisoformat(last_seen), int(device_id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_fields(fields):
+    """Validate a comma-separated ``fields=`` value (raises ValueError)"""
+    if not fields:
+        return list(DEFAULT_FIELDS)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in DEVICE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(DEVICE_FIELDS)})")
+    return list(dict.fromkeys(names))
+
+
+def list_devices(fields=None, cursor=None, limit=100, active=None, stale=None, stale_after=300,
+                 country=None, registered=None):
+    """
+    One page of the fleet, most recently seen first.
+
+    Pages are cut with a keyset on ``(last_seen, id)`` rather than OFFSET, so
+    every page is an index range scan no matter how deep it is. Returns
+    ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    names = parse_fields(fields)
+    queryset = Device.objects.all()
+    
+    if active is not None:
+        queryset = queryset.filter(is_active=active)
+    if stale is not None:
+        threshold = timezone.now() - timedelta(seconds=stale_after)
+        queryset = queryset.filter(last_seen__lt=threshold) if stale else queryset.filter(last_seen__gte=threshold)
+    if country:
+        queryset = queryset.filter(country=country)
+    if registered is not None:
+        queryset = queryset.filter(ritoaccount__isnull=not registered)
+    if cursor:
+        last_seen, device_id = decode_cursor(cursor)
+        # The leading last_seen__lte gives the database an index range to seek into;
+        # the OR alone would make it scan from the top of the index
+        queryset = queryset.filter(Q(last_seen__lte=last_seen), Q(last_seen__lt=last_seen) | Q(id__lt=device_id))
+    
+    projection = {name: F(DEVICE_FIELDS[name]) for name in names if DEVICE_FIELDS[name] != name}
+    rows = list(
+        queryset
+        .order_by('-last_seen', '-id')
+        .values('id', *[name for name in names if name not in projection], _last_seen=F('last_seen'), **projection)
+        [:limit + 1]
+    )
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['_last_seen'], rows[-1]['id'])
+    for row in rows:
+        del row['id'], row['_last_seen']
+    return rows, next_cursor
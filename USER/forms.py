@@ -247,4 +247,9 @@ class CommunityMemberProfileForm(forms.ModelForm):
                 'class': 'form-input',
                 'placeholder': 'Your website URL'
             }),
-        }
\ No newline at end of file
+        }
+
+
+class DeviceProvisioningForm(forms.Form):
+    file = forms.FileField(help_text="CSV or JSONL file of devices")
+    chunk_size = forms.IntegerField(initial=1000, min_value=1, max_value=10000, help_text="Records per transaction")
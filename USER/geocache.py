@@ -0,0 +1,154 @@
+# USER/geocache.py
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .geoip import GeoLocation
+from .models import IPLocation
+
+
+def network_key(ip_address):
+    """Return the /24 (IPv4) or /48 (IPv6) prefix an address belongs to"""
+    ip = ipaddress.ip_address(ip_address)
+    prefix = 24 if ip.version == 4 else 48
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+
+class GeoLocationCache:
+    """
+    TTL cache of geolocation results, persisted in the IPLocation table.
+
+    Results are stored under the exact IP and under its network prefix, so
+    a lookup for another address behind the same NAT or in the same /24
+    (/48 for IPv6) is served without resolving again. A bounded in-memory
+    LRU sits in front of the table; the table makes results survive
+    restarts and shares them between worker processes.
+    """
+
+    def __init__(self, ttl, max_memory_entries):
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+
+    def get(self, ip_address):
+        """Return a cached GeoLocation for the address (exact or prefix match) or None"""
+        keys = self._keys(ip_address)
+        if keys is None:
+            return None
+        location = self._from_memory(keys)
+        if location is None:
+            rows = IPLocation.objects.filter(key__in=keys, resolved_at__gte=self._fresh_after())
+            location = self._from_rows(keys, rows)
+        return self._count(keys, location)
+
+    def set(self, ip_address, location):
+        """Store a result under the address and its network prefix"""
+        keys = self._keys(ip_address)
+        if keys is None:
+            return
+        self._remember(keys, location)
+        IPLocation.objects.bulk_create(
+            self._rows(keys, location),
+            update_conflicts=True,
+            unique_fields=['key'],
+            update_fields=['latitude', 'longitude', 'city', 'country', 'resolved_at'],
+        )
+
+    def clear(self):
+        """Forget every cached result (e.g. after the GeoIP data changed)"""
+        with self.lock:
+            self._memory.clear()
+        IPLocation.objects.all().delete()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'prefix_hits': self.prefix_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+            }
+
+    def _keys(self, ip_address):
+        try:
+            return (str(ipaddress.ip_address(ip_address)), network_key(ip_address))
+        except ValueError:
+            return None
+
+    def _fresh_after(self):
+        return timezone.now() - timedelta(seconds=self.ttl)
+
+    def _from_memory(self, keys):
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    del self._memory[key]
+                    continue
+                self._memory.move_to_end(key)
+                return key, entry[1]
+        return None
+
+    def _from_rows(self, keys, rows):
+        by_key = {row.key: row for row in rows}
+        for key in keys:
+            row = by_key.get(key)
+            if row is not None:
+                location = GeoLocation(row.latitude, row.longitude, row.city, row.country)
+                remaining = self.ttl - (timezone.now() - row.resolved_at).total_seconds()
+                self._remember([key], location, remaining)
+                return key, location
+        return None
+
+    def _count(self, keys, match):
+        with self.lock:
+            if match is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if match[0] != keys[0]:
+                self.prefix_hits += 1
+        return match[1]
+
+    def _remember(self, keys, location, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            for key in keys:
+                self._memory[key] = (expires_at, location)
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _rows(self, keys, location):
+        now = timezone.now()
+        return [
+            IPLocation(
+                key=key,
+                latitude=location.latitude,
+                longitude=location.longitude,
+                city=location.city,
+                country=location.country,
+                resolved_at=now,
+            )
+            for key in keys
+        ]
+
+
+geo_cache = GeoLocationCache(
+    ttl=settings.RITO_GEO_CACHE_TTL,
+    max_memory_entries=settings.RITO_GEO_CACHE_MEMORY_SIZE,
+)
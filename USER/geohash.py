@@ -0,0 +1,101 @@
+# USER/geohash.py
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Stored precision for Device.geohash (~4.8m x 4.8m cells)
+DEVICE_PRECISION = 9
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=DEVICE_PRECISION):
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        target, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        if target >= middle:
+            value = (value << 1) | 1
+            bounds[0] = middle
+        else:
+            value <<= 1
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return ``(lat_degrees, lon_degrees)`` covered by one cell at this precision"""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def cover_bbox(min_lat, min_lon, max_lat, max_lon, max_cells=32):
+    """
+    Return a set of geohash prefixes whose cells together cover the box,
+    using the finest precision that needs at most ``max_cells`` cells.
+    Boxes crossing the antimeridian (min_lon > max_lon) are split in two.
+    """
+    if min_lon > max_lon:
+        return (cover_bbox(min_lat, min_lon, max_lat, 180.0, max_cells // 2 or 1)
+                | cover_bbox(min_lat, -180.0, max_lat, max_lon, max_cells // 2 or 1))
+    
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    for precision in range(DEVICE_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        lat_start = math.floor((min_lat + 90.0) / lat_step) * lat_step - 90.0
+        lon_start = math.floor((min_lon + 180.0) / lon_step) * lon_step - 180.0
+        rows = int(math.floor((max_lat - lat_start) / lat_step)) + 1
+        columns = int(math.floor((max_lon - lon_start) / lon_step)) + 1
+        if rows * columns <= max_cells or precision == 1:
+            cells = set()
+            for row in range(rows):
+                latitude = min(lat_start + (row + 0.5) * lat_step, 90.0)
+                for column in range(columns):
+                    longitude = min(lon_start + (column + 0.5) * lon_step, 180.0)
+                    cells.add(encode(latitude, longitude, precision))
+            return cells
+    return set()
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """Bounding box ``(min_lat, min_lon, max_lat, max_lon)`` around a circle"""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = latitude - lat_delta, latitude + lat_delta
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        # The circle reaches a pole: every longitude is in range
+        return max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0
+    lon_delta = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude)))))
+    min_lon, max_lon = longitude - lon_delta, longitude + lon_delta
+    if min_lon < -180.0:
+        min_lon += 360.0
+    if max_lon > 180.0:
+        max_lon -= 360.0
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two coordinates in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def prefix_range(prefix):
+    """``(low, high)`` bounds such that ``low <= geohash < high`` matches the prefix (index friendly)"""
+    return prefix, prefix + '{'  # '{' sorts right after 'z', the last base32 digit
@@ -0,0 +1,191 @@
+# USER/geoip.py
+import csv
+import ipaddress
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class GeoLocation(namedtuple('GeoLocation', ['latitude', 'longitude', 'city', 'country'])):
+    __slots__ = ()
+
+    @classmethod
+    def from_ipapi(cls, data):
+        """Build a location from an ipapi.co JSON response"""
+        return cls(
+            latitude=data.get('latitude'),
+            longitude=data.get('longitude'),
+            city=data.get('city', '') or '',
+            country=data.get('country_name', '') or '',
+        )
+
+
+class IPRangeTable:
+    """
+    Sorted, non-overlapping IP ranges for one address family.
+
+    ``starts``/``ends`` are parallel sorted integer arrays and ``location_ids``
+    points into the shared location list, so a lookup is one bisect.
+    IPv4 uses compact ``array('L')`` columns; IPv6 needs 128-bit ints and
+    keeps plain lists.
+    """
+
+    def __init__(self, rows, compact):
+        rows.sort()
+        make = (lambda values: array('L', values)) if compact else list
+        self.starts = make(row[0] for row in rows)
+        self.ends = make(row[1] for row in rows)
+        self.location_ids = array('L', (row[2] for row in rows))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, value):
+        index = bisect_right(self.starts, value) - 1
+        if index >= 0 and value <= self.ends[index]:
+            return self.location_ids[index]
+        return None
+
+
+class GeoIPDatabase:
+    """
+    Offline IP-to-location lookups backed by a CSV of IP ranges.
+
+    Each row is ``start_ip,end_ip,country,city,latitude,longitude`` with the
+    addresses either in dotted/colon notation or as integers. A header row
+    and ``#`` comments are ignored. The file is re-read automatically when
+    its modification time changes (checked at most every
+    ``check_interval`` seconds), so ``manage.py reload_geoip`` can swap the
+    data under running servers.
+    """
+
+    def __init__(self, path, check_interval=60):
+        self.path = str(path) if path else ''
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self._tables = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    @property
+    def loaded(self):
+        self._maybe_reload()
+        return self._tables is not None
+
+    def lookup(self, ip_address):
+        """Return the GeoLocation for an address, or None if unknown or no data is loaded"""
+        self._maybe_reload()
+        tables = self._tables
+        if tables is None:
+            return None
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+        ipv4, ipv6, locations = tables
+        location_id = (ipv4 if ip.version == 4 else ipv6).find(int(ip))
+        return locations[location_id] if location_id is not None else None
+
+    def stats(self):
+        self._maybe_reload()
+        if self._tables is None:
+            return {'loaded': False}
+        ipv4, ipv6, locations = self._tables
+        return {
+            'loaded': True,
+            'ipv4_ranges': len(ipv4),
+            'ipv6_ranges': len(ipv6),
+            'locations': len(locations),
+        }
+
+    def reload(self):
+        """Load the data file now; returns False if it does not exist"""
+        with self.lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                self._tables = None
+                self._mtime = None
+                return False
+            with open(self.path, newline='', encoding='utf-8') as handle:
+                self._tables = parse_ranges(handle)
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+            return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._checked_at and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if not self.path:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._tables = None
+            self._mtime = None
+            return
+        if mtime != self._mtime:
+            try:
+                self.reload()
+            except (OSError, ValueError):
+                logger.exception("GeoIP database reload failed")
+
+
+def parse_ip(value):
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return ipaddress.ip_address(number) if number > 0xFFFFFFFF else ipaddress.IPv4Address(number)
+    return ipaddress.ip_address(value)
+
+
+def parse_ranges(lines):
+    """Parse range CSV rows into ``(ipv4 table, ipv6 table, locations)``"""
+    ipv4_rows = []
+    ipv6_rows = []
+    locations = []
+    location_ids = {}
+    
+    for line_number, row in enumerate(csv.reader(lines), start=1):
+        if not row or row[0].lstrip().startswith('#'):
+            continue
+        try:
+            start, end = parse_ip(row[0]), parse_ip(row[1])
+        except (ValueError, IndexError):
+            if line_number == 1:
+                continue  # header
+            raise ValueError(f"Line {line_number}: invalid IP range {row[:2]}")
+        if start.version != end.version or int(start) > int(end):
+            raise ValueError(f"Line {line_number}: invalid IP range {row[:2]}")
+        
+        country = row[2].strip() if len(row) > 2 else ''
+        city = row[3].strip() if len(row) > 3 else ''
+        try:
+            latitude = float(row[4]) if len(row) > 4 and row[4].strip() else None
+            longitude = float(row[5]) if len(row) > 5 and row[5].strip() else None
+        except ValueError:
+            raise ValueError(f"Line {line_number}: invalid coordinates {row[4:6]}")
+        
+        location = GeoLocation(latitude, longitude, city, country)
+        location_id = location_ids.get(location)
+        if location_id is None:
+            location_id = location_ids[location] = len(locations)
+            locations.append(location)
+        
+        rows = ipv4_rows if start.version == 4 else ipv6_rows
+        rows.append((int(start), int(end), location_id))
+    
+    return IPRangeTable(ipv4_rows, compact=True), IPRangeTable(ipv6_rows, compact=False), locations
+
+
+geoip_database = GeoIPDatabase(settings.RITO_GEOIP_DATABASE, settings.RITO_GEOIP_CHECK_INTERVAL)
@@ -0,0 +1,156 @@
+# USER/geoqueue.py
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .buffers import PeriodicFlusher
+from .utils import LOCATION_FIELDS, apply_location, cached_location
+
+logger = logging.getLogger(__name__)
+
+
+class GeoResolutionQueue(PeriodicFlusher):
+    """
+    Bounded background queue for IP geolocation.
+
+    Requests call ``enqueue`` and return immediately; a small thread pool
+    resolves the addresses (through the shared geolocation cache) and the
+    flush thread writes finished results back with ``bulk_update``. A device
+    has at most one pending job: enqueueing it again just replaces the IP.
+    When ``max_pending`` jobs are waiting, new devices are dropped and will
+    be picked up on their next location report.
+    """
+
+    def __init__(self, interval, max_pending, workers):
+        super().__init__(interval)
+        self.max_pending = max_pending
+        self.workers = workers
+        self.enqueued = 0
+        self.collapsed = 0
+        self.dropped = 0
+        self.resolved = 0
+        self._pending = {}
+        self._results = {}
+        self._executor = None
+        self._executor_pid = None
+
+    def enqueue(self, device_id, ip_address):
+        """Queue a location refresh for a device; returns False if the queue is full"""
+        if not ip_address:
+            return False
+        
+        if self.write_through:
+            self._resolve(device_id, ip_address)
+            self.flush()
+            return True
+        
+        with self.lock:
+            if device_id in self._pending:
+                self._pending[device_id] = ip_address
+                self.collapsed += 1
+                return True
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending[device_id] = ip_address
+            self.enqueued += 1
+        
+        self._get_executor().submit(self._work, device_id)
+        self.start()
+        return True
+
+    async def aenqueue(self, device_id, ip_address):
+        """Async variant of ``enqueue`` (write-through lookups and writes run in a worker thread)"""
+        if self.write_through:
+            return await sync_to_async(self.enqueue)(device_id, ip_address)
+        return self.enqueue(device_id, ip_address)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'pending': len(self._pending),
+                'unwritten': len(self._results),
+                'enqueued': self.enqueued,
+                'collapsed': self.collapsed,
+                'dropped': self.dropped,
+                'resolved': self.resolved,
+            }
+
+    def stop(self):
+        """Let in-flight lookups finish, drop queued ones and write out the results"""
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        super().stop()
+
+    def flush(self):
+        """Write resolved locations back with one bulk_update per column set"""
+        from .models import Device
+
+        with self.lock:
+            if not self._results:
+                return 0
+            results, self._results = self._results, {}
+        
+        located = []
+        unlocated = []
+        for device_id, (ip_address, location) in results.items():
+            device = Device(pk=device_id, ip_address=ip_address)
+            if location is not None:
+                apply_location(device, location)
+                located.append(device)
+            else:
+                unlocated.append(device)
+        
+        try:
+            if located:
+                # Only the Device columns: the location history is a track of device-reported positions
+                Device.objects.bulk_update(located, LOCATION_FIELDS, batch_size=500)
+            if unlocated:
+                Device.objects.bulk_update(unlocated, ['ip_address'], batch_size=500)
+        except Exception:
+            # Keep the results (unless superseded) so the next flush retries them
+            with self.lock:
+                for device_id, result in results.items():
+                    self._results.setdefault(device_id, result)
+            raise
+        return len(results)
+
+    def _get_executor(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self.lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='GeoResolutionQueue'
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _work(self, device_id):
+        with self.lock:
+            ip_address = self._pending.pop(device_id, None)
+        if ip_address is None:
+            return
+        try:
+            self._resolve(device_id, ip_address)
+        except Exception:
+            logger.exception("Location resolution failed for device %s", device_id)
+        finally:
+            close_old_connections()
+
+    def _resolve(self, device_id, ip_address):
+        location = cached_location(ip_address)
+        with self.lock:
+            self._results[device_id] = (ip_address, location)
+            self.resolved += 1
+
+
+geo_queue = GeoResolutionQueue(
+    interval=settings.RITO_GEO_QUEUE_FLUSH_INTERVAL,
+    max_pending=settings.RITO_GEO_QUEUE_SIZE,
+    workers=settings.RITO_GEO_QUEUE_WORKERS,
+)
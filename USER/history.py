@@ -0,0 +1,167 @@
+# USER/history.py
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .buffers import PeriodicFlusher
+from .models import DeviceLocationPoint
+
+
+def to_microdegrees(value):
+    return int(round(float(value) * 1_000_000))
+
+
+class LocationHistoryBuffer(PeriodicFlusher):
+    """
+    Collects location points in memory and appends them with one bulk_create per flush
+    """
+
+    def __init__(self, interval):
+        super().__init__(interval)
+        self._points = []
+
+    def record(self, device_id, latitude, longitude, recorded_at=None):
+        """Append a point to the history of a device"""
+        if self._append(device_id, latitude, longitude, recorded_at):
+            self.schedule()
+
+    async def arecord(self, device_id, latitude, longitude, recorded_at=None):
+        """Async variant of ``record``"""
+        if self._append(device_id, latitude, longitude, recorded_at):
+            await self.aschedule()
+
+    def record_many(self, points):
+        """Append several ``(device_id, latitude, longitude, recorded_at)`` points"""
+        appended = [self._append(*point) for point in points]
+        if any(appended):
+            self.schedule()
+
+    def _append(self, device_id, latitude, longitude, recorded_at=None):
+        if latitude is None or longitude is None:
+            return False
+        point = DeviceLocationPoint(
+            device_id=device_id,
+            latitude_e6=to_microdegrees(latitude),
+            longitude_e6=to_microdegrees(longitude),
+            recorded_at=recorded_at or timezone.now(),
+        )
+        with self.lock:
+            self._points.append(point)
+        return True
+
+    def flush(self):
+        with self.lock:
+            if not self._points:
+                return 0
+            points, self._points = self._points, []
+        try:
+            DeviceLocationPoint.objects.bulk_create(points, batch_size=1000)
+        except Exception:
+            with self.lock:
+                self._points[:0] = points
+            raise
+        return len(points)
+
+
+location_history = LocationHistoryBuffer(settings.RITO_LOCATION_HISTORY_FLUSH_INTERVAL)
+
+
+def device_track(device_id, start, end, max_points):
+    """
+    Return ``(points, raw_count)`` for a device between ``start`` and ``end``.
+
+    When more than ``max_points`` rows fall in the range, they are merged into
+    ``max_points`` equal time buckets (sample-weighted average position,
+    timestamp of the bucket's first point).
+    """
+    rows = (
+        DeviceLocationPoint.objects
+        .filter(device_id=device_id, recorded_at__gte=start, recorded_at__lte=end)
+        .order_by('recorded_at')
+        .values_list('recorded_at', 'latitude_e6', 'longitude_e6', 'samples')
+    )
+    raw_count = rows.count()
+    if raw_count <= max_points:
+        return [
+            make_point(recorded_at, latitude_e6, longitude_e6, samples)
+            for recorded_at, latitude_e6, longitude_e6, samples in rows
+        ], raw_count
+
+    width = max((end - start).total_seconds() / max_points, 1e-6)
+    points = []
+    bucket = None
+    for recorded_at, latitude_e6, longitude_e6, samples in rows.iterator(chunk_size=2000):
+        # A row exactly at ``end`` belongs to the last bucket
+        index = min(int((recorded_at - start).total_seconds() // width), max_points - 1)
+        if bucket is None or bucket[0] != index:
+            if bucket is not None:
+                points.append(merge_bucket(bucket))
+            bucket = [index, recorded_at, 0, 0, 0]
+        bucket[2] += latitude_e6 * samples
+        bucket[3] += longitude_e6 * samples
+        bucket[4] += samples
+    if bucket is not None:
+        points.append(merge_bucket(bucket))
+    return points, raw_count
+
+
+def make_point(recorded_at, latitude_e6, longitude_e6, samples):
+    return {
+        'latitude': latitude_e6 / 1_000_000,
+        'longitude': longitude_e6 / 1_000_000,
+        'recorded_at': recorded_at.isoformat(),
+        'samples': samples,
+    }
+
+
+def merge_bucket(bucket):
+    _, recorded_at, latitude_sum, longitude_sum, samples = bucket
+    return make_point(recorded_at, round(latitude_sum / samples), round(longitude_sum / samples), samples)
+
+
+# Fixed origin so compaction buckets line up across runs
+BUCKET_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def compact_device_history(device_id, older_than, bucket_seconds):
+    """
+    Merge a device's points older than ``older_than`` into one row per
+    ``bucket_seconds`` bucket. Buckets that already hold a single row are
+    left alone, so the job is safe to re-run. Returns ``(rows removed, rows written)``.
+    """
+    buckets = {}
+    with transaction.atomic():
+        rows = (
+            DeviceLocationPoint.objects
+            .filter(device_id=device_id, recorded_at__lt=older_than)
+            .order_by('recorded_at')
+            .values_list('id', 'recorded_at', 'latitude_e6', 'longitude_e6', 'samples')
+        )
+        for point_id, recorded_at, latitude_e6, longitude_e6, samples in rows.iterator(chunk_size=2000):
+            index = int((recorded_at - BUCKET_EPOCH).total_seconds() // bucket_seconds)
+            bucket = buckets.setdefault(index, [[], 0, 0, 0])
+            bucket[0].append(point_id)
+            bucket[1] += latitude_e6 * samples
+            bucket[2] += longitude_e6 * samples
+            bucket[3] += samples
+
+        removed = []
+        merged = []
+        for index, (point_ids, latitude_sum, longitude_sum, samples) in buckets.items():
+            if len(point_ids) < 2:
+                continue
+            removed.extend(point_ids)
+            merged.append(DeviceLocationPoint(
+                device_id=device_id,
+                latitude_e6=round(latitude_sum / samples),
+                longitude_e6=round(longitude_sum / samples),
+                recorded_at=BUCKET_EPOCH + timedelta(seconds=index * bucket_seconds),
+                samples=samples,
+            ))
+
+        for offset in range(0, len(removed), 500):
+            DeviceLocationPoint.objects.filter(id__in=removed[offset:offset + 500]).delete()
+        DeviceLocationPoint.objects.bulk_create(merged, batch_size=1000)
+    return len(removed), len(merged)
@@ -0,0 +1,195 @@
+# USER/identity.py
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Device, RitoAccount
+
+
+class DeviceIdentity(namedtuple('DeviceIdentity', [
+    'device_id', 'ieda', 'account_id', 'rito_id', 'user_id', 'username', 'is_active',
+])):
+    """
+    Everything a device request needs to know about who a device belongs to.
+
+    The device's own is_active is included so a status check on a cache hit
+    needs no device query at all; every field here only changes through a
+    save that invalidates the entry. Pairing codes live in
+    ``registration.registration_codes``.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_device(cls, device):
+        """Build an identity from a Device loaded with ``select_related('ritoaccount__user')``"""
+        account = getattr(device, 'ritoaccount', None)
+        owner = account.user if account else None
+        return cls(
+            device_id=device.pk,
+            ieda=device.ieda,
+            account_id=account.pk if account else None,
+            rito_id=account.rito_id if account else None,
+            user_id=owner.pk if owner else None,
+            username=owner.username if owner else None,
+            is_active=device.is_active,
+        )
+
+    @property
+    def registered(self):
+        return self.account_id is not None
+
+
+class DeviceIdentityCache:
+    """
+    Bounded LRU read-through cache of ``ieda -> DeviceIdentity``.
+
+    Entries are dropped by post_save/post_delete on Device, RitoAccount and
+    User (see the receivers below). Those signals only fire in the process
+    that made the change, so entries also expire after ``ttl`` seconds to
+    bound staleness across worker processes.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._by_device = {}
+        self._by_account = {}
+        self._by_user = {}
+        self._generation = 0
+
+    def get(self, ieda):
+        """Return the cached identity for ``ieda`` or None"""
+        with self.lock:
+            entry = self._entries.get(ieda)
+            if entry is not None and entry[0] < time.monotonic():
+                self._discard(ieda)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ieda)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, identity, generation=None):
+        """
+        Cache an identity. Pass the ``generation`` read before loading it so a
+        load that raced with an invalidation is not cached.
+        """
+        with self.lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._discard(identity.ieda)
+            self._entries[identity.ieda] = (time.monotonic() + self.ttl, identity)
+            self._by_device[identity.device_id] = identity.ieda
+            if identity.account_id is not None:
+                self._by_account[identity.account_id] = identity.ieda
+            if identity.user_id is not None:
+                self._by_user.setdefault(identity.user_id, set()).add(identity.ieda)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, device_id=None, account_id=None, user_id=None):
+        """Drop every entry that references the given device, account or user"""
+        with self.lock:
+            self._generation += 1
+            iedas = set(self._by_user.get(user_id, ()))
+            if device_id in self._by_device:
+                iedas.add(self._by_device[device_id])
+            if account_id in self._by_account:
+                iedas.add(self._by_account[account_id])
+            for ieda in iedas:
+                self._discard(ieda)
+
+    def clear(self):
+        with self.lock:
+            self._generation += 1
+            self._entries.clear()
+            self._by_device.clear()
+            self._by_account.clear()
+            self._by_user.clear()
+
+    def resolve(self, ieda):
+        """Return the identity for ``ieda``, loading it on a miss (raises Device.DoesNotExist)"""
+        identity = self.get(ieda)
+        if identity is None:
+            generation = self._generation
+            device = Device.objects.select_related('ritoaccount__user').get(ieda=ieda)
+            identity = DeviceIdentity.from_device(device)
+            self.put(identity, generation)
+        return identity
+
+    async def aresolve(self, ieda):
+        """Async variant of ``resolve``"""
+        identity = self.get(ieda)
+        if identity is None:
+            generation = self._generation
+            device = await Device.objects.select_related('ritoaccount__user').aget(ieda=ieda)
+            identity = DeviceIdentity.from_device(device)
+            self.put(identity, generation)
+        return identity
+
+    def resolve_many(self, iedas):
+        """Return ``{ieda: identity}`` for the known devices, loading all misses with one query"""
+        identities = {}
+        missing = []
+        for ieda in set(iedas):
+            identity = self.get(ieda)
+            if identity is None:
+                missing.append(ieda)
+            else:
+                identities[ieda] = identity
+        
+        if missing:
+            generation = self._generation
+            for device in Device.objects.filter(ieda__in=missing).select_related('ritoaccount__user'):
+                identity = DeviceIdentity.from_device(device)
+                self.put(identity, generation)
+                identities[device.ieda] = identity
+        return identities
+
+    def _discard(self, ieda):
+        entry = self._entries.pop(ieda, None)
+        if entry is None:
+            return
+        identity = entry[1]
+        self._by_device.pop(identity.device_id, None)
+        self._by_account.pop(identity.account_id, None)
+        owned = self._by_user.get(identity.user_id)
+        if owned is not None:
+            owned.discard(ieda)
+            if not owned:
+                del self._by_user[identity.user_id]
+
+
+device_identity_cache = DeviceIdentityCache(
+    max_size=settings.RITO_IDENTITY_CACHE_SIZE,
+    ttl=settings.RITO_IDENTITY_CACHE_TTL,
+)
+
+# ========== CACHE INVALIDATION ==========
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_device_identity(sender, instance, **kwargs):
+    device_identity_cache.invalidate(device_id=instance.pk)
+
+@receiver(post_save, sender=RitoAccount)
+@receiver(post_delete, sender=RitoAccount)
+def invalidate_account_identity(sender, instance, **kwargs):
+    # The device id covers devices cached as unregistered that just got an account
+    device_identity_cache.invalidate(account_id=instance.pk, device_id=instance.device_id)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_identity(sender, instance, **kwargs):
+    device_identity_cache.invalidate(user_id=instance.pk)
@@ -0,0 +1,50 @@
+# USER/management/commands/compact_location_history.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from USER.history import compact_device_history
+from USER.models import DeviceLocationPoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge device location history older than --older-than days into --bucket second "
+        "buckets and delete points older than --retention days."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, default=7, help='Compact points older than this many days (default 7)')
+        parser.add_argument('--bucket', type=int, default=3600, help='Bucket size in seconds (default 3600)')
+        parser.add_argument('--retention', type=float, default=None, help='Delete points older than this many days')
+
+    def handle(self, *args, **options):
+        if options['bucket'] <= 0:
+            raise CommandError("--bucket must be positive")
+        
+        now = timezone.now()
+        if options['retention'] is not None:
+            deleted, _ = DeviceLocationPoint.objects.filter(
+                recorded_at__lt=now - timedelta(days=options['retention'])
+            ).delete()
+            self.stdout.write(f"Deleted {deleted} points past retention")
+        
+        older_than = now - timedelta(days=options['older_than'])
+        # Materialized: compacting rewrites the table an open SQLite cursor would still be reading
+        device_ids = list(
+            DeviceLocationPoint.objects
+            .filter(recorded_at__lt=older_than)
+            .values_list('device_id', flat=True)
+            .distinct()
+        )
+        
+        removed_total = written_total = 0
+        for device_id in device_ids:
+            removed, written = compact_device_history(device_id, older_than, options['bucket'])
+            removed_total += removed
+            written_total += written
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {removed_total} points into {written_total} buckets"
+        ))
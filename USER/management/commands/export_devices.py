@@ -0,0 +1,34 @@
+# USER/management/commands/export_devices.py
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from USER.exports import EXPORT_FORMATS, export_devices
+
+
+class Command(BaseCommand):
+    help = "Stream every device (with its Rito account) to a file or stdout as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--output', '-o', default='-', help='Output file (default stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size must be positive")
+        
+        blocks = export_devices(options['format'], compress=options['gzip'], chunk_size=options['chunk_size'])
+        written = 0
+        if options['output'] == '-':
+            for block in blocks:
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
+            return
+        
+        with open(options['output'], 'wb') as f:
+            for block in blocks:
+                f.write(block)
+                written += len(block)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
@@ -0,0 +1,47 @@
+# USER/management/commands/provision_devices.py
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from USER.provisioning import ProvisioningError, provision_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-create devices, Rito accounts and (optionally) users and social accounts from a CSV "
+        "(ieda,mac_address,username,platforms) or JSONL file. Progress is checkpointed after every "
+        "chunk; rerun with --resume to continue after a failure."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Records per transaction (default 1000)')
+        parser.add_argument('--resume', action='store_true', help='Skip records already handled by a previous run')
+        parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default <path>.checkpoint)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size must be positive")
+        
+        def progress(report):
+            self.stdout.write(f"  {report.offset} records handled, {report.rate:.0f}/s")
+        
+        try:
+            report = provision_file(
+                path,
+                chunk_size=options['chunk_size'],
+                resume=options['resume'],
+                checkpoint=options['checkpoint'],
+                progress=progress,
+            )
+        except ProvisioningError as e:
+            raise CommandError(str(e))
+        
+        for error in report.errors[:20]:
+            self.stderr.write(f"  {error}")
+        if len(report.errors) > 20:
+            self.stderr.write(f"  ... and {len(report.errors) - 20} more")
+        self.stdout.write(self.style.SUCCESS(report.summary()))
@@ -0,0 +1,13 @@
+# USER/management/commands/rebalance_trending_topics.py
+from django.core.management.base import BaseCommand
+
+from USER.trending import topic_trends
+
+
+class Command(BaseCommand):
+    help = ("Recompute the time-decayed trending topic scores from recent questions and answers. "
+            "Run it once after installing and then periodically (e.g. hourly from cron).")
+
+    def handle(self, *args, **options):
+        topics = topic_trends.rebalance()
+        self.stdout.write(self.style.SUCCESS(f"Rebalanced {topics} trending topics"))
@@ -0,0 +1,15 @@
+# USER/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand, CommandError
+
+from USER.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the community full-text search index (after bulk edits that bypass signals)."
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError("Full-text search needs the SQLite database backend")
+        
+        indexed = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} questions"))
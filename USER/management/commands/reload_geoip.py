@@ -0,0 +1,69 @@
+# USER/management/commands/reload_geoip.py
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from USER.geocache import geo_cache
+from USER.geoip import GeoIPDatabase, geoip_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Validate and (re)load the offline IP geolocation database. With --source the CSV "
+        "is installed atomically over RITO_GEOIP_DATABASE; running servers pick it up on "
+        "their next modification-time check."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help='CSV of IP ranges to install as the new database')
+
+    def handle(self, *args, **options):
+        target = geoip_database.path
+        if not target:
+            raise CommandError("RITO_GEOIP_DATABASE is not configured")
+        
+        source = options.get('source')
+        if source:
+            self.install(source, target)
+            # Cached results were resolved from the old data
+            geo_cache.clear()
+        
+        started = time.perf_counter()
+        try:
+            if not geoip_database.reload():
+                raise CommandError(f"GeoIP database not found: {target}")
+        except ValueError as e:
+            raise CommandError(f"Invalid GeoIP database: {e}")
+        elapsed = time.perf_counter() - started
+        
+        stats = geoip_database.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {stats['ipv4_ranges']} IPv4 and {stats['ipv6_ranges']} IPv6 ranges "
+            f"({stats['locations']} locations) from {target} in {elapsed:.2f}s"
+        ))
+
+    def install(self, source, target):
+        """Copy ``source`` over ``target`` atomically, after checking that it parses"""
+        if not os.path.exists(source):
+            raise CommandError(f"Source file not found: {source}")
+        
+        directory = os.path.dirname(os.path.abspath(target))
+        os.makedirs(directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.csv')
+        os.close(handle)
+        try:
+            shutil.copyfile(source, temp_path)
+            # Validate before the swap so a broken file never replaces a working one
+            GeoIPDatabase(temp_path).reload()
+            os.replace(temp_path, target)
+        except ValueError as e:
+            os.unlink(temp_path)
+            raise CommandError(f"Invalid GeoIP database {source}: {e}")
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        self.stdout.write(f"Installed {source} as {target}")
@@ -0,0 +1,18 @@
+# USER/management/commands/sweep_registration_codes.py
+from django.core.management.base import BaseCommand, CommandError
+
+from USER.registration import registration_codes
+
+
+class Command(BaseCommand):
+    help = "Delete expired device registration codes whose reissue window has passed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement (default 1000)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError("--batch-size must be positive")
+        
+        deleted = registration_codes.sweep(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired registration codes"))
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:16
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IPLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('resolved_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'IP Location',
+                'verbose_name_plural': 'IP Locations',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0002_iplocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceLocationPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude_e6', models.IntegerField()),
+                ('longitude_e6', models.IntegerField()),
+                ('recorded_at', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=1)),
+                ('device', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='location_points', to='USER.device')),
+            ],
+            options={
+                'verbose_name': 'Device Location Point',
+                'verbose_name_plural': 'Device Location Points',
+                'indexes': [models.Index(fields=['device', 'recorded_at'], name='location_point_device_time')],
+            },
+        ),
+    ]
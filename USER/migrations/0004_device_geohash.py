@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:20
+
+from django.db import migrations, models
+
+
+def backfill_geohash(apps, schema_editor):
+    from USER.geohash import encode
+    Device = apps.get_model('USER', 'Device')
+    located = Device.objects.filter(latitude__isnull=False, longitude__isnull=False).only('latitude', 'longitude')
+    batch = []
+    for device in located.iterator(chunk_size=2000):
+        device.geohash = encode(device.latitude, device.longitude)
+        batch.append(device)
+        if len(batch) >= 2000:
+            Device.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Device.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0003_devicelocationpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0004_device_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=6, unique=True)),
+                ('issued_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('window_started_at', models.DateTimeField()),
+                ('issue_count', models.PositiveIntegerField(default=1)),
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pairing_code', to='USER.device')),
+            ],
+            options={
+                'verbose_name': 'Registration Code',
+                'verbose_name_plural': 'Registration Codes',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0005_registrationcode'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['last_seen', 'id'], name='device_last_seen_id'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:39
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_vote_counts(apps, schema_editor):
+    for model_name in ('Question', 'Answer'):
+        model = apps.get_model('USER', model_name)
+        counts = {}
+        for relation, index in (('upvotes', 0), ('downvotes', 1)):
+            through = getattr(model, relation).through
+            target = model._meta.model_name
+            for object_id, votes in through.objects.values_list(target).annotate(n=Count('pk')):
+                counts.setdefault(object_id, [0, 0])[index] = votes
+        batch = []
+        for object_id, (up, down) in counts.items():
+            batch.append(model(pk=object_id, upvote_count=up, downvote_count=down, score=up - down))
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['upvote_count', 'downvote_count', 'score'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['upvote_count', 'downvote_count', 'score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0006_device_last_seen_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='downvote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='upvote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='downvote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='upvote_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_vote_counts, migrations.RunPython.noop),
+    ]
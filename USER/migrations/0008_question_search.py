@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    statements = [
+        "CREATE VIRTUAL TABLE USER_question_fts USING fts5("
+        "title, content, answers, tokenize = 'porter unicode61 remove_diacritics 2')",
+        # Rank by bm25 with weights title 10, content 4, answers 1
+        "INSERT INTO USER_question_fts (USER_question_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')",
+        "INSERT INTO USER_questionsearchdocument (question_id) SELECT id FROM USER_question WHERE is_active",
+        "INSERT INTO USER_question_fts (rowid, title, content, answers) "
+        "SELECT d.id, q.title, q.content, "
+        "(SELECT group_concat(content, char(10)) FROM "
+        "(SELECT a.content FROM USER_answer a WHERE a.question_id = q.id AND a.is_active ORDER BY a.created_at)) "
+        "FROM USER_questionsearchdocument d JOIN USER_question q ON q.id = d.question_id",
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS USER_question_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0007_vote_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='USER.question')),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 19:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0008_question_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicTrend',
+            fields=[
+                ('topic', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='USER.topic')),
+                ('score', models.FloatField(db_index=True, default=0)),
+                ('origin', models.FloatField()),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0009_topic_trends'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RitoWorkerLease',
+            fields=[
+                ('worker_id', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('holder', models.CharField(max_length=255)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:17
+
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+# Codes printed on devices before RegistrationCode existed never expired; they stay
+# valid this long after the upgrade, then the device has to refresh its code
+MIGRATED_CODE_TTL = timedelta(days=7)
+
+
+def move_registration_codes(apps, schema_editor):
+    Device = apps.get_model('USER', 'Device')
+    RegistrationCode = apps.get_model('USER', 'RegistrationCode')
+    RitoAccount = apps.get_model('USER', 'RitoAccount')
+    now = timezone.now()
+    taken = set(RegistrationCode.objects.values_list('code', flat=True))
+    has_code = set(RegistrationCode.objects.values_list('device_id', flat=True))
+    paired = set(RitoAccount.objects.filter(device__isnull=False).values_list('device_id', flat=True))
+    batch = []
+    devices = Device.objects.exclude(registration_code='').order_by('pk').values_list('pk', 'registration_code')
+    for device_id, code in devices.iterator():
+        # Codes were not unique per device: the first device keeps a shared one, the others refresh
+        if device_id in has_code or device_id in paired or code in taken:
+            continue
+        taken.add(code)
+        batch.append(RegistrationCode(
+            device_id=device_id, code=code, issued_at=now, expires_at=now + MIGRATED_CODE_TTL,
+            window_started_at=now, issue_count=0,
+        ))
+        if len(batch) >= 2000:
+            RegistrationCode.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        RegistrationCode.objects.bulk_create(batch)
+
+
+def restore_registration_codes(apps, schema_editor):
+    Device = apps.get_model('USER', 'Device')
+    RegistrationCode = apps.get_model('USER', 'RegistrationCode')
+    batch = [
+        Device(pk=device_id, registration_code=code)
+        for device_id, code in RegistrationCode.objects.values_list('device_id', 'code')
+    ]
+    Device.objects.bulk_update(batch, ['registration_code'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('USER', '0010_rito_worker_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_registration_codes, restore_registration_codes),
+        migrations.RemoveField(
+            model_name='device',
+            name='registration_code',
+        ),
+    ]
@@ -15,13 +15,11 @@ from django.utils import timezone
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-import requests
-import json
 
 def generate_rito_id():
-    timestamp = str(int(timezone.now().timestamp()))
-    random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"RITO-{timestamp[-6:]}-{random_str}"
+    """Allocate a unique Rito ID (no database round trip per ID)"""
+    from .ritoid import rito_ids
+    return rito_ids.next_id()
 
 def generate_registration_code():
     """Generate a 6-digit registration code"""
@@ -30,7 +28,6 @@ def generate_registration_code():
 class Device(models.Model):
     ieda = models.CharField(max_length=64, unique=True)
     mac_address = models.CharField(max_length=17, unique=True)
-    registration_code = models.CharField(max_length=6, default=generate_registration_code)
     registered_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     last_seen = models.DateTimeField(auto_now=True)
@@ -39,28 +36,34 @@ class Device(models.Model):
     longitude = models.FloatField(null=True, blank=True)
     city = models.CharField(max_length=100, blank=True)
     country = models.CharField(max_length=100, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True)
+    
+    class Meta:
+        # Keyset pagination of the fleet listing walks this index
+        indexes = [models.Index(fields=['last_seen', 'id'], name='device_last_seen_id')]
     
     def __str__(self):
         return f"Device {self.ieda[:8]}..."
     
+    def save(self, *args, **kwargs):
+        self.refresh_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+    
+    def refresh_geohash(self):
+        """Keep the spatial index column in step with latitude/longitude"""
+        from .geohash import encode
+        if self.latitude is None or self.longitude is None:
+            self.geohash = ''
+        else:
+            self.geohash = encode(self.latitude, self.longitude)
+    
     def update_location(self, ip_address=None):
         """Update device location based on IP address"""
-        if not ip_address:
-            return
-            
-        self.ip_address = ip_address
-        try:
-            # Using ipapi.co for location data (free tier available)
-            response = requests.get(f'http://ipapi.co/{ip_address}/json/')
-            if response.status_code == 200:
-                data = response.json()
-                self.latitude = data.get('latitude')
-                self.longitude = data.get('longitude')
-                self.city = data.get('city', '')
-                self.country = data.get('country_name', '')
-                self.save()
-        except Exception as e:
-            print(f"Location update failed: {e}")
+        from .utils import update_device_location
+        return update_device_location(self, ip_address)
     
     @property
     def location_string(self):
@@ -71,6 +74,62 @@ class Device(models.Model):
         else:
             return "Location unknown"
 
+class DeviceLocationPoint(models.Model):
+    """Append-only device location history (coordinates in integer microdegrees)"""
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='location_points', db_index=False)
+    latitude_e6 = models.IntegerField()
+    longitude_e6 = models.IntegerField()
+    recorded_at = models.DateTimeField()
+    samples = models.PositiveIntegerField(default=1)  # > 1 once compacted into a bucket
+    
+    class Meta:
+        indexes = [models.Index(fields=['device', 'recorded_at'], name='location_point_device_time')]
+        verbose_name = 'Device Location Point'
+        verbose_name_plural = 'Device Location Points'
+    
+    def __str__(self):
+        return f"{self.device_id} @ {self.recorded_at:%Y-%m-%d %H:%M:%S}"
+    
+    @property
+    def latitude(self):
+        return self.latitude_e6 / 1_000_000
+    
+    @property
+    def longitude(self):
+        return self.longitude_e6 / 1_000_000
+
+class IPLocation(models.Model):
+    """Cached geolocation result for an IP address or its network prefix (/24 or /48)"""
+    key = models.CharField(max_length=64, unique=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    country = models.CharField(max_length=100, blank=True)
+    resolved_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'IP Location'
+        verbose_name_plural = 'IP Locations'
+    
+    def __str__(self):
+        return f"{self.key} ({self.city}, {self.country})"
+
+class RegistrationCode(models.Model):
+    """The current pairing code of a device (one row per device, looked up by code)"""
+    device = models.OneToOneField(Device, on_delete=models.CASCADE, related_name='pairing_code')
+    code = models.CharField(max_length=6, unique=True)
+    issued_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    window_started_at = models.DateTimeField()  # start of the current reissue-limit window
+    issue_count = models.PositiveIntegerField(default=1)
+    
+    class Meta:
+        verbose_name = 'Registration Code'
+        verbose_name_plural = 'Registration Codes'
+    
+    def __str__(self):
+        return f"{self.code} -> {self.device_id}"
+
 class RitoAccount(models.Model):
     name = models.CharField(max_length=100, default="ERROR")
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -83,13 +142,8 @@ class RitoAccount(models.Model):
         return self.rito_id
 
     def generate_custom_rito_id(self):
-        """Generate a unique Rito ID in format RITO-XXXXXX"""
-        while True:
-            random_part = uuid.uuid4().hex[:6].upper()
-            rito_id = f"RITO-{random_part}"
-            
-            if not RitoAccount.objects.filter(rito_id=rito_id).exists():
-                return rito_id
+        """Generate a unique Rito ID in format RITO-XXXXXXXXXXXXX"""
+        return generate_rito_id()
     
     def save(self, *args, **kwargs):
         if not self.rito_id:
@@ -102,18 +156,10 @@ def create_user_rito_account(sender, instance, created, **kwargs):
     if created:
         # Check if RitoAccount already exists for this user
         if not hasattr(instance, 'ritoaccount'):
-            # Generate unique Rito ID first
-            while True:
-                random_part = uuid.uuid4().hex[:6].upper()
-                rito_id = f"RITO-{random_part}"
-                
-                if not RitoAccount.objects.filter(rito_id=rito_id).exists():
-                    break
-            
-            # Create RitoAccount with generated Rito ID
+            # Create RitoAccount with an allocated Rito ID
             RitoAccount.objects.create(
                 user=instance, 
-                rito_id=rito_id,
+                rito_id=generate_rito_id(),
                 name=instance.username
             )
 
@@ -271,6 +317,11 @@ class Question(models.Model):
     downvotes = models.ManyToManyField(CommunityMember, related_name='downvoted_questions', blank=True)
     followers = models.ManyToManyField(CommunityMember, related_name='followed_questions', blank=True)
     
+    # Vote totals, kept in step with upvotes/downvotes by the m2m_changed handlers below
+    upvote_count = models.IntegerField(default=0)
+    downvote_count = models.IntegerField(default=0)
+    score = models.IntegerField(default=0)
+    
     class Meta:
         ordering = ['-created_at']
     
@@ -293,7 +344,7 @@ class Question(models.Model):
     
     @property
     def vote_count(self):
-        return self.upvotes.count() - self.downvotes.count()
+        return self.score
     
     @property
     def answers_count(self):
@@ -318,6 +369,11 @@ class Answer(models.Model):
     downvotes = models.ManyToManyField(CommunityMember, related_name='downvoted_answers', blank=True)
     is_accepted = models.BooleanField(default=False)
     
+    # Vote totals, kept in step with upvotes/downvotes by the m2m_changed handlers below
+    upvote_count = models.IntegerField(default=0)
+    downvote_count = models.IntegerField(default=0)
+    score = models.IntegerField(default=0)
+    
     class Meta:
         ordering = ['-is_accepted', '-created_at']
         unique_together = ['question', 'author']
@@ -327,7 +383,7 @@ class Answer(models.Model):
     
     @property
     def vote_count(self):
-        return self.upvotes.count() - self.downvotes.count()
+        return self.score
     
     def accept_answer(self):
         # Unaccept any previously accepted answer for this question
@@ -441,8 +497,46 @@ class Bookmark(models.Model):
     def __str__(self):
         return f"{self.user.name} bookmarked {self.question.title}"
 
+class QuestionSearchDocument(models.Model):
+    """
+    Integer row id of a question in the SQLite full-text index (USER_question_fts,
+    maintained by USER/search.py); deleting the question removes its index row.
+    """
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='search_document')
+    
+    def __str__(self):
+        return f"Search document for {self.question_id}"
+
+class RitoWorkerLease(models.Model):
+    """
+    Rito ID allocator worker id held by one process (USER/ritoid.py); a lease
+    past ``expires_at`` may be taken over by another process.
+    """
+    worker_id = models.PositiveSmallIntegerField(primary_key=True)
+    holder = models.CharField(max_length=255)
+    expires_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Worker {self.worker_id} ({self.holder})"
+
+class TopicTrend(models.Model):
+    """
+    Time-decayed activity score of a topic (maintained by USER/trending.py).
+    ``score`` is expressed at ``origin`` (unix seconds), which every row
+    shares, so ordering by it ranks topics by their current decayed score.
+    """
+    topic = models.OneToOneField(Topic, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    score = models.FloatField(default=0, db_index=True)
+    origin = models.FloatField()
+    last_activity = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Trend of {self.topic_id}: {self.score:.3g}"
+
 # Signal handlers for updating counts
-from django.db.models.signals import post_save, post_delete
+from collections import Counter
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 
 @receiver(post_save, sender=Question)
@@ -461,4 +555,55 @@ def update_member_answer_count(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=Answer)
 def update_question_answer_count(sender, instance, **kwargs):
     # This would be handled by the property, but we can cache it if needed
-    pass
\ No newline at end of file
+    pass
+
+# Vote counters: every change to an upvotes/downvotes relation (either side,
+# add/remove/clear) becomes F() increments of the stored counts and score.
+VOTE_RELATIONS = {
+    Question.upvotes.through: (Question, 'upvote_count', 1),
+    Question.downvotes.through: (Question, 'downvote_count', -1),
+    Answer.upvotes.through: (Answer, 'upvote_count', 1),
+    Answer.downvotes.through: (Answer, 'downvote_count', -1),
+}
+
+def _voted_ids(sender, model, instance, reverse, pk_set):
+    """Ids of the voted questions/answers behind the given relation rows (one per existing row)"""
+    target_field = model._meta.model_name
+    if not reverse:
+        rows = sender.objects.filter(**{target_field: instance.pk})
+        if pk_set is not None:
+            rows = rows.filter(communitymember__in=pk_set)
+        return [instance.pk] * rows.count()
+    rows = sender.objects.filter(communitymember=instance.pk)
+    if pk_set is not None:
+        rows = rows.filter(**{f'{target_field}__in': pk_set})
+    return list(rows.values_list(target_field, flat=True))
+
+def _apply_vote_change(model, count_field, weight, voted_ids, sign):
+    by_delta = {}
+    for object_id, votes in Counter(voted_ids).items():
+        by_delta.setdefault(votes * sign, []).append(object_id)
+    for delta, object_ids in by_delta.items():
+        model.objects.filter(pk__in=object_ids).update(**{
+            count_field: F(count_field) + delta,
+            'score': F('score') + delta * weight,
+        })
+
+@receiver(m2m_changed)
+def update_vote_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    relation = VOTE_RELATIONS.get(sender)
+    if relation is None:
+        return
+    model, count_field, weight = relation
+    
+    if action == 'post_add':
+        # pk_set only holds the rows that were actually inserted
+        voted_ids = [instance.pk] * len(pk_set) if not reverse else list(pk_set)
+        _apply_vote_change(model, count_field, weight, voted_ids, 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # Count the rows that exist before they go (removing a missing vote is a no-op)
+        pending = instance.__dict__.setdefault('_pending_vote_removals', {})
+        pending[sender] = _voted_ids(sender, model, instance, reverse, pk_set if action == 'pre_remove' else None)
+    elif action in ('post_remove', 'post_clear'):
+        voted_ids = instance.__dict__.get('_pending_vote_removals', {}).pop(sender, [])
+        _apply_vote_change(model, count_field, weight, voted_ids, -1)
@@ -0,0 +1,209 @@
+# USER/presence.py
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .buffers import PeriodicFlusher, last_seen_buffer
+from .models import Device
+
+ONLINE = 'online'
+STALE = 'stale'
+OFFLINE = 'offline'
+
+
+class PresenceTracker(PeriodicFlusher):
+    """
+    In-memory online/stale sets fed by every heartbeat.
+
+    Both sets are kept in heartbeat order, so the periodic sweep only pops
+    the entries that expired (online -> stale after ``stale_after`` seconds of
+    silence, stale -> dropped/offline after ``offline_after``) and every count
+    is a ``len()``. The fleet total comes from a count refreshed by the sweep
+    every ``total_refresh`` seconds and kept current by Device signals.
+
+    Heartbeats are only seen by the process that handled them. On its first
+    sweep a process seeds itself from recent ``Device.last_seen`` values (an
+    index range scan), and every ``resync_every`` seconds it merges in the
+    values written since, so heartbeats handled by other workers show up here
+    once their last_seen is flushed (``resync_every`` plus the last_seen
+    buffer interval at most).
+    """
+
+    def __init__(self, stale_after, offline_after, sweep_interval, total_refresh, resync_every):
+        super().__init__(sweep_interval)
+        self.stale_after = stale_after
+        self.offline_after = offline_after
+        self.total_refresh = total_refresh
+        self.resync_every = resync_every
+        self._online = OrderedDict()  # device_id -> last heartbeat (unix seconds), oldest first
+        self._stale = OrderedDict()
+        self._total = None
+        self._total_refreshed = 0.0
+        self._seeded = False
+        self._synced_at = None  # when the last seed read Device.last_seen
+        self._synced = 0.0
+
+    def touch_many(self, device_ids, timestamp=None):
+        """Record heartbeats (called by last_seen_buffer; no database access)"""
+        seen = timestamp.timestamp() if timestamp else time.time()
+        with self.lock:
+            for device_id in device_ids:
+                self._stale.pop(device_id, None)
+                current = self._online.get(device_id)
+                if current is None or seen >= current:
+                    self._online[device_id] = seen
+                    self._online.move_to_end(device_id)
+        self.start()
+
+    def state(self, device_id):
+        """Return ONLINE, STALE or OFFLINE for a device"""
+        self.refresh()
+        with self.lock:
+            if device_id in self._online:
+                return ONLINE
+            if device_id in self._stale:
+                return STALE
+        return OFFLINE
+
+    def counts(self):
+        """Online/stale/offline/total device counts"""
+        self.refresh()
+        total = self.total()
+        with self.lock:
+            online, stale = len(self._online), len(self._stale)
+        return {
+            ONLINE: online,
+            STALE: stale,
+            OFFLINE: max(total - online - stale, 0),
+            'total': total,
+        }
+
+    def members(self, state, limit=100):
+        """``[(device_id, last heartbeat datetime)]`` in ONLINE or STALE, most recent first"""
+        self.refresh()
+        with self.lock:
+            entries = self._online if state == ONLINE else self._stale
+            recent = []
+            for device_id in reversed(entries):
+                if len(recent) >= limit:
+                    break
+                recent.append((device_id, entries[device_id]))
+        return [
+            (device_id, datetime.fromtimestamp(seen, dt_timezone.utc))
+            for device_id, seen in recent
+        ]
+
+    def total(self):
+        if self._total is None:
+            self.refresh_total()
+        return self._total
+
+    def refresh_total(self):
+        self._total = Device.objects.count()
+        self._total_refreshed = time.monotonic()
+
+    def adjust_total(self, delta):
+        with self.lock:
+            if self._total is not None:
+                self._total += delta
+
+    def forget(self, device_id):
+        with self.lock:
+            self._online.pop(device_id, None)
+            self._stale.pop(device_id, None)
+
+    def refresh(self):
+        """Without a sweep thread (interval <= 0) readers sweep on demand"""
+        if self.write_through or not self._seeded:
+            self.flush()
+        else:
+            self.start()
+
+    def seed(self):
+        """
+        Merge devices seen within ``offline_after`` (per Device.last_seen) into
+        the sets; after the first call only rows written since the last one
+        """
+        now = timezone.now()
+        since = now - timedelta(seconds=self.offline_after)
+        if self._synced_at is not None:
+            # Only rows written since the last seed; last_seen lags its write by up to a buffer interval
+            overlap = timedelta(seconds=self.resync_every + max(last_seen_buffer.interval, 0))
+            since = max(since, self._synced_at - overlap)
+        recent = (
+            Device.objects
+            .filter(last_seen__gte=since)
+            .order_by('last_seen')
+            .values_list('pk', 'last_seen')
+        )
+        loaded = {device_id: last_seen.timestamp() for device_id, last_seen in recent}
+        with self.lock:
+            for device_id, seen in list(self._online.items()) + list(self._stale.items()):
+                if seen >= loaded.get(device_id, 0):
+                    loaded[device_id] = seen
+            self._online = OrderedDict(sorted(loaded.items(), key=lambda item: item[1]))
+            self._stale = OrderedDict()
+            self._seeded = True
+            self._synced_at = now
+            self._synced = time.monotonic()
+
+    def flush(self):
+        """Sweep: merge other workers' heartbeats, demote silent devices and refresh the fleet total when due"""
+        if not self._seeded or time.monotonic() - self._synced >= self.resync_every:
+            self.seed()
+
+        now = time.time()
+        stale_before = now - self.stale_after
+        offline_before = now - self.offline_after
+        moved = 0
+        with self.lock:
+            while self._online:
+                device_id, seen = next(iter(self._online.items()))
+                if seen >= stale_before:
+                    break
+                del self._online[device_id]
+                if seen >= offline_before:
+                    self._stale[device_id] = seen
+                moved += 1
+            while self._stale:
+                device_id, seen = next(iter(self._stale.items()))
+                if seen >= offline_before:
+                    break
+                del self._stale[device_id]
+                moved += 1
+
+        if self._total is None or time.monotonic() - self._total_refreshed >= self.total_refresh:
+            self.refresh_total()
+        return moved
+
+
+device_presence = PresenceTracker(
+    stale_after=settings.RITO_DEVICE_STALE_AFTER,
+    offline_after=settings.RITO_DEVICE_OFFLINE_AFTER,
+    sweep_interval=settings.RITO_PRESENCE_SWEEP_INTERVAL,
+    total_refresh=settings.RITO_PRESENCE_TOTAL_REFRESH,
+    resync_every=settings.RITO_PRESENCE_RESYNC_INTERVAL,
+)
+last_seen_buffer.listeners.append(device_presence.touch_many)
+
+
+def presence_badge(request):
+    """Unfold sidebar badge: devices online right now"""
+    return device_presence.counts()[ONLINE]
+
+# ========== FLEET TOTAL ==========
+
+@receiver(post_save, sender=Device)
+def count_created_device(sender, instance, created, **kwargs):
+    if created:
+        device_presence.adjust_total(1)
+
+@receiver(post_delete, sender=Device)
+def count_deleted_device(sender, instance, **kwargs):
+    device_presence.adjust_total(-1)
+    device_presence.forget(instance.pk)
@@ -0,0 +1,303 @@
+# USER/provisioning.py
+import csv
+import io
+import json
+import os
+import time
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import Device, RitoAccount, SocialMediaAccount
+from .ritoid import rito_ids
+from .utils import generate_username
+
+PLATFORMS = {choice for choice, _ in SocialMediaAccount.PLATFORM_CHOICES}
+
+
+class ProvisioningError(Exception):
+    """Raised for unreadable input files"""
+
+
+def read_records(stream, name=''):
+    """
+    Yield ``{'ieda', 'mac_address', 'username', 'platforms'}`` dicts from a CSV
+    (header row required) or JSONL text stream. ``platforms`` is a list, given
+    as ``instagram;youtube`` in CSV or as a JSON list.
+    """
+    first = stream.readline()
+    if not first:
+        return
+    if name.lower().endswith(('.jsonl', '.ndjson')) or first.lstrip().startswith('{'):
+        lines = (line for line in _chain(first, stream) if line.strip())
+        for number, line in enumerate(lines, 1):
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise ProvisioningError(f"Line {number}: invalid JSON ({e})")
+            if not isinstance(row, dict):
+                raise ProvisioningError(f"Line {number}: expected an object")
+            if not isinstance(row.get('platforms') or [], (list, str)):
+                raise ProvisioningError(f"Line {number}: platforms must be a list")
+            yield _normalize(row)
+    else:
+        for row in csv.DictReader(_chain(first, stream)):
+            yield _normalize(row)
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def _normalize(row):
+    platforms = row.get('platforms') or []
+    if isinstance(platforms, str):
+        platforms = platforms.replace(',', ';').split(';')
+    return {
+        'ieda': str(row.get('ieda') or '').strip(),
+        'mac_address': str(row.get('mac_address') or row.get('mac') or '').strip(),
+        'username': str(row.get('username') or '').strip(),
+        'platforms': sorted({str(platform).strip().lower() for platform in platforms if str(platform).strip()}),
+    }
+
+
+class ProvisioningReport:
+    """Running totals of one provisioning run"""
+
+    def __init__(self, offset=0):
+        self.offset = offset  # input records handled, including previous runs
+        self.processed = 0
+        self.devices = 0
+        self.accounts = 0
+        self.users = 0
+        self.social_accounts = 0
+        self.skipped = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"{self.processed} records in {self.elapsed:.1f}s ({self.rate:.0f}/s): "
+            f"{self.devices} devices, {self.accounts} accounts, {self.users} users, "
+            f"{self.social_accounts} social accounts, {self.skipped} skipped, {len(self.errors)} errors"
+        )
+
+
+class DeviceProvisioner:
+    """
+    Bulk-creates devices with their accounts in chunks.
+
+    Each chunk costs a fixed handful of queries: existing rows are looked up
+    with ``__in`` filters, rows are written with ``bulk_create`` (so no
+    post_save receivers run) inside one transaction, and Rito IDs come from
+    the allocator. When ``checkpoint`` is given, the number of records handled
+    is saved after every committed chunk so a rerun can resume there; records
+    whose IEDA or MAC already exists are skipped, so replaying a chunk is safe.
+    """
+
+    def __init__(self, chunk_size=1000, checkpoint=None):
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+
+    def load_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            return json.load(f).get('offset', 0)
+
+    def save_checkpoint(self, offset):
+        if not self.checkpoint:
+            return
+        tmp_path = f"{self.checkpoint}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'offset': offset}, f)
+        os.replace(tmp_path, self.checkpoint)
+
+    def run(self, records, resume=False, progress=None):
+        """Provision every record; ``progress(report)`` is called after each chunk"""
+        offset = self.load_checkpoint() if resume else 0
+        report = ProvisioningReport(offset)
+
+        chunk = []
+        for index, record in enumerate(records):
+            if index < offset:
+                continue
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self._commit_chunk(chunk, report, progress)
+                chunk = []
+        if chunk:
+            self._commit_chunk(chunk, report, progress)
+        return report
+
+    def _commit_chunk(self, chunk, report, progress):
+        with transaction.atomic():
+            self.provision_chunk(chunk, report)
+        report.offset += len(chunk)
+        report.processed += len(chunk)
+        self.save_checkpoint(report.offset)
+        if progress:
+            progress(report)
+
+    def provision_chunk(self, records, report):
+        """Create the rows for one chunk (call inside a transaction)"""
+        records = self._valid_records(records, report)
+        if not records:
+            return
+
+        accounts_by_user = self._resolve_users(records, report)
+        records = [record for record in records if not record.get('skip')]
+
+        devices = Device.objects.bulk_create([
+            Device(ieda=record['ieda'], mac_address=record['mac_address']) for record in records
+        ])
+        if any(device.pk is None for device in devices):
+            device_ids = dict(Device.objects.filter(ieda__in=[d.ieda for d in devices]).values_list('ieda', 'pk'))
+            for device in devices:
+                device.pk = device_ids[device.ieda]
+        report.devices += len(devices)
+
+        new_accounts = []
+        attached = []
+        record_accounts = []
+        rito_id_pool = iter(rito_ids.allocate(len(records)))
+        for record, device in zip(records, devices):
+            account = accounts_by_user.get(record['username'])
+            if account is not None:
+                account.device_id = device.pk
+                attached.append(account)
+            else:
+                user = record.get('user')
+                account = RitoAccount(
+                    device_id=device.pk,
+                    user=user,
+                    rito_id=next(rito_id_pool),
+                    name=f"{user.username}'s Account" if user else "Default Account",
+                )
+                new_accounts.append(account)
+            record_accounts.append((record, account))
+
+        RitoAccount.objects.bulk_create(new_accounts)
+        if any(account.pk is None for account in new_accounts):
+            account_ids = dict(RitoAccount.objects.filter(
+                rito_id__in=[account.rito_id for account in new_accounts]
+            ).values_list('rito_id', 'pk'))
+            for account in new_accounts:
+                account.pk = account_ids[account.rito_id]
+        if attached:
+            RitoAccount.objects.bulk_update(attached, ['device'])
+        report.accounts += len(new_accounts) + len(attached)
+
+        social_accounts = [
+            SocialMediaAccount(
+                rito_account_id=account.pk,
+                platform=platform,
+                platform_id=f"{platform}_{uuid.uuid4().hex[:8]}",
+                username=generate_username(platform, account.rito_id),
+            )
+            for record, account in record_accounts
+            for platform in record['platforms']
+        ]
+        # ignore_conflicts: accounts attached to existing users may already have the platform
+        SocialMediaAccount.objects.bulk_create(social_accounts, ignore_conflicts=True)
+        report.social_accounts += len(social_accounts)
+
+    def _valid_records(self, records, report):
+        """Drop records that are malformed, repeated in the chunk, or already provisioned"""
+        valid = []
+        seen_iedas = set()
+        seen_macs = set()
+        for record in records:
+            error = None
+            if not record['ieda']:
+                error = "missing ieda"
+            elif len(record['ieda']) > 64:
+                error = f"ieda too long: {record['ieda'][:16]}..."
+            elif record['mac_address'] and len(record['mac_address']) > 17:
+                error = f"{record['ieda']}: mac_address too long"
+            elif set(record['platforms']) - PLATFORMS:
+                error = f"{record['ieda']}: unknown platform {', '.join(sorted(set(record['platforms']) - PLATFORMS))}"
+            if error:
+                report.errors.append(error)
+                continue
+            # Placeholder for devices without a MAC (an IEDA prefix would collide within a factory batch)
+            record['mac_address'] = record['mac_address'] or f"MAC_{uuid.uuid4().hex[:12].upper()}"
+            if record['ieda'] in seen_iedas or record['mac_address'] in seen_macs:
+                report.skipped += 1
+                continue
+            seen_iedas.add(record['ieda'])
+            seen_macs.add(record['mac_address'])
+            valid.append(record)
+
+        existing_iedas = set(Device.objects.filter(ieda__in=seen_iedas).values_list('ieda', flat=True))
+        taken_macs = set(Device.objects.filter(mac_address__in=seen_macs).values_list('mac_address', flat=True))
+
+        fresh = []
+        for record in valid:
+            if record['ieda'] in existing_iedas or record['mac_address'] in taken_macs:
+                report.skipped += 1
+            else:
+                fresh.append(record)
+        return fresh
+
+    def _resolve_users(self, records, report):
+        """
+        Map usernames to the RitoAccount a device should attach to. Missing users
+        are bulk-created (without the post_save account); users whose account
+        already holds a device are reported and their records skipped.
+        """
+        usernames = {record['username'] for record in records if record['username']}
+        if not usernames:
+            return {}
+
+        users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+        accounts = {
+            account.user.username: account
+            for account in RitoAccount.objects.filter(user__username__in=usernames).select_related('user')
+        }
+
+        missing = sorted(usernames - set(users))
+        if missing:
+            unusable = make_password(None)
+            User.objects.bulk_create([User(username=username, password=unusable) for username in missing])
+            users.update((user.username, user) for user in User.objects.filter(username__in=missing))
+            report.users += len(missing)
+
+        claimed = set()
+        for record in records:
+            username = record['username']
+            if not username:
+                continue
+            account = accounts.get(username)
+            if username in claimed or (account is not None and account.device_id is not None):
+                record['skip'] = True
+                report.errors.append(f"{record['ieda']}: user {username} already has a device")
+                continue
+            claimed.add(username)
+            record['user'] = users[username]
+        return accounts
+
+
+def provision_file(path, chunk_size=1000, resume=False, checkpoint=None, progress=None):
+    """Provision devices from a CSV/JSONL file; the checkpoint defaults to ``<path>.checkpoint``"""
+    provisioner = DeviceProvisioner(chunk_size, checkpoint or f"{path}.checkpoint")
+    with open(path, newline='', encoding='utf-8') as f:
+        report = provisioner.run(read_records(f, path), resume=resume, progress=progress)
+    return report
+
+
+def provision_upload(upload, chunk_size=1000):
+    """Provision devices from an uploaded file (no checkpoint; reruns skip what already exists)"""
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+    return DeviceProvisioner(chunk_size).run(read_records(stream, upload.name))
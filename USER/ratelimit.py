@@ -0,0 +1,233 @@
+# USER/ratelimit.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http.request import RawPostDataException
+
+from .utils import get_client_ip
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """``'6/min'`` -> ``(capacity, tokens per second)``: bursts of 6, refilled at 6 per minute"""
+    count, _, period = rate.partition('/')
+    if period not in PERIODS:
+        raise ValueError(f"Unknown rate period in {rate!r} (use one of {', '.join(PERIODS)})")
+    return int(count), int(count) / PERIODS[period]
+
+
+def refill(tokens, updated, now, capacity, per_second):
+    """
+    Token-bucket step: top the bucket up for the time since ``updated`` and try
+    to take one token. Returns ``(tokens left, seconds to wait)``; a wait of 0
+    means the request is allowed.
+    """
+    if tokens is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + max(now - updated, 0) * per_second)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / per_second
+
+
+class MemoryBucketStore:
+    """Buckets of this process only (bounded; evicting a bucket refills it)"""
+    blocking = False
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+
+    def take(self, key, capacity, per_second):
+        now = time.time()
+        with self.lock:
+            tokens, updated = self._buckets.pop(key, (None, now))
+            tokens, wait = refill(tokens, updated, now, capacity, per_second)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def size(self):
+        return len(self._buckets)
+
+    def clear(self):
+        with self.lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """
+    Buckets in a local SQLite file, shared by every worker process on the host.
+
+    Each take is one short ``BEGIN IMMEDIATE`` transaction on a WAL database
+    kept apart from the application database. Bucket state is disposable, so
+    the file is written without fsync and rows idle for ``max_idle`` seconds
+    (long enough to have refilled) are pruned every ``prune_every`` takes.
+    A take may wait up to ``timeout`` for the lock, so async callers run it
+    in a worker thread (``blocking``).
+    """
+    blocking = True
+
+    def __init__(self, path, timeout=0.05, max_idle=3600, prune_every=10000):
+        self.path = path
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        # One connection per thread, reopened in forked children
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            # Setup may wait for other workers creating the file; takes only wait ``timeout``
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) WITHOUT ROWID'
+            )
+            connection.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key, capacity, per_second):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, wait = refill(row[0] if row else None, row[1] if row else now, now, capacity, per_second)
+            connection.execute(
+                'INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (key, tokens, now),
+            )
+            self._takes += 1
+            if self._takes % self.prune_every == 0:
+                connection.execute('DELETE FROM buckets WHERE updated < ?', (now - self.max_idle,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+    def size(self):
+        return self._connection().execute('SELECT COUNT(*) FROM buckets').fetchone()[0]
+
+    def clear(self):
+        self._connection().execute('DELETE FROM buckets')
+
+
+def request_ieda(request):
+    """IEDA of a device request: the ``{ieda}`` path segment or the JSON body field"""
+    match = getattr(request, 'resolver_match', None)
+    if match is not None and match.kwargs.get('ieda'):
+        return match.kwargs['ieda']
+    if request.content_type != 'application/json':
+        return None
+    try:
+        payload = json.loads(request.body or b'{}')
+    except (ValueError, RawPostDataException):
+        return None
+    ieda = payload.get('ieda') if isinstance(payload, dict) else None
+    return str(ieda) if ieda else None
+
+
+class RateLimiter:
+    """
+    Token-bucket limits per route scope, keyed by device IEDA and client IP.
+
+    ``limits`` maps a scope to ``{'ieda': rate, 'ip': rate}`` (either key may
+    be left out); a request must get a token from every bucket that applies.
+    Counters of allowed/throttled requests per scope are kept for ``stats()``.
+    When the store fails (e.g. the shared file stays locked), requests are let
+    through and counted as errors rather than rejected.
+    """
+
+    def __init__(self, store, limits):
+        self.store = store
+        self.limits = {
+            scope: {dimension: parse_rate(rate) for dimension, rate in rates.items()}
+            for scope, rates in limits.items()
+        }
+        self.lock = threading.Lock()
+        self._counters = defaultdict(lambda: defaultdict(int))
+
+    def check(self, scope, request):
+        """Return 0 if the request may proceed, else the seconds until it would"""
+        rates = self.limits.get(scope)
+        if not rates:
+            return 0.0
+
+        identities = {
+            'ieda': request_ieda(request) if 'ieda' in rates else None,
+            'ip': get_client_ip(request) if 'ip' in rates else None,
+        }
+        wait = 0.0
+        throttled_by = None
+        for dimension, (capacity, per_second) in rates.items():
+            identity = identities.get(dimension)
+            if not identity:
+                continue
+            try:
+                bucket_wait = self.store.take(f"{scope}:{dimension}:{identity}", capacity, per_second)
+            except sqlite3.Error as e:
+                logger.warning("Rate limit store failed (%s); allowing %s request", e, scope)
+                self._count(scope, 'errors')
+                continue
+            if bucket_wait > wait:
+                wait, throttled_by = bucket_wait, dimension
+
+        if throttled_by:
+            self._count(scope, f'throttled_{throttled_by}')
+            logger.info("Throttled %s request (%s %s), retry in %.1fs",
+                        scope, throttled_by, identities[throttled_by], wait)
+        else:
+            self._count(scope, 'allowed')
+        return wait
+
+    async def acheck(self, scope, request):
+        """Async variant of ``check``; a blocking store is used from a worker thread, off the event loop"""
+        if self.store.blocking:
+            return await sync_to_async(self.check, thread_sensitive=False)(scope, request)
+        return self.check(scope, request)
+
+    def _count(self, scope, name):
+        with self.lock:
+            self._counters[scope][name] += 1
+
+    def stats(self):
+        with self.lock:
+            routes = {scope: dict(counters) for scope, counters in self._counters.items()}
+        return {
+            'backend': type(self.store).__name__,
+            'buckets': self.store.size(),
+            'routes': routes,
+        }
+
+
+def build_store():
+    if settings.RITO_RATE_LIMIT_BACKEND == 'sqlite':
+        return SQLiteBucketStore(settings.RITO_RATE_LIMIT_DATABASE)
+    if settings.RITO_RATE_LIMIT_BACKEND == 'memory':
+        return MemoryBucketStore()
+    raise ValueError(f"Unknown RITO_RATE_LIMIT_BACKEND {settings.RITO_RATE_LIMIT_BACKEND!r} (use memory or sqlite)")
+
+
+rate_limiter = RateLimiter(build_store(), settings.RITO_RATE_LIMITS)
@@ -0,0 +1,202 @@
+# USER/registration.py
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import RegistrationCode
+from .utils import generate_registration_code
+
+_MISS = object()
+
+
+class RegistrationCodeError(Exception):
+    """Raised when a device asks for more codes than the reissue limit allows"""
+
+
+class RegistrationCodeStore:
+    """
+    Expiring device pairing codes backed by the RegistrationCode table.
+
+    ``code`` is unique, so verifying a code is one indexed probe. Each device
+    owns a single row that is rewritten on reissue and also carries the
+    reissue-limit counter, so issuing never touches the Device row.
+
+    Current codes are mirrored in a bounded in-process map so status checks
+    usually need no query. Other processes may reissue, so mirror entries
+    live at most ``cache_ttl`` seconds.
+    """
+
+    def __init__(self, ttl, reissue_limit, reissue_window, cache_size, cache_ttl):
+        self.ttl = timedelta(seconds=ttl)
+        self.reissue_limit = reissue_limit
+        self.reissue_window = timedelta(seconds=reissue_window)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.lock = threading.Lock()
+        self._current = OrderedDict()  # device_id -> (code or None, expires_at, cached_until)
+
+    def issue(self, device_id):
+        """Issue a fresh code for a device, replacing its current one (raises RegistrationCodeError)"""
+        now = timezone.now()
+        with transaction.atomic():
+            row = RegistrationCode.objects.select_for_update().filter(device_id=device_id).first()
+            if row is None:
+                row = RegistrationCode(device_id=device_id, window_started_at=now, issue_count=0)
+            elif now - row.window_started_at >= self.reissue_window:
+                row.window_started_at = now
+                row.issue_count = 0
+
+            if row.issue_count >= self.reissue_limit:
+                raise RegistrationCodeError('Too many registration codes requested, try again later')
+
+            row.issue_count += 1
+            row.issued_at = now
+            row.expires_at = now + self.ttl
+            for attempt in range(5):
+                row.code = generate_registration_code()
+                try:
+                    with transaction.atomic():
+                        row.save()
+                    break
+                except IntegrityError:
+                    # Collided with another device's live (or not yet swept) code
+                    if attempt == 4:
+                        raise
+
+        self._remember(device_id, row.code, row.expires_at)
+        return row.code
+
+    async def aissue(self, device_id):
+        """Async variant of ``issue``"""
+        return await sync_to_async(self.issue)(device_id)
+
+    def verify(self, code, ieda=None):
+        """Return the id of the device a live code belongs to (optionally checking its ieda), or None"""
+        row = (RegistrationCode.objects
+               .filter(code=code, expires_at__gt=timezone.now())
+               .values_list('device_id', 'device__ieda')
+               .first())
+        if row is None or (ieda is not None and row[1] != ieda):
+            return None
+        return row[0]
+
+    def consume(self, code, ieda=None):
+        """
+        Verify a code and make it unusable in one step; returns the device id or None.
+        The row is expired rather than deleted so the reissue counter survives;
+        call inside the transaction that pairs the device so a failure keeps the code.
+        """
+        device_id = self.verify(code, ieda)
+        if device_id is None:
+            return None
+
+        now = timezone.now()
+        used = (RegistrationCode.objects
+                .filter(device_id=device_id, code=code, expires_at__gt=now)
+                .update(expires_at=now))
+        if used:
+            transaction.on_commit(lambda: self._remember(device_id, None, None))
+        return device_id if used else None
+
+    def current_code(self, device_id):
+        """Return the device's live code, or None"""
+        code = self._cached(device_id)
+        if code is not _MISS:
+            return code
+        row = (RegistrationCode.objects
+               .filter(device_id=device_id, expires_at__gt=timezone.now())
+               .values_list('code', 'expires_at')
+               .first())
+        return self._remember(device_id, *(row or (None, None)))
+
+    async def acurrent_code(self, device_id):
+        """Async variant of ``current_code``"""
+        code = self._cached(device_id)
+        if code is not _MISS:
+            return code
+        row = await (RegistrationCode.objects
+                     .filter(device_id=device_id, expires_at__gt=timezone.now())
+                     .values_list('code', 'expires_at')
+                     .afirst())
+        return self._remember(device_id, *(row or (None, None)))
+
+    def current_codes(self, device_ids):
+        """Return ``{device_id: code or None}``, loading all misses with one query"""
+        codes = {}
+        missing = []
+        for device_id in set(device_ids):
+            code = self._cached(device_id)
+            if code is _MISS:
+                missing.append(device_id)
+            else:
+                codes[device_id] = code
+
+        if missing:
+            live = dict.fromkeys(missing, (None, None))
+            rows = (RegistrationCode.objects
+                    .filter(device_id__in=missing, expires_at__gt=timezone.now())
+                    .values_list('device_id', 'code', 'expires_at'))
+            for device_id, code, expires_at in rows:
+                live[device_id] = (code, expires_at)
+            for device_id, (code, expires_at) in live.items():
+                codes[device_id] = self._remember(device_id, code, expires_at)
+        return codes
+
+    def sweep(self, batch_size=1000):
+        """
+        Delete expired codes whose reissue window has also passed, in batches.
+        Returns the number of rows deleted.
+        """
+        cutoff = timezone.now() - self.reissue_window
+        deleted = 0
+        while True:
+            batch = list(RegistrationCode.objects
+                         .filter(expires_at__lt=cutoff, window_started_at__lt=cutoff)
+                         .values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            deleted += RegistrationCode.objects.filter(pk__in=batch).delete()[0]
+
+        with self.lock:
+            now = time.monotonic()
+            for device_id in [key for key, entry in self._current.items() if entry[2] < now]:
+                del self._current[device_id]
+        return deleted
+
+    def clear(self):
+        with self.lock:
+            self._current.clear()
+
+    def _cached(self, device_id):
+        """Mirrored live code for a device (None if it has none), or _MISS"""
+        with self.lock:
+            entry = self._current.get(device_id)
+            if entry is None or entry[2] < time.monotonic():
+                return _MISS
+            code, expires_at, _ = entry
+        if code is None or expires_at <= timezone.now():
+            return None
+        return code
+
+    def _remember(self, device_id, code, expires_at):
+        with self.lock:
+            self._current.pop(device_id, None)
+            self._current[device_id] = (code, expires_at, time.monotonic() + self.cache_ttl)
+            while len(self._current) > self.cache_size:
+                self._current.popitem(last=False)
+        return code
+
+
+registration_codes = RegistrationCodeStore(
+    ttl=settings.RITO_REGISTRATION_CODE_TTL,
+    reissue_limit=settings.RITO_REGISTRATION_CODE_REISSUE_LIMIT,
+    reissue_window=settings.RITO_REGISTRATION_CODE_REISSUE_WINDOW,
+    cache_size=settings.RITO_IDENTITY_CACHE_SIZE,
+    cache_ttl=settings.RITO_REGISTRATION_CODE_CACHE_TTL,
+)
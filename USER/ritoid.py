@@ -0,0 +1,219 @@
+# USER/ritoid.py
+import atexit
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils import timezone
+
+# Snowflake layout: 41 bits of milliseconds since RITO_EPOCH, 10 bits worker, 12 bits sequence
+RITO_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+ID_WIDTH = 13  # base36 digits of a 63-bit value; fixed width keeps string order == time order
+PREFIX = 'RITO-'
+
+# Seconds a leased worker id stays reserved without renewal (renewed once half has passed)
+LEASE_TTL = 600
+
+
+def encode_base36(value, width=ID_WIDTH):
+    digits = []
+    while value:
+        value, remainder = divmod(value, 36)
+        digits.append(ALPHABET[remainder])
+    return ''.join(reversed(digits)).rjust(width, '0')
+
+
+def decode_rito_id(rito_id):
+    """Split an allocator-issued ID into ``(datetime, worker_id, sequence)``"""
+    value = int(rito_id[len(PREFIX):], 36)
+    sequence = value & MAX_SEQUENCE
+    worker_id = (value >> SEQUENCE_BITS) & MAX_WORKER_ID
+    millis = value >> (WORKER_BITS + SEQUENCE_BITS)
+    return datetime.fromtimestamp(RITO_EPOCH.timestamp() + millis / 1000, dt_timezone.utc), worker_id, sequence
+
+
+def derive_worker_id():
+    """Where this process starts looking for a free worker id (spreads processes over the range)"""
+    return (zlib.crc32(socket.gethostname().encode('utf-8')) + os.getpid()) & MAX_WORKER_ID
+
+
+class WorkerLeases:
+    """
+    Worker ids leased from the RitoWorkerLease table, one per process.
+
+    A process claims an id nobody holds (or whose lease expired) with an
+    insert or a conditional update, so two processes never hold the same id
+    at once, whichever hosts they run on. A lease taken over after expiry is
+    safe as long as host clocks agree to well within ``ttl / 2``: the old
+    holder stopped issuing IDs with it before it expired.
+    """
+
+    def __init__(self, ttl=LEASE_TTL):
+        self.ttl = ttl
+
+    def acquire(self, holder):
+        """Claim a free worker id for ``holder``; returns ``(worker_id, expires_at)``"""
+        from .models import RitoWorkerLease
+
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+        held = dict(RitoWorkerLease.objects.values_list('worker_id', 'expires_at'))
+        start = derive_worker_id()
+        for offset in range(MAX_WORKER_ID + 1):
+            worker_id = (start + offset) & MAX_WORKER_ID
+            if worker_id not in held:
+                try:
+                    with transaction.atomic():
+                        RitoWorkerLease.objects.create(worker_id=worker_id, holder=holder, expires_at=expires_at)
+                except IntegrityError:
+                    continue
+            elif held[worker_id] >= now or not RitoWorkerLease.objects.filter(
+                    worker_id=worker_id, expires_at__lt=now).update(holder=holder, expires_at=expires_at):
+                continue
+            return worker_id, expires_at
+        raise RuntimeError(f"All {MAX_WORKER_ID + 1} Rito ID worker ids are leased; set RITO_WORKER_ID or wait for leases to expire")
+
+    def renew(self, worker_id, holder):
+        """Extend a held lease; returns the new expiry, or None if the lease was lost"""
+        from .models import RitoWorkerLease
+
+        expires_at = timezone.now() + timedelta(seconds=self.ttl)
+        if RitoWorkerLease.objects.filter(worker_id=worker_id, holder=holder).update(expires_at=expires_at):
+            return expires_at
+        return None
+
+    def holds(self, worker_id, holder, expires_at):
+        from .models import RitoWorkerLease
+
+        return RitoWorkerLease.objects.filter(worker_id=worker_id, holder=holder, expires_at=expires_at).exists()
+
+    def release(self, worker_id, holder):
+        from .models import RitoWorkerLease
+
+        try:
+            RitoWorkerLease.objects.filter(worker_id=worker_id, holder=holder).delete()
+        except DatabaseError:
+            pass  # Expires on its own
+
+
+class RitoIdAllocator:
+    """
+    Hands out unique ``RITO-XXXXXXXXXXXXX`` IDs without a database round
+    trip per ID.
+
+    Each ID packs time, a per-process worker id and a per-millisecond sequence,
+    so processes with distinct worker ids can never collide. Unless
+    ``worker_id`` is fixed (RITO_WORKER_ID, which the deployment must keep
+    unique), the worker id is leased from the database on first use and the
+    lease renewed every ``LEASE_TTL / 2`` seconds; a lost lease is replaced
+    before the next ID is issued. A lease written inside a transaction is
+    re-checked on every allocation until that transaction commits, since a
+    rollback undoes it. If the clock steps back or a millisecond's
+    4096 sequence numbers run out, the allocator keeps counting on its own
+    logical clock instead of waiting.
+    """
+
+    def __init__(self, worker_id=None, leases=None):
+        if worker_id is not None and not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'worker_id must be between 0 and {MAX_WORKER_ID}')
+        self.fixed_worker_id = worker_id
+        self.leases = leases or WorkerLeases()
+        self.lock = threading.Lock()
+        self._epoch_ms = int(RITO_EPOCH.timestamp() * 1000)
+        self._pid = None
+        self._worker_id = None
+        self._holder = None
+        self._expires_at = None
+        self._pending = False  # lease written in a transaction that has not committed yet
+        self._last_ms = -1
+        self._sequence = 0
+        atexit.register(self.release)
+
+    @property
+    def worker_id(self):
+        with self.lock:
+            self._check_fork()
+            self._check_lease()
+            return self._worker_id
+
+    def next_id(self):
+        """Allocate one ID"""
+        return self.allocate(1)[0]
+
+    def allocate(self, count):
+        """Allocate ``count`` IDs in one go (for bulk creates)"""
+        ids = []
+        with self.lock:
+            self._check_fork()
+            self._check_lease()
+            now_ms = int(time.time() * 1000) - self._epoch_ms
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            for _ in range(count):
+                if self._sequence > MAX_SEQUENCE:
+                    self._last_ms += 1
+                    self._sequence = 0
+                value = (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self._worker_id << SEQUENCE_BITS) | self._sequence
+                self._sequence += 1
+                ids.append(PREFIX + encode_base36(value))
+        return ids
+
+    def release(self):
+        """Give up this process's leased worker id (at exit)"""
+        with self.lock:
+            if self._expires_at is not None and self._pid == os.getpid():
+                self.leases.release(self._worker_id, self._holder)
+            self._expires_at = None
+
+    def _check_fork(self):
+        # A forked child must not keep issuing its parent's worker id and sequence
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+        self._pid = pid
+        self._worker_id = self.fixed_worker_id
+        self._expires_at = None
+        self._pending = False
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _check_lease(self):
+        # Caller holds the lock
+        if self.fixed_worker_id is not None:
+            return
+        valid = self._expires_at is not None
+        if valid and self._pending and not self.leases.holds(self._worker_id, self._holder, self._expires_at):
+            valid = False  # The transaction that wrote it rolled back
+        if valid and timezone.now() < self._expires_at - timedelta(seconds=self.leases.ttl / 2):
+            return
+
+        expires_at = self.leases.renew(self._worker_id, self._holder) if self._expires_at is not None else None
+        if expires_at is None:
+            self._holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._worker_id, expires_at = self.leases.acquire(self._holder)
+        self._expires_at = expires_at
+        self._pending = transaction.get_connection().in_atomic_block
+        if self._pending:
+            transaction.on_commit(partial(self._confirm, expires_at))
+
+    def _confirm(self, expires_at):
+        with self.lock:
+            if self._expires_at == expires_at:
+                self._pending = False
+
+
+rito_ids = RitoIdAllocator(settings.RITO_WORKER_ID)
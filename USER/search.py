@@ -0,0 +1,191 @@
+# USER/search.py
+import re
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Answer, Question, QuestionSearchDocument
+
+# FTS5 table with one row per active question: title, content and its active
+# answers, ranked by bm25 with weights title 10, content 4, answers 1 (set as
+# the table's rank function by migration 0008). Row ids are QuestionSearchDocument ids.
+FTS_TABLE = 'USER_question_fts'
+DOCUMENT_TABLE = QuestionSearchDocument._meta.db_table
+
+MAX_QUERY_TERMS = 12
+SNIPPET_TOKENS = 24
+
+# Highlight markers; the text is escaped before they become <mark> tags
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query: every word must match, the last one
+    as a prefix (so results appear while typing). Operators and quotes in
+    the input are dropped instead of being parsed.
+    """
+    words = re.findall(r'\w+', query.lower())[:MAX_QUERY_TERMS]
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def render_marks(text):
+    return mark_safe(escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+class SearchResults:
+    """
+    Ranked matches of a query, fetched a page at a time (works with Paginator).
+
+    Each question in a slice gets ``title_highlight`` and ``snippet`` (safe
+    HTML with the matched words in ``<mark>``).
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.expression = match_expression(query)
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = 0
+            if self.expression:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [self.expression])
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start = key.start or 0
+            stop = self.count() if key.stop is None else key.stop
+            return self._fetch(start, max(stop - start, 0))
+        return self._fetch(key, 1)[0]
+
+    def _fetch(self, offset, limit):
+        if not self.expression or not limit:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT d.question_id, highlight({FTS_TABLE}, 0, %s, %s), '
+                f'snippet({FTS_TABLE}, -1, %s, %s, %s, %s) '
+                f'FROM {FTS_TABLE} JOIN {DOCUMENT_TABLE} d ON d.id = {FTS_TABLE}.rowid '
+                f'WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s OFFSET %s',
+                [MARK_START, MARK_END, MARK_START, MARK_END, '…', SNIPPET_TOKENS,
+                 self.expression, limit, offset],
+            )
+            rows = cursor.fetchall()
+
+        question_ids = [uuid.UUID(question_id) for question_id, _, _ in rows]
+        questions = (Question.objects
+                     .select_related('author')
+                     .prefetch_related('topics')
+                     .in_bulk(question_ids))
+        results = []
+        for question_id, (_, title, snippet) in zip(question_ids, rows):
+            question = questions.get(question_id)
+            if question is None:
+                continue
+            question.title_highlight = render_marks(title)
+            question.snippet = render_marks(snippet)
+            results.append(question)
+        return results
+
+
+def search_questions(query):
+    """Ranked search over active questions and answers (LIKE scan where FTS5 is unavailable)"""
+    if fts_available():
+        return SearchResults(query)
+    return (Question.objects
+            .filter(Q(title__icontains=query) | Q(content__icontains=query), is_active=True)
+            .select_related('author')
+            .prefetch_related('topics')
+            .order_by('-created_at'))
+
+
+def index_question(question_id, question=None):
+    """(Re)write a question's index row, or drop it if the question is gone or inactive"""
+    if not fts_available():
+        return
+    if question is None:
+        question = Question.objects.filter(pk=question_id).only('title', 'content', 'is_active').first()
+    if question is None or not question.is_active:
+        remove_question(question_id)
+        return
+
+    answers = (Answer.objects
+               .filter(question_id=question_id, is_active=True)
+               .order_by('created_at')
+               .values_list('content', flat=True))
+    document, _ = QuestionSearchDocument.objects.get_or_create(question_id=question_id)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [document.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content, answers) VALUES (%s, %s, %s, %s)',
+            [document.pk, question.title, question.content, '\n'.join(answers)],
+        )
+
+
+def remove_question(question_id):
+    # The document's post_delete receiver drops the index row
+    QuestionSearchDocument.objects.filter(question_id=question_id).delete()
+
+
+def rebuild_index():
+    """Re-index every active question from scratch; returns the number indexed"""
+    if not fts_available():
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'DELETE FROM {DOCUMENT_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {DOCUMENT_TABLE} (question_id) '
+            f'SELECT id FROM {Question._meta.db_table} WHERE is_active'
+        )
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content, answers) '
+            f'SELECT d.id, q.title, q.content, '
+            f'(SELECT group_concat(content, char(10)) FROM '
+            f'(SELECT a.content FROM {Answer._meta.db_table} a '
+            f'WHERE a.question_id = q.id AND a.is_active ORDER BY a.created_at)) '
+            f'FROM {DOCUMENT_TABLE} d JOIN {Question._meta.db_table} q ON q.id = d.question_id'
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {DOCUMENT_TABLE}')
+        return cursor.fetchone()[0]
+
+# ========== INDEX SYNC ==========
+
+@receiver(post_save, sender=Question)
+def index_saved_question(sender, instance, **kwargs):
+    index_question(instance.pk, instance)
+
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def index_answered_question(sender, instance, **kwargs):
+    # After commit: when the answer goes as part of deleting its question, the question is gone by then
+    question_id = instance.question_id
+    transaction.on_commit(lambda: index_question(question_id))
+
+@receiver(post_delete, sender=QuestionSearchDocument)
+def drop_index_row(sender, instance, **kwargs):
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [instance.pk])
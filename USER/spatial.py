@@ -0,0 +1,55 @@
+# USER/spatial.py
+from functools import reduce
+import operator
+
+from django.db.models import Q
+
+from .geohash import cover_bbox, haversine_km, prefix_range, radius_bbox
+
+SPATIAL_FIELDS = ('ieda', 'latitude', 'longitude', 'city', 'country', 'is_active')
+
+
+def geohash_filter(cells):
+    """OR of index range scans, one per geohash cell prefix"""
+    ranges = []
+    for cell in sorted(cells):
+        low, high = prefix_range(cell)
+        ranges.append(Q(geohash__gte=low, geohash__lt=high))
+    return reduce(operator.or_, ranges, Q(pk__in=[]))
+
+
+def bbox_filter(min_lat, min_lon, max_lat, max_lon):
+    """Exact coordinate filter (split in two when the box crosses the antimeridian)"""
+    latitude = Q(latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lon > max_lon:
+        return latitude & (Q(longitude__gte=min_lon) | Q(longitude__lte=max_lon))
+    return latitude & Q(longitude__gte=min_lon, longitude__lte=max_lon)
+
+
+def bbox_queryset(min_lat, min_lon, max_lat, max_lon):
+    """Devices inside a box: geohash cells prune via the index, coordinates refine exactly"""
+    from .models import Device
+    cells = cover_bbox(min_lat, min_lon, max_lat, max_lon)
+    return (Device.objects
+            .filter(geohash_filter(cells))
+            .filter(bbox_filter(min_lat, min_lon, max_lat, max_lon)))
+
+
+def devices_in_bbox(min_lat, min_lon, max_lat, max_lon, limit):
+    """Return up to ``limit`` device rows inside the box"""
+    queryset = bbox_queryset(min_lat, min_lon, max_lat, max_lon)
+    return list(queryset.order_by('geohash').values(*SPATIAL_FIELDS)[:limit])
+
+
+def devices_near(latitude, longitude, radius_km, limit):
+    """Return up to ``limit`` device rows within ``radius_km``, nearest first, with ``distance_km``"""
+    queryset = bbox_queryset(*radius_bbox(latitude, longitude, radius_km))
+    
+    nearby = []
+    for row in queryset.values(*SPATIAL_FIELDS).iterator(chunk_size=2000):
+        distance = haversine_km(latitude, longitude, row['latitude'], row['longitude'])
+        if distance <= radius_km:
+            row['distance_km'] = round(distance, 3)
+            nearby.append(row)
+    nearby.sort(key=operator.itemgetter('distance_km'))
+    return nearby[:limit]
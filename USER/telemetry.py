@@ -0,0 +1,261 @@
+# USER/telemetry.py
+"""
+Compact binary encoding for ESP8266 telemetry.
+
+Constrained devices can POST ``application/x-rito-telemetry`` bodies to the
+legacy ``device/status/``, ``device/location/`` and ``device/heartbeat/``
+views instead of JSON. The views decode them into the same dicts they get
+from JSON, run the same handler code, and answer in the format the device
+spoke. All integers are big-endian.
+
+Request frame::
+
+    u8 version | u8 message type | body
+
+    status     str8 ieda, str8 username
+    heartbeat  str8 ieda
+    location   str8 ieda, u8 flags, [i32 lat_e6, i32 lon_e6], [4|16 byte ip], str8 username
+               flags: 0x01 coordinates present, 0x02 IPv4 present, 0x04 IPv6 present
+
+Response frame::
+
+    u8 version | u8 message type | u8 result (0 ok, 1 error) | body
+
+    error      str8 message
+    status     u8 flags, u32 last_seen (unix seconds), str8 registration_code, str8 rito_id, str8 username
+               flags: 0x01 registered, 0x02 registered to user, 0x04 active
+    heartbeat  u8 flags, u32 last_seen
+               flags: 0x01 registered, 0x04 active
+    location   u8 flags, [i32 lat_e6, i32 lon_e6]
+               flags: 0x01 coordinates present
+
+``str8`` is a u8 length followed by that many UTF-8 bytes (length 0 = absent);
+longer response strings are truncated to 255 bytes.
+"""
+import ipaddress
+import json
+import struct
+from datetime import datetime
+
+from django.http import HttpResponse, JsonResponse
+
+TELEMETRY_CONTENT_TYPE = 'application/x-rito-telemetry'
+PROTOCOL_VERSION = 1
+
+MSG_STATUS = 1
+MSG_LOCATION = 2
+MSG_HEARTBEAT = 3
+
+RESULT_OK = 0
+RESULT_ERROR = 1
+
+FLAG_REGISTERED = 0x01
+FLAG_REGISTERED_TO_USER = 0x02
+FLAG_ACTIVE = 0x04
+
+FLAG_COORDINATES = 0x01
+FLAG_IPV4 = 0x02
+FLAG_IPV6 = 0x04
+
+REQUEST_HEADER = struct.Struct('>BB')
+RESPONSE_HEADER = struct.Struct('>BBB')
+COORDINATES = struct.Struct('>ii')
+STATUS_BODY = struct.Struct('>BI')
+U8 = struct.Struct('>B')
+
+
+class TelemetryError(ValueError):
+    """Raised for malformed binary telemetry frames"""
+
+
+class FrameReader:
+    """Cursor over a binary frame"""
+
+    def __init__(self, payload):
+        self.payload = memoryview(payload)
+        self.offset = 0
+
+    def unpack(self, fmt):
+        try:
+            values = fmt.unpack_from(self.payload, self.offset)
+        except struct.error:
+            raise TelemetryError('Truncated telemetry frame')
+        self.offset += fmt.size
+        return values
+
+    def read(self, size):
+        if self.offset + size > len(self.payload):
+            raise TelemetryError('Truncated telemetry frame')
+        chunk = bytes(self.payload[self.offset:self.offset + size])
+        self.offset += size
+        return chunk
+
+    def str8(self):
+        (length,) = self.unpack(U8)
+        if not length:
+            return None
+        try:
+            return self.read(length).decode('utf-8')
+        except UnicodeDecodeError:
+            raise TelemetryError('Invalid UTF-8 string in telemetry frame')
+
+
+def pack_str8(value, truncate=False):
+    """
+    Pack a str8. Requests must fit (TelemetryError otherwise); responses pass
+    ``truncate`` and are cut to 255 bytes on a UTF-8 character boundary.
+    """
+    raw = str(value).encode('utf-8') if value else b''
+    if len(raw) > 255:
+        if not truncate:
+            raise TelemetryError('String too long for telemetry frame')
+        raw = raw[:255].decode('utf-8', 'ignore').encode('utf-8')
+    return U8.pack(len(raw)) + raw
+
+
+def to_microdegrees(value):
+    return int(round(float(value) * 1_000_000))
+
+
+def to_unix_seconds(value):
+    if not value:
+        return 0
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+
+# ========== REQUESTS ==========
+
+def decode_request(payload):
+    """Decode a request frame into ``(message type, dict)`` using the JSON field names"""
+    reader = FrameReader(payload)
+    version, message_type = reader.unpack(REQUEST_HEADER)
+    if version != PROTOCOL_VERSION:
+        raise TelemetryError(f'Unsupported telemetry version {version}')
+    
+    data = {'ieda': reader.str8()}
+    if message_type == MSG_STATUS:
+        data['username'] = reader.str8()
+    elif message_type == MSG_LOCATION:
+        (flags,) = reader.unpack(U8)
+        if flags & FLAG_COORDINATES:
+            lat_e6, lon_e6 = reader.unpack(COORDINATES)
+            data['latitude'] = lat_e6 / 1_000_000
+            data['longitude'] = lon_e6 / 1_000_000
+        if flags & FLAG_IPV4:
+            data['ip_address'] = str(ipaddress.IPv4Address(reader.read(4)))
+        elif flags & FLAG_IPV6:
+            data['ip_address'] = str(ipaddress.IPv6Address(reader.read(16)))
+        data['username'] = reader.str8()
+    elif message_type != MSG_HEARTBEAT:
+        raise TelemetryError(f'Unknown telemetry message type {message_type}')
+    return message_type, data
+
+
+def encode_request(message_type, data):
+    """Encode a request frame (used by tooling and device simulators)"""
+    frame = REQUEST_HEADER.pack(PROTOCOL_VERSION, message_type) + pack_str8(data.get('ieda'))
+    if message_type == MSG_STATUS:
+        frame += pack_str8(data.get('username'))
+    elif message_type == MSG_LOCATION:
+        flags = 0
+        body = b''
+        if data.get('latitude') is not None and data.get('longitude') is not None:
+            flags |= FLAG_COORDINATES
+            body += COORDINATES.pack(to_microdegrees(data['latitude']), to_microdegrees(data['longitude']))
+        if data.get('ip_address'):
+            ip = ipaddress.ip_address(data['ip_address'])
+            flags |= FLAG_IPV4 if ip.version == 4 else FLAG_IPV6
+            body += ip.packed
+        frame += U8.pack(flags) + body + pack_str8(data.get('username'))
+    elif message_type != MSG_HEARTBEAT:
+        raise TelemetryError(f'Unknown telemetry message type {message_type}')
+    return frame
+
+
+# ========== RESPONSES ==========
+
+def encode_response(message_type, data):
+    """Encode a handler's response dict into a response frame"""
+    if data.get('status') != 'success':
+        return RESPONSE_HEADER.pack(PROTOCOL_VERSION, message_type, RESULT_ERROR) + pack_str8(data.get('message'), truncate=True)
+    
+    frame = RESPONSE_HEADER.pack(PROTOCOL_VERSION, message_type, RESULT_OK)
+    if message_type in (MSG_STATUS, MSG_HEARTBEAT):
+        flags = 0
+        if data.get('registered'):
+            flags |= FLAG_REGISTERED
+        if data.get('registered_to_user'):
+            flags |= FLAG_REGISTERED_TO_USER
+        if data.get('is_active'):
+            flags |= FLAG_ACTIVE
+        frame += STATUS_BODY.pack(flags, to_unix_seconds(data.get('last_seen')))
+        if message_type == MSG_STATUS:
+            frame += (
+                pack_str8(data.get('registration_code'), truncate=True)
+                + pack_str8(data.get('rito_id'), truncate=True)
+                + pack_str8(data.get('username'), truncate=True)
+            )
+    elif message_type == MSG_LOCATION:
+        location = data.get('location')
+        if location and location.get('latitude') is not None and location.get('longitude') is not None:
+            frame += U8.pack(FLAG_COORDINATES) + COORDINATES.pack(
+                to_microdegrees(location['latitude']), to_microdegrees(location['longitude'])
+            )
+        else:
+            frame += U8.pack(0)
+    return frame
+
+
+def decode_response(payload):
+    """Decode a response frame into ``(message type, dict)`` (used by tooling and tests)"""
+    reader = FrameReader(payload)
+    version, message_type, result = reader.unpack(RESPONSE_HEADER)
+    if result != RESULT_OK:
+        return message_type, {'status': 'error', 'message': reader.str8()}
+    
+    data = {'status': 'success'}
+    if message_type in (MSG_STATUS, MSG_HEARTBEAT):
+        flags, last_seen = reader.unpack(STATUS_BODY)
+        data['registered'] = bool(flags & FLAG_REGISTERED)
+        data['is_active'] = bool(flags & FLAG_ACTIVE)
+        data['last_seen'] = last_seen
+        if message_type == MSG_STATUS:
+            data['registered_to_user'] = bool(flags & FLAG_REGISTERED_TO_USER)
+            data['registration_code'] = reader.str8()
+            data['rito_id'] = reader.str8()
+            data['username'] = reader.str8()
+    elif message_type == MSG_LOCATION:
+        (flags,) = reader.unpack(U8)
+        if flags & FLAG_COORDINATES:
+            lat_e6, lon_e6 = reader.unpack(COORDINATES)
+            data['location'] = {'latitude': lat_e6 / 1_000_000, 'longitude': lon_e6 / 1_000_000}
+    return message_type, data
+
+
+# ========== VIEW HELPERS ==========
+
+def is_telemetry_request(request):
+    return request.content_type == TELEMETRY_CONTENT_TYPE
+
+
+def read_payload(request, message_type):
+    """Return the request body as a dict, whether it was sent as JSON or binary telemetry"""
+    if is_telemetry_request(request):
+        received_type, data = decode_request(request.body)
+        if received_type != message_type:
+            raise TelemetryError('Unexpected telemetry message type for this endpoint')
+        return data
+    return json.loads(request.body)
+
+
+def telemetry_response(request, message_type, data, status=200):
+    """Answer in the format the device used: binary telemetry or JSON"""
+    if is_telemetry_request(request) or TELEMETRY_CONTENT_TYPE in request.headers.get('Accept', ''):
+        return HttpResponse(
+            encode_response(message_type, data),
+            content_type=TELEMETRY_CONTENT_TYPE,
+            status=status,
+        )
+    return JsonResponse(data, status=status)
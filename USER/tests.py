@@ -1,3 +1,261 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from .models import Answer, CommunityMember, Question, RitoWorkerLease, Topic, TopicTrend
+from .ritoid import MAX_SEQUENCE, RitoIdAllocator, WorkerLeases, decode_rito_id
+from .trending import WINDOW_HALF_LIVES, topic_trends
+
+
+class VoteCounterTests(TestCase):
+    """Stored vote counts and score follow the upvotes/downvotes relations"""
+
+    def setUp(self):
+        self.author = CommunityMember.objects.create(name='Author', email='author@example.com')
+        self.voters = [
+            CommunityMember.objects.create(name=f'Voter {i}', email=f'voter{i}@example.com')
+            for i in range(3)
+        ]
+        self.question = Question.objects.create(title='How do votes work?', content='...', author=self.author)
+        self.answer = Answer.objects.create(question=self.question, author=self.voters[0], content='Like this')
+
+    def assertCounts(self, obj, upvotes, downvotes):
+        obj.refresh_from_db()
+        self.assertEqual((obj.upvote_count, obj.downvote_count, obj.score), (upvotes, downvotes, upvotes - downvotes))
+        self.assertEqual((obj.upvotes.count(), obj.downvotes.count()), (upvotes, downvotes))
+
+    def test_add_and_remove(self):
+        self.question.upvotes.add(self.voters[0], self.voters[1])
+        self.question.downvotes.add(self.voters[2])
+        self.assertCounts(self.question, 2, 1)
+
+        self.question.upvotes.remove(self.voters[1])
+        self.assertCounts(self.question, 1, 1)
+
+    def test_adding_an_existing_vote_counts_once(self):
+        self.question.upvotes.add(self.voters[0])
+        self.question.upvotes.add(self.voters[0], self.voters[1])
+        self.assertCounts(self.question, 2, 0)
+
+    def test_removing_a_missing_vote_changes_nothing(self):
+        self.question.upvotes.add(self.voters[0])
+        self.question.upvotes.remove(self.voters[1], self.voters[2])
+        self.assertCounts(self.question, 1, 0)
+
+        self.question.downvotes.remove(self.voters[0])
+        self.assertCounts(self.question, 1, 0)
+
+    def test_clear(self):
+        self.question.upvotes.add(*self.voters)
+        self.question.upvotes.clear()
+        self.assertCounts(self.question, 0, 0)
+
+    def test_member_side_changes(self):
+        other = Question.objects.create(title='Another question', content='...', author=self.author)
+        voter = self.voters[1]
+        voter.upvoted_questions.add(self.question, other)
+        voter.downvoted_answers.add(self.answer)
+        self.assertCounts(self.question, 1, 0)
+        self.assertCounts(other, 1, 0)
+        self.assertCounts(self.answer, 0, 1)
+
+        voter.upvoted_questions.remove(other)
+        voter.upvoted_questions.remove(other)
+        self.assertCounts(other, 0, 0)
+        self.assertCounts(self.question, 1, 0)
+
+        voter.upvoted_questions.clear()
+        voter.downvoted_answers.clear()
+        self.assertCounts(self.question, 0, 0)
+        self.assertCounts(self.answer, 0, 0)
+
+    def test_set_replaces_votes(self):
+        self.answer.upvotes.set([self.voters[0], self.voters[1]])
+        self.answer.upvotes.set([self.voters[1], self.voters[2]])
+        self.assertCounts(self.answer, 2, 0)
+        self.assertEqual(self.answer.vote_count, 2)
+
+
+class RitoIdAllocatorTests(TestCase):
+    """Snowflake IDs: unique, time ordered, and tagged with the worker id"""
+
+    def test_ids_are_unique_and_ordered(self):
+        allocator = RitoIdAllocator(worker_id=7)
+        ids = allocator.allocate(3 * (MAX_SEQUENCE + 1)) + [allocator.next_id() for _ in range(100)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual({decode_rito_id(rito_id)[1] for rito_id in ids}, {7})
+
+    def test_decode(self):
+        with mock.patch('USER.ritoid.time.time', return_value=1_800_000_000.123):
+            rito_id = RitoIdAllocator(worker_id=1023).next_id()
+        issued_at, worker_id, sequence = decode_rito_id(rito_id)
+        self.assertEqual((issued_at.timestamp(), worker_id, sequence), (1_800_000_000.123, 1023, 0))
+        self.assertTrue(rito_id.startswith('RITO-'))
+
+    def test_clock_stepping_back_keeps_order(self):
+        allocator = RitoIdAllocator(worker_id=3)
+        with mock.patch('USER.ritoid.time.time', return_value=1_800_000_000.0):
+            first = allocator.allocate(10)
+        with mock.patch('USER.ritoid.time.time', return_value=1_799_999_000.0):
+            second = allocator.allocate(10)
+        self.assertEqual(first + second, sorted(first + second))
+        self.assertEqual(len(set(first + second)), 20)
+
+    def test_worker_id_range(self):
+        with self.assertRaises(ValueError):
+            RitoIdAllocator(worker_id=1024)
+
+    def test_fixed_worker_id_takes_no_lease(self):
+        RitoIdAllocator(worker_id=5).next_id()
+        self.assertFalse(RitoWorkerLease.objects.exists())
+
+
+class WorkerLeaseTests(TestCase):
+    """Without RITO_WORKER_ID, every allocator leases a worker id of its own"""
+
+    def allocator(self):
+        allocator = RitoIdAllocator(leases=WorkerLeases(ttl=60))
+        self.addCleanup(allocator.release)
+        return allocator
+
+    def expire(self, allocator):
+        past = timezone.now() - timedelta(seconds=1)
+        RitoWorkerLease.objects.filter(worker_id=allocator.worker_id).update(expires_at=past)
+        allocator._expires_at = past
+
+    def test_allocators_lease_distinct_worker_ids(self):
+        allocators = [self.allocator() for _ in range(3)]
+        ids = [allocator.next_id() for allocator in allocators]
+        worker_ids = {decode_rito_id(rito_id)[1] for rito_id in ids}
+        self.assertEqual(len(worker_ids), 3)
+        self.assertEqual(set(RitoWorkerLease.objects.values_list('worker_id', flat=True)), worker_ids)
+
+    def test_expired_lease_is_taken_over(self):
+        first = self.allocator()
+        first.next_id()
+        worker_id = first.worker_id
+        self.expire(first)
+
+        second = self.allocator()
+        second.next_id()
+        self.assertEqual(second.worker_id, worker_id)
+        # The old holder cannot renew and moves to another id
+        first.next_id()
+        self.assertNotEqual(first.worker_id, worker_id)
+        self.assertEqual(RitoWorkerLease.objects.get(worker_id=worker_id).holder, second._holder)
+
+    def test_live_lease_is_not_taken_over(self):
+        first = self.allocator()
+        first.next_id()
+        second = self.allocator()
+        with mock.patch('USER.ritoid.derive_worker_id', return_value=first.worker_id):
+            second.next_id()
+        self.assertNotEqual(second.worker_id, first.worker_id)
+
+    def test_lease_is_renewed_after_half_its_ttl(self):
+        allocator = self.allocator()
+        allocator.next_id()
+        lease = RitoWorkerLease.objects.get(worker_id=allocator.worker_id)
+        allocator._expires_at = timezone.now() + timedelta(seconds=20)
+        allocator.next_id()
+        renewed = RitoWorkerLease.objects.get(worker_id=allocator.worker_id)
+        self.assertEqual(renewed.holder, lease.holder)
+        self.assertGreaterEqual(renewed.expires_at, lease.expires_at)
+        self.assertEqual(allocator._expires_at, renewed.expires_at)
+
+    def test_rolled_back_lease_is_taken_again(self):
+        allocator = self.allocator()
+        with self.assertRaises(ValueError), transaction.atomic():
+            allocator.next_id()
+            raise ValueError
+        self.assertFalse(RitoWorkerLease.objects.exists())
+
+        allocator.next_id()
+        self.assertTrue(RitoWorkerLease.objects.filter(worker_id=allocator.worker_id, holder=allocator._holder).exists())
+
+    def test_release(self):
+        allocator = self.allocator()
+        allocator.next_id()
+        allocator.release()
+        self.assertFalse(RitoWorkerLease.objects.exists())
+
+
+class TopicTrendTests(TestCase):
+    """Forward-decayed topic scores kept by the activity receivers and rebalance()"""
+
+    def setUp(self):
+        self.author = CommunityMember.objects.create(name='Author', email='author@example.com')
+        self.half_life = timedelta(seconds=topic_trends.half_life)
+
+    def ask(self, *topics, ago=timedelta(0)):
+        question = Question.objects.create(title=f'Question {Question.objects.count()}', content='...', author=self.author)
+        if ago:
+            Question.objects.filter(pk=question.pk).update(created_at=timezone.now() - ago)
+            question.refresh_from_db()
+        question.topics.add(*topics)
+        return question
+
+    def scores(self):
+        return {trend.topic.name: topic_trends.current(trend) for trend in TopicTrend.objects.select_related('topic')}
+
+    def test_recent_activity_outranks_older_activity(self):
+        fresh, old = Topic.objects.create(name='Fresh', slug='fresh'), Topic.objects.create(name='Old', slug='old')
+        self.ask(fresh)
+        for _ in range(3):
+            self.ask(old, ago=3 * self.half_life)
+
+        scores = self.scores()
+        self.assertAlmostEqual(scores['Fresh'], 1.0, places=3)
+        self.assertAlmostEqual(scores['Old'], 3 / 8, places=3)
+        self.assertEqual([topic.name for topic in topic_trends.top()], ['Fresh', 'Old'])
+
+    def test_answers_and_removed_topics(self):
+        topic = Topic.objects.create(name='Topic', slug='topic')
+        question = self.ask(topic)
+        Answer.objects.create(question=question, author=CommunityMember.objects.create(name='B', email='b@example.com'), content='...')
+        self.assertAlmostEqual(self.scores()['Topic'], 1.5, places=3)
+
+        question.topics.remove(topic)
+        self.assertAlmostEqual(self.scores()['Topic'], 0.5, places=3)
+
+    def test_rebalance_matches_increments(self):
+        topics = [Topic.objects.create(name=f'T{i}', slug=f't{i}') for i in range(3)]
+        self.ask(topics[0], topics[1], ago=self.half_life)
+        self.ask(topics[1], ago=2 * self.half_life)
+        self.ask(topics[2])
+        self.ask(topics[2], ago=(WINDOW_HALF_LIVES + 1) * self.half_life)
+        before = self.scores()
+        order = [topic.name for topic in topic_trends.top()]
+
+        self.assertEqual(topic_trends.rebalance(), 3)
+        after = self.scores()
+        self.assertEqual(after.keys(), before.keys())
+        for name, score in before.items():
+            self.assertAlmostEqual(after[name], score, places=3)
+        self.assertEqual([topic.name for topic in topic_trends.top()], order)
+        self.assertEqual(len(set(TopicTrend.objects.values_list('origin', flat=True))), 1)
+
+    def test_rebalance_drops_inactive_questions(self):
+        topic = Topic.objects.create(name='Topic', slug='topic')
+        question = self.ask(topic)
+        Question.objects.filter(pk=question.pk).update(is_active=False)
+        self.assertEqual(topic_trends.rebalance(), 0)
+        self.assertEqual(topic_trends.top(), [])
+
+    def test_record_adds_to_a_row_created_concurrently(self):
+        topic = Topic.objects.create(name='Topic', slug='topic')
+        now = timezone.now()
+        origin = topic_trends.origin()
+
+        def racing_origin():
+            TopicTrend.objects.create(topic=topic, score=1.0, origin=origin, last_activity=now)
+            return origin
 
-# Create your tests here.
+        with mock.patch.object(topic_trends, 'origin', racing_origin):
+            topic_trends.record([topic.pk], 1.0, now)
+        trend = TopicTrend.objects.get(topic=topic)
+        self.assertAlmostEqual(topic_trends.current(trend, now.timestamp()), 2.0, places=6)
@@ -0,0 +1,155 @@
+# USER/trending.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Power
+from django.db.models.signals import post_save, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Answer, Question, Topic, TopicTrend
+
+# Activity a question / an answer adds to each of its topics
+QUESTION_WEIGHT = 1.0
+ANSWER_WEIGHT = 0.5
+
+# A rebalance leaves out activity older than this many half-lives (less than 1e-6 of its weight)
+WINDOW_HALF_LIVES = 20
+
+# Topics whose decayed score fell below this are no longer shown as trending
+MIN_TRENDING_SCORE = 0.05
+
+
+class TopicTrends:
+    """
+    Time-decayed topic activity kept in TopicTrend rows.
+
+    Activity of weight ``w`` at time ``t`` is worth ``w * 2 ** ((t - now) / half_life)``
+    now. Scores are stored "forward decayed": every row holds its activity
+    expressed at a shared ``origin``, ``sum(w * 2 ** ((t - origin) / half_life))``,
+    so new activity is a single F() increment and decaying needs no writes.
+    Since all rows share the origin, ordering by the stored score ranks topics
+    by their current score, which lets the homepage read the top topics from
+    the score index.
+
+    ``rebalance()`` recomputes all scores from recent questions and answers
+    at a new origin. That keeps the stored values from growing without bound
+    and picks up what increments do not follow (deactivated or deleted
+    questions and answers). Run it once after installing, to score existing
+    activity, and then periodically (``rebalance_trending_topics``).
+    """
+
+    def __init__(self, half_life):
+        self.half_life = half_life
+
+    def boost(self, weight, timestamp, origin):
+        return weight * 2 ** ((timestamp - origin) / self.half_life)
+
+    def current(self, trend, now=None):
+        """A trend's score decayed to ``now`` (unix seconds)"""
+        now = time.time() if now is None else now
+        return trend.score * 2 ** ((trend.origin - now) / self.half_life)
+
+    def origin(self):
+        return TopicTrend.objects.values_list('origin', flat=True).first() or time.time()
+
+    def record(self, topic_ids, weight, when):
+        """Add activity of ``weight`` (negative to take it back) that happened at ``when`` to topics"""
+        topic_ids = set(topic_ids)
+        if not topic_ids:
+            return
+        timestamp = when.timestamp()
+        changes = {'score': F('score') + weight * Power(2.0, (timestamp - F('origin')) / self.half_life)}
+        if weight > 0:
+            changes['last_activity'] = Case(When(last_activity__gte=when, then=F('last_activity')), default=Value(when))
+
+        with transaction.atomic():
+            updated = TopicTrend.objects.filter(topic_id__in=topic_ids).update(**changes)
+            if updated == len(topic_ids) or weight <= 0:
+                return
+            existing = set(TopicTrend.objects.filter(topic_id__in=topic_ids).values_list('topic_id', flat=True))
+            origin = self.origin()
+            for topic_id in topic_ids - existing:
+                try:
+                    with transaction.atomic():
+                        TopicTrend.objects.create(topic_id=topic_id, score=self.boost(weight, timestamp, origin),
+                                                  origin=origin, last_activity=when)
+                except IntegrityError:
+                    # Created concurrently since the update; add to it instead
+                    TopicTrend.objects.filter(topic_id=topic_id).update(**changes)
+
+    def rebalance(self):
+        """Recompute every score at the current time as origin; returns the number of topics with a score"""
+        now = timezone.now()
+        origin = now.timestamp()
+        since = now - timedelta(seconds=self.half_life * WINDOW_HALF_LIVES)
+        scores = {}
+        latest = {}
+
+        def add(topic_id, weight, when):
+            scores[topic_id] = scores.get(topic_id, 0) + self.boost(weight, when.timestamp(), origin)
+            if topic_id not in latest or when > latest[topic_id]:
+                latest[topic_id] = when
+
+        # Deleting first takes the write lock, so increments made while the activity
+        # is read wait for the new rows instead of landing on rows about to be replaced
+        with transaction.atomic():
+            TopicTrend.objects.all().delete()
+            question_topics = (Question.topics.through.objects
+                               .filter(question__is_active=True, question__created_at__gte=since)
+                               .values_list('topic_id', 'question__created_at'))
+            for topic_id, created_at in question_topics.iterator():
+                add(topic_id, QUESTION_WEIGHT, created_at)
+            answer_topics = (Answer.objects
+                             .filter(is_active=True, question__is_active=True, created_at__gte=since)
+                             .values_list('question__topics', 'created_at'))
+            for topic_id, created_at in answer_topics.iterator():
+                if topic_id is not None:
+                    add(topic_id, ANSWER_WEIGHT, created_at)
+            TopicTrend.objects.bulk_create([
+                TopicTrend(topic_id=topic_id, score=score, origin=origin, last_activity=latest[topic_id])
+                for topic_id, score in scores.items()
+            ], batch_size=500)
+        return len(scores)
+
+    def top(self, limit=10):
+        """Active topics with the highest current score; each gets ``trend_score``"""
+        topics = (Topic.objects
+                  .filter(is_active=True, trend__score__gt=0)
+                  .select_related('trend')
+                  .order_by('-trend__score')[:limit])
+        now = time.time()
+        trending = []
+        for topic in topics:
+            topic.trend_score = self.current(topic.trend, now)
+            if topic.trend_score >= MIN_TRENDING_SCORE:
+                trending.append(topic)
+        return trending
+
+
+topic_trends = TopicTrends(half_life=settings.RITO_TRENDING_HALF_LIFE)
+
+# ========== ACTIVITY ==========
+
+@receiver(m2m_changed, sender=Question.topics.through)
+def record_question_topics(sender, instance, action, reverse, pk_set, **kwargs):
+    # Topics are set after the question is saved (form.save_m2m()); cleared ones wait for a rebalance
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    weight = QUESTION_WEIGHT if action == 'post_add' else -QUESTION_WEIGHT
+    if not reverse:
+        if instance.is_active:
+            topic_trends.record(pk_set, weight, instance.created_at)
+        return
+    questions = Question.objects.filter(pk__in=pk_set, is_active=True).values_list('created_at', flat=True)
+    for created_at in questions:
+        topic_trends.record([instance.pk], weight, created_at)
+
+@receiver(post_save, sender=Answer)
+def record_answer(sender, instance, created, **kwargs):
+    if created and instance.is_active:
+        topic_ids = Question.topics.through.objects.filter(question_id=instance.question_id).values_list('topic_id', flat=True)
+        topic_trends.record(topic_ids, ANSWER_WEIGHT, instance.created_at)
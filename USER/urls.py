@@ -49,6 +49,7 @@ legacy_api_patterns = [
     path('device/register/', views.device_register_api, name='device_register_api'),
     path('device/status/', views.device_status_api, name='device_status_api'),
     path('device/location/', views.device_location_api, name='device_location_api'),
+    path('device/heartbeat/', views.device_heartbeat_api, name='device_heartbeat_api'),
     path('device/refresh-code/', views.refresh_registration_code, name='refresh_registration_code'),
 ]
 
@@ -1,33 +1,67 @@
 # main/utils.py
+import logging
 import random
+import re
 import string
 import requests
 from django.utils import timezone
 
+from .geoip import GeoLocation, geoip_database
+from .geocache import geo_cache
+
+logger = logging.getLogger(__name__)
+
 def generate_registration_code():
     """Generate a 6-digit registration code"""
     return ''.join(random.choices(string.digits, k=6))
 
+# Device columns written by location updates (last_seen is handled by the write-behind buffer)
+LOCATION_FIELDS = ['ip_address', 'latitude', 'longitude', 'city', 'country', 'geohash']
+
 def update_device_location(device, ip_address=None):
-    """Update device location based on IP address"""
+    """Update device location based on IP address (blocking; prefer geo_queue.enqueue in requests)"""
     if not ip_address:
         return False
         
     device.ip_address = ip_address
-    try:
-        # Using ipapi.co for location data (free tier available)
-        response = requests.get(f'http://ipapi.co/{ip_address}/json/', timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            device.latitude = data.get('latitude')
-            device.longitude = data.get('longitude')
-            device.city = data.get('city', '')
-            device.country = data.get('country_name', '')
-            device.save()
-            return True
-    except Exception as e:
-        print(f"Location update failed: {e}")
-    return False
+    location = cached_location(ip_address)
+    if location is None:
+        return False
+    apply_location(device, location)
+    device.save(update_fields=LOCATION_FIELDS)
+    return True
+
+def cached_location(ip_address):
+    """Resolve an address through the shared geolocation cache"""
+    # Results are shared per IP and per /24 (/48) so devices behind one NAT resolve once
+    location = geo_cache.get(ip_address)
+    if location is None:
+        location = resolve_location(ip_address)
+        if location is not None:
+            geo_cache.set(ip_address, location)
+    return location
+
+def resolve_location(ip_address):
+    """Look an address up, bypassing the cache"""
+    # The offline database answers in microseconds; only fall back to the network without it
+    location = geoip_database.lookup(ip_address)
+    if location is None and not geoip_database.loaded:
+        try:
+            # Using ipapi.co for location data (free tier available)
+            response = requests.get(f'http://ipapi.co/{ip_address}/json/', timeout=5)
+            if response.status_code == 200:
+                location = GeoLocation.from_ipapi(response.json())
+        except Exception:
+            logger.exception("Location lookup for %s failed", ip_address)
+    return location
+
+def apply_location(device, location):
+    """Copy a GeoLocation onto a device (without saving)"""
+    device.latitude = location.latitude
+    device.longitude = location.longitude
+    device.city = location.city
+    device.country = location.country
+    device.refresh_geohash()
 
 def get_client_ip(request):
     """Get client IP address for location tracking"""
@@ -38,6 +72,18 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
+# Crawlers, link previewers, monitors and HTTP libraries (matched case-insensitively)
+BOT_USER_AGENT = re.compile(
+    r'bot|crawl|spider|slurp|archiver|scrapy|preview|facebookexternalhit|headless|lighthouse'
+    r'|curl|wget|python-requests|python-urllib|httpx|aiohttp|go-http-client|java/|okhttp|libwww|uptime|monitor',
+    re.IGNORECASE,
+)
+
+def is_bot(request):
+    """True for requests from crawlers and scripts (or with no User-Agent at all)"""
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    return not user_agent or BOT_USER_AGENT.search(user_agent) is not None
+
 def generate_username(platform: str, rito_id: str) -> str:
     """
     Generate professional usernames for social media platforms
@@ -51,6 +97,7 @@ def generate_username(platform: str, rito_id: str) -> str:
     }
     
     prefix = platform_prefixes.get(platform, platform[:2])
-    clean_rito_id = rito_id.replace('-', '')[:8]
+    # Keep the whole ID: allocator-issued IDs share their leading (time) digits
+    clean_rito_id = rito_id.replace('RITO-', '').replace('-', '')
     
     return f"{prefix}_{clean_rito_id}"
\ No newline at end of file
@@ -0,0 +1,66 @@
+# USER/versions.py
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import RitoAccount, SocialMediaAccount
+
+
+class StatusVersions:
+    """
+    Change stamps behind the ETag/Last-Modified of ``GET /device/{ieda}/status``.
+
+    The status payload is the device's RitoAccount and its social platforms,
+    so each account gets a stamp (unix seconds of its last change) in the
+    Django cache, moved forward by RitoAccount/SocialMediaAccount writes. The
+    ETag combines the stamp with the cached device identity, which follows
+    device and account changes, so checking a poll costs no queries.
+
+    Stamps expire after ``ttl`` seconds (a fresh one is taken on the next
+    poll), which bounds staleness when the cache is not shared between
+    worker processes.
+    """
+
+    def __init__(self, ttl, prefix='rito:status-version:'):
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def stamp(self, account_id):
+        key = f"{self.prefix}{account_id}"
+        stamp = cache.get(key)
+        if stamp is None:
+            stamp = int(time.time())
+            if not cache.add(key, stamp, self.ttl):
+                stamp = cache.get(key, stamp)
+        return stamp
+
+    def bump(self, account_id):
+        """Mark an account's status as changed (always a later second, for If-Modified-Since)"""
+        key = f"{self.prefix}{account_id}"
+        previous = cache.get(key) or 0
+        cache.set(key, max(int(time.time()), previous + 1), self.ttl)
+
+    def validators(self, identity):
+        """``(etag, last_modified)`` for a registered device's identity"""
+        stamp = self.stamp(identity.account_id)
+        version = f"{identity.ieda}:{identity.account_id}:{identity.rito_id}:{stamp}"
+        return f'"{hashlib.md5(version.encode("utf-8")).hexdigest()}"', stamp
+
+
+device_status_versions = StatusVersions(ttl=settings.RITO_STATUS_VERSION_TTL)
+
+# ========== VERSION BUMPS ==========
+
+@receiver(post_save, sender=RitoAccount)
+@receiver(post_delete, sender=RitoAccount)
+def bump_account_status(sender, instance, **kwargs):
+    device_status_versions.bump(instance.pk)
+
+@receiver(post_save, sender=SocialMediaAccount)
+@receiver(post_delete, sender=SocialMediaAccount)
+def bump_social_account_status(sender, instance, **kwargs):
+    device_status_versions.bump(instance.rito_account_id)
@@ -9,11 +9,11 @@ from django.http import JsonResponse, Http404
 from django.core.paginator import Paginator
 from django.core.mail import send_mail
 from django.conf import settings
-from django.db.models import Q, Count
+from django.db import transaction
+from django.db.models import Count
 from django.urls import reverse
 from django.contrib.auth.decorators import user_passes_test
 from django.core.exceptions import PermissionDenied
-from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
 # Model imports
@@ -28,7 +28,15 @@ from .forms import (
     CustomAuthenticationForm, QuestionForm, AnswerForm, 
     CommentForm, TopicForm, SpaceForm, CommunityMemberProfileForm
 )
-from .utils import generate_registration_code, update_device_location, get_client_ip, generate_username
+from .utils import get_client_ip, generate_username, is_bot, LOCATION_FIELDS
+from .buffers import last_seen_buffer, question_views
+from .identity import device_identity_cache
+from .geoqueue import geo_queue
+from .history import location_history
+from .registration import registration_codes, RegistrationCodeError
+from .search import search_questions
+from .trending import topic_trends
+from .telemetry import read_payload, telemetry_response, MSG_STATUS, MSG_LOCATION, MSG_HEARTBEAT
 
 # ========== PROFESSIONAL SUPERUSER DECORATOR ==========
 
@@ -67,9 +75,9 @@ def community_join(request):
     # Get recent questions
     recent_questions = Question.objects.filter(is_active=True).order_by('-created_at')[:5]
     
-    # Prefetch related data to optimize queries
-    popular_questions = popular_questions.prefetch_related('topics', 'answers', 'upvotes', 'downvotes')
-    recent_questions = recent_questions.prefetch_related('topics', 'answers', 'upvotes', 'downvotes')
+    # Prefetch related data to optimize queries (vote totals are stored on the rows)
+    popular_questions = popular_questions.prefetch_related('topics', 'answers')
+    recent_questions = recent_questions.prefetch_related('topics', 'answers')
     
     if request.method == 'POST':
         form = CommunityForm(request.POST)
@@ -283,14 +291,14 @@ def dashboard(request):
     try:
         rito_account = RitoAccount.objects.filter(user=request.user).first()
         social_accounts = SocialMediaAccount.objects.filter(rito_account=rito_account) if rito_account else []
-        device = rito_account.device if rito_account else None
+        device = last_seen_buffer.apply(rito_account.device) if rito_account else None
         
         # Prepare location data for template
         location_data = None
         if device:
-            # Update device location on each dashboard load
+            # Refresh device location in the background on each dashboard load
             ip_address = get_client_ip(request)
-            update_device_location(device, ip_address)
+            geo_queue.enqueue(device.pk, ip_address)
             
             if device.latitude and device.longitude:
                 location_data = {
@@ -308,6 +316,7 @@ def dashboard(request):
             'social_accounts': social_accounts,
             'device': device,
             'location_data': location_data,
+            'registration_code': registration_codes.current_code(device.pk) if device else None,
             'user': request.user
         }
         return render(request, 'dashboard.html', context)
@@ -330,8 +339,8 @@ def register_device_view(request):
             code = form.cleaned_data['code']
             
             try:
-                # Check if device already exists
-                if Device.objects.filter(ieda=ieda).exists():
+                # Check if device is already paired
+                if RitoAccount.objects.filter(device__ieda=ieda).exists():
                     messages.error(request, 'Device already registered')
                     return render(request, 'register.html', {'form': form})
                 
@@ -340,29 +349,30 @@ def register_device_view(request):
                     messages.error(request, 'Invalid registration code format')
                     return render(request, 'register.html', {'form': form})
                 
-                # Create device with the provided code
-                device = Device.objects.create(
-                    ieda=ieda,
-                    mac_address=f"MAC_{ieda[:8]}",
-                    registration_code=code
-                )
+                with transaction.atomic():
+                    # The code must be live and issued to this device (one indexed lookup); it is used up here
+                    device_id = registration_codes.consume(code, ieda)
+                    if device_id is None:
+                        messages.error(request, 'Invalid or expired registration code')
+                        return render(request, 'register.html', {'form': form})
+                    Device.objects.filter(pk=device_id).update(is_active=True)
+                    
+                    # Create or update Rito account linked to user
+                    rito_account, created = RitoAccount.objects.get_or_create(
+                        user=request.user,
+                        defaults={
+                            'device_id': device_id,
+                            'name': f"{request.user.username}'s Account"
+                        }
+                    )
+                    
+                    if not created:
+                        rito_account.device_id = device_id
+                        rito_account.save()
                 
-                # Update device location
+                # Update device location (resolved in the background)
                 ip_address = get_client_ip(request)
-                update_device_location(device, ip_address)
-                
-                # Create or update Rito account linked to user
-                rito_account, created = RitoAccount.objects.get_or_create(
-                    user=request.user,
-                    defaults={
-                        'device': device,
-                        'name': f"{request.user.username}'s Account"
-                    }
-                )
-                
-                if not created:
-                    rito_account.device = device
-                    rito_account.save()
+                geo_queue.enqueue(device_id, ip_address)
                 
                 messages.success(request, f'Device registered successfully! Your Rito ID: {rito_account.rito_id}')
                 return redirect('main:dashboard')
@@ -490,24 +500,24 @@ def device_register_api(request):
                     'message': 'IEDA is required'
                 }, status=400)
             
-            # Generate a new 6-digit registration code
-            registration_code = generate_registration_code()
-            
             # Check if device already exists
             device, created = Device.objects.get_or_create(
                 ieda=ieda,
                 defaults={
                     'mac_address': mac_address or f"MAC_{ieda[:8]}",
-                    'registration_code': registration_code,
                     'is_active': False
                 }
             )
             
-            if not created:
-                # Update existing device with new code
-                device.registration_code = registration_code
+            if not created and device.is_active:
                 device.is_active = False
-                device.save()
+                device.save(update_fields=['is_active'])
+            
+            # Generate a new 6-digit registration code (kept in the code store, not on the device row)
+            try:
+                registration_code = registration_codes.issue(device.pk)
+            except RegistrationCodeError as e:
+                return JsonResponse({'status': 'error', 'message': str(e)}, status=429)
             
             response_data = {
                 'status': 'success',
@@ -533,81 +543,79 @@ def device_register_api(request):
 
 @csrf_exempt
 def device_status_api(request):
-    """API endpoint for device status check with user verification"""
+    """API endpoint for device status check with user verification (JSON or binary telemetry)"""
     if request.method == 'POST':
         try:
-            data = json.loads(request.body)
+            data = read_payload(request, MSG_STATUS)
             ieda = data.get('ieda')
             username = data.get('username')
             
             if not ieda:
-                return JsonResponse({
+                return telemetry_response(request, MSG_STATUS, {
                     'status': 'error',
                     'message': 'IEDA is required'
                 }, status=400)
             
             try:
-                device = Device.objects.get(ieda=ieda)
-                rito_account = RitoAccount.objects.filter(device=device).first()
+                # Device, account and owner come from the identity cache (no queries on a hit)
+                identity = device_identity_cache.resolve(ieda)
                 
                 # Check if device is registered to the specific user
                 registered_to_user = False
                 user_rito_id = None
                 
-                if rito_account and username:
+                if identity.registered and username:
                     # Verify if the device is registered to the requested user
-                    registered_to_user = (rito_account.user.username == username)
-                    user_rito_id = rito_account.rito_id
+                    registered_to_user = (identity.username == username)
+                    user_rito_id = identity.rito_id
                 
-                # Update last seen timestamp
-                device.last_seen = timezone.now()
-                device.save()
+                # Update last seen timestamp (persisted by the write-behind buffer)
+                last_seen = last_seen_buffer.record(identity.device_id)
                 
                 response_data = {
                     'status': 'success',
-                    'registered': rito_account is not None,
+                    'registered': identity.registered,
                     'registered_to_user': registered_to_user,
                     'rito_id': user_rito_id,
-                    'registration_code': device.registration_code,
-                    'is_active': device.is_active,
-                    'last_seen': device.last_seen.isoformat()
+                    'registration_code': registration_codes.current_code(identity.device_id),
+                    'is_active': identity.is_active,
+                    'last_seen': last_seen.isoformat()
                 }
                 
                 # Add username info if available
-                if rito_account and rito_account.user:
-                    response_data['username'] = rito_account.user.username
+                if identity.username:
+                    response_data['username'] = identity.username
                 
                 # Add custom message based on registration status
                 if registered_to_user:
                     response_data['message'] = f'Device registered to user {username}'
-                elif rito_account and not registered_to_user:
-                    actual_user = rito_account.user.username
-                    response_data['message'] = f'Device registered to different user: {actual_user}'
+                elif identity.registered and identity.username:
+                    response_data['message'] = f'Device registered to different user: {identity.username}'
                 else:
                     response_data['message'] = 'Device not registered'
                 
-                return JsonResponse(response_data)
+                return telemetry_response(request, MSG_STATUS, response_data)
                 
             except Device.DoesNotExist:
-                return JsonResponse({
+                return telemetry_response(request, MSG_STATUS, {
                     'status': 'error',
                     'message': 'Device not found'
                 }, status=404)
                 
         except Exception as e:
-            return JsonResponse({
+            return telemetry_response(request, MSG_STATUS, {
                 'status': 'error',
                 'message': str(e)
             }, status=400)
     
-    return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
+    return telemetry_response(request, MSG_STATUS, {'status': 'error', 'message': 'Method not allowed'}, status=405)
 
 @csrf_exempt
 def device_location_api(request):
-    """API endpoint to update device location with user info"""
+    """API endpoint to update device location with user info (JSON or binary telemetry)"""
     if request.method == 'POST':
         try:
-            data = json.loads(request.body)
+            data = read_payload(request, MSG_LOCATION)
             ieda = data.get('ieda')
             latitude = data.get('latitude')
             longitude = data.get('longitude')
@@ -615,7 +623,7 @@ def device_location_api(request):
             username = data.get('username')
             
             if not ieda:
-                return JsonResponse({
+                return telemetry_response(request, MSG_LOCATION, {
                     'status': 'error',
                     'message': 'IEDA is required'
                 }, status=400)
@@ -627,13 +635,15 @@ def device_location_api(request):
                 if latitude and longitude:
                     device.latitude = float(latitude)
                     device.longitude = float(longitude)
+                    location_history.record(device.pk, device.latitude, device.longitude)
                 
                 if ip_address:
+                    # Resolved in the background and written back in batches
                     device.ip_address = ip_address
-                    update_device_location(device, ip_address)
+                    geo_queue.enqueue(device.pk, ip_address)
                 
-                device.last_seen = timezone.now()
-                device.save()
+                device.save(update_fields=LOCATION_FIELDS)
+                last_seen_buffer.record(device.pk)
                 
                 response_data = {
                     'status': 'success',
@@ -653,21 +663,60 @@ def device_location_api(request):
                         'country': device.country
                     }
                 
-                return JsonResponse(response_data)
+                return telemetry_response(request, MSG_LOCATION, response_data)
                 
             except Device.DoesNotExist:
-                return JsonResponse({
+                return telemetry_response(request, MSG_LOCATION, {
                     'status': 'error',
                     'message': 'Device not found'
                 }, status=404)
                 
         except Exception as e:
-            return JsonResponse({
+            return telemetry_response(request, MSG_LOCATION, {
                 'status': 'error',
                 'message': str(e)
             }, status=400)
     
-    return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
+    return telemetry_response(request, MSG_LOCATION, {'status': 'error', 'message': 'Method not allowed'}, status=405)
+
+@csrf_exempt
+def device_heartbeat_api(request):
+    """Minimal keep-alive for constrained devices (JSON or binary telemetry)"""
+    if request.method == 'POST':
+        try:
+            data = read_payload(request, MSG_HEARTBEAT)
+            ieda = data.get('ieda')
+            
+            if not ieda:
+                return telemetry_response(request, MSG_HEARTBEAT, {
+                    'status': 'error',
+                    'message': 'IEDA is required'
+                }, status=400)
+            
+            try:
+                identity = device_identity_cache.resolve(ieda)
+                last_seen = last_seen_buffer.record(identity.device_id)
+                
+                return telemetry_response(request, MSG_HEARTBEAT, {
+                    'status': 'success',
+                    'registered': identity.registered,
+                    'is_active': identity.is_active,
+                    'last_seen': last_seen.isoformat()
+                })
+                
+            except Device.DoesNotExist:
+                return telemetry_response(request, MSG_HEARTBEAT, {
+                    'status': 'error',
+                    'message': 'Device not found'
+                }, status=404)
+                
+        except Exception as e:
+            return telemetry_response(request, MSG_HEARTBEAT, {
+                'status': 'error',
+                'message': str(e)
+            }, status=400)
+    
+    return telemetry_response(request, MSG_HEARTBEAT, {'status': 'error', 'message': 'Method not allowed'}, status=405)
 
 @login_required
 @csrf_exempt
@@ -685,10 +734,8 @@ def refresh_registration_code(request):
                 }, status=400)
             
             try:
-                device = Device.objects.get(ieda=ieda)
-                new_code = generate_registration_code()
-                device.registration_code = new_code
-                device.save()
+                device = Device.objects.only('pk').get(ieda=ieda)
+                new_code = registration_codes.issue(device.pk)
                 
                 return JsonResponse({
                     'status': 'success',
@@ -701,6 +748,11 @@ def refresh_registration_code(request):
                     'status': 'error',
                     'message': 'Device not found'
                 }, status=404)
+            except RegistrationCodeError as e:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': str(e)
+                }, status=429)
                 
         except Exception as e:
             return JsonResponse({
@@ -729,10 +781,8 @@ def community_home(request):
         page = request.GET.get('page')
         questions = paginator.get_page(page)
         
-        # Get trending topics
-        trending_topics = Topic.objects.filter(is_active=True).annotate(
-            question_count=Count('questions')
-        ).order_by('-question_count')[:10]
+        # Get trending topics (time-decayed recent activity, read from the score index)
+        trending_topics = topic_trends.top(10)
         
         # Get member count
         member_count = CommunityMember.objects.filter(is_active=True).count()
@@ -788,9 +838,10 @@ def question_detail(request, slug):
         member = None
         is_bookmarked = False
     
-    # Increment view count
-    question.views += 1
-    question.save()
+    # Count the view (buffered and flushed in batches; crawlers are not counted)
+    if not is_bot(request):
+        question_views.record(question.pk)
+    question_views.apply(question)
     
     # Answer form
     answer_form = AnswerForm()
@@ -842,23 +893,25 @@ def vote_question(request, slug, vote_type):
     if request.method == 'POST':
         question = get_object_or_404(Question, slug=slug, is_active=True)
         
-        if vote_type == 'upvote':
-            if question.downvotes.filter(id=member.id).exists():
+        # The m2m_changed handlers move the stored counters in the same transaction
+        with transaction.atomic():
+            if vote_type == 'upvote':
                 question.downvotes.remove(member)
-            question.upvotes.add(member)
-        elif vote_type == 'downvote':
-            if question.upvotes.filter(id=member.id).exists():
+                question.upvotes.add(member)
+            elif vote_type == 'downvote':
+                question.upvotes.remove(member)
+                question.downvotes.add(member)
+            elif vote_type == 'remove':
                 question.upvotes.remove(member)
-            question.downvotes.add(member)
-        elif vote_type == 'remove':
-            question.upvotes.remove(member)
-            question.downvotes.remove(member)
+                question.downvotes.remove(member)
         
+        question.refresh_from_db(fields=['upvote_count', 'downvote_count', 'score'])
         return JsonResponse({
             'success': True,
-            'vote_count': question.vote_count,
-            'upvotes': question.upvotes.count(),
-            'downvotes': question.downvotes.count()
+            'vote_count': question.score,
+            'score': question.score,
+            'upvotes': question.upvote_count,
+            'downvotes': question.downvote_count
         })
     
     return JsonResponse({'success': False})
@@ -1015,14 +1068,13 @@ def follow_topic(request, slug):
 @login_required
 def search(request):
     """Search questions and answers"""
-    query = request.GET.get('q', '')
-    results = []
+    query = request.GET.get('q', '').strip()
+    results = None
     
     if query:
-        results = Question.objects.filter(
-            Q(title__icontains=query) | Q(content__icontains=query),
-            is_active=True
-        ).select_related('author').prefetch_related('topics')
+        # BM25-ranked full-text matches, fetched one page at a time
+        paginator = Paginator(search_questions(query), 10)
+        results = paginator.get_page(request.GET.get('page'))
     
     context = {
         'query': query,